@@ -0,0 +1,114 @@
+"""
+Import time benchmark for qtile_progress_widgets.
+
+Imports the package, and optionally a set of widgets, in fresh interpreters with
+`python -X importtime`, reporting the median cumulative import time and the heaviest
+modules. Fails when the median exceeds --max-ms, or when a forbidden module gets
+imported by the bare package import, so regressions in lazy loading get caught.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --widget Battery --widget CPU --runs 10 --max-ms 50
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+
+PACKAGE = "qtile_progress_widgets"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# heavy optional dependencies that must only be imported along with widgets requiring them
+FORBIDDEN = ("PIL", "requests", "validators", "gi", "dbus_next", "psutil", "numpy")
+
+_line = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(statement):
+    """
+    Only modules imported by the package, or its widgets, are kept. Interpreter startup
+    imports are left out.
+    :return: Dict of imported module name to (self, cumulative, depth), times in microseconds.
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+
+    if result.returncode != 0:
+        sys.exit("'%s' failed:\n%s" % (statement, result.stderr))
+
+    modules = {}
+    subtree = {}
+    for line in result.stderr.splitlines():
+        match = _line.match(line)
+        if not match:
+            continue
+        name, depth = match.group(4), len(match.group(3)) - 1
+        # nested imports are reported before the module importing them
+        subtree[name] = (int(match.group(1)), int(match.group(2)), depth)
+        if depth == 0:
+            if name.split(".")[0] == PACKAGE:
+                modules.update(subtree)
+            subtree = {}
+    return modules
+
+
+def report(name, statement, runs, top):
+    totals = []
+    modules = {}
+
+    for _ in range(runs):
+        modules = measure(statement)
+        # widgets are imported after the package itself, so sum every top level package import
+        totals.append(sum(
+            cumulative for module, (_, cumulative, depth) in modules.items()
+            if depth == 0 and module.split(".")[0] == PACKAGE
+        ))
+
+    median = statistics.median(totals) / 1000
+    print("%-20s median %8.2f ms  (min %.2f, max %.2f, %d runs)" % (
+        name, median, min(totals) / 1000, max(totals) / 1000, runs
+    ))
+
+    heaviest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for module, (self_us, _, _) in heaviest:
+        print("    %8.2f ms  %s" % (self_us / 1000, module))
+
+    return median, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--widget", action="append", default=[], help="Widget to import, can be repeated.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreter runs per measure.")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest modules to list.")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail when a median exceeds it.")
+    args = parser.parse_args()
+
+    failures = []
+
+    median, modules = report(PACKAGE, "import %s" % PACKAGE, args.runs, args.top)
+    leaked = sorted({m.split(".")[0] for m in modules} & set(FORBIDDEN))
+    if leaked:
+        failures.append("bare import loaded: %s" % ", ".join(leaked))
+    if args.max_ms is not None and median > args.max_ms:
+        failures.append("bare import took %.2f ms" % median)
+
+    for widget in args.widget:
+        median, _ = report(widget, "from %s import %s" % (PACKAGE, widget), args.runs, args.top)
+        if args.max_ms is not None and median > args.max_ms:
+            failures.append("%s import took %.2f ms" % (widget, median))
+
+    if failures:
+        sys.exit("FAILED: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,32 @@
-from .audio import Microphone, Volume
-from .battery import Battery
-from .brightness import Brightness
-from .cpu import CPU
-from .memory import Memory
-from .notifications import Notifications
-from .progress_widget import ProgressCoreWidget
-from .spotify_player import SpotifyPlayer
-from .vlc_player import VLCPlayer
+import importlib
+
+
+# widgets are only imported when first accessed, along with their dependencies
+_widgets = {
+    "Battery": ".battery",
+    "Brightness": ".brightness",
+    "CPU": ".cpu",
+    "CPUCores": ".cpu_cores",
+    "Memory": ".memory",
+    "Microphone": ".audio",
+    "MprisPlayer": ".mpris_player",
+    "Notifications": ".notifications",
+    "ProgressCoreWidget": ".progress_widget",
+    "SpotifyPlayer": ".spotify_player",
+    "VLCPlayer": ".vlc_player",
+    "Volume": ".audio",
+}
+
+__all__ = list(_widgets)
+
+
+def __getattr__(name):
+    module = _widgets.get(name)
+    if module is None:
+        raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+    value = globals()[name] = getattr(importlib.import_module(module, __name__), name)
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,3 +1,4 @@
+import asyncio
 import re
 import subprocess as sp
 
@@ -8,6 +9,7 @@ from .utils import create_logger
 
 
 _logger = create_logger("AMIXER")
+_log_pactl = create_logger("PACTL")
 _log_vol = create_logger("VOLUME_ICON")
 _log_mic = create_logger("MIC_ICON")
 
@@ -27,6 +29,20 @@ class AudioControls:
     def is_muted(self):
         raise NotImplemented
 
+    def get_state(self):
+        """
+        :return: Tuple with current volume and mute state.
+        """
+        return float(self.get()), self.is_muted()
+
+    def watch(self, on_change):
+        """
+        Controls able to get notified of changes can start watching them here, calling
+        on_change with the new state (see get_state), from the event loop.
+        :return: Function stopping the watch, or None when changes are not watched.
+        """
+        return None
+
     def inc(self):
         raise NotImplemented
 
@@ -54,14 +70,93 @@ class _AmixerControls(AudioControls):
             _logger.error(str(e))
         return fallback
 
-    def get(self):
-        info = self._safe_call(lambda: sp.check_output(self._get).decode().strip(), "")
+    def _get_info(self):
+        return self._safe_call(lambda: sp.check_output(self._get).decode().strip(), "")
+
+    @staticmethod
+    def _parse_volume(info):
         return re.search("(\\d?\\d?\\d)%", info).group(1)
 
-    def is_muted(self):
-        info = self._safe_call(lambda: sp.check_output(self._get).decode().strip(), "")
+    @staticmethod
+    def _parse_muted(info):
         return re.search("\\[(o\\D\\D?)\\]", info).group(1) == "off"
 
+    def get(self):
+        return self._parse_volume(self._get_info())
+
+    def is_muted(self):
+        return self._parse_muted(self._get_info())
+
+    def get_state(self):
+        # single amixer call for both values
+        info = self._get_info()
+        return float(self._parse_volume(info)), self._parse_muted(info)
+
+    def inc(self):
+        return self._safe_call(lambda: sp.call(self._inc))
+
+    def dec(self):
+        return self._safe_call(lambda: sp.call(self._dec))
+
+    def toggle(self):
+        return self._safe_call(lambda: sp.call(self._tog))
+
+
+class PactlControls(AudioControls):
+    """
+    PulseAudio/PipeWire controls through pactl. Changes are watched with a single long lived
+    'pactl subscribe' process, refreshing state only when the controlled sink/source (or the
+    server defaults) change. Controls shared by several widgets keep a single process for all.
+    """
+
+    _event = re.compile(rb"^Event '(\w+)' on (sink|source|server) #")
+
+    def __init__(self, device=None, step=5, channel="sink", program="pactl", restart_delay=5):
+        if channel not in ("sink", "source"):
+            raise ConfigError("Invalid channel provided to PactlControls: '%s'. Use 'sink' or 'source'" % channel)
+
+        super().__init__(device, step, channel)
+
+        target = device
+        if not target or target in ("pulse", "default"):
+            target = "@DEFAULT_%s@" % channel.upper()
+
+        self.program = program
+        self.target = target
+        self.restart_delay = restart_delay
+        self._get = [program, "get-%s-volume" % channel, target]
+        self._get_mute = [program, "get-%s-mute" % channel, target]
+        self._inc = [program, "set-%s-volume" % channel, target, "+{}%".format(step)]
+        self._dec = [program, "set-%s-volume" % channel, target, "-{}%".format(step)]
+        self._tog = [program, "set-%s-mute" % channel, target, "toggle"]
+        self._task = None
+        # on_change callbacks of every watch
+        self._listeners = []
+        self._refreshing = False
+        self._dirty = False
+
+    @staticmethod
+    def _safe_call(func, fallback=None):
+        try:
+            return func()
+        except Exception as e:
+            _log_pactl.error(str(e))
+        return fallback
+
+    @staticmethod
+    def _parse_volume(info):
+        return re.search("(\\d+)%", info).group(1)
+
+    @staticmethod
+    def _parse_muted(info):
+        return info.strip().endswith("yes")
+
+    def get(self):
+        return self._parse_volume(self._safe_call(lambda: sp.check_output(self._get).decode(), ""))
+
+    def is_muted(self):
+        return self._parse_muted(self._safe_call(lambda: sp.check_output(self._get_mute).decode(), ""))
+
     def inc(self):
         return self._safe_call(lambda: sp.call(self._inc))
 
@@ -71,6 +166,86 @@ class _AmixerControls(AudioControls):
     def toggle(self):
         return self._safe_call(lambda: sp.call(self._tog))
 
+    async def _run(self, cmd):
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        out, _ = await proc.communicate()
+        return out.decode()
+
+    async def _refresh(self):
+        # coalesce events arriving while refreshing into a single extra refresh
+        if self._refreshing:
+            self._dirty = True
+            return
+
+        self._refreshing = True
+        try:
+            while True:
+                self._dirty = False
+                volume, muted = await asyncio.gather(self._run(self._get), self._run(self._get_mute))
+                state = (float(self._parse_volume(volume)), self._parse_muted(muted))
+                for on_change in list(self._listeners):
+                    on_change(state)
+                if not self._dirty:
+                    break
+        except Exception as e:
+            _log_pactl.error("failed to refresh state: %s", str(e))
+        finally:
+            self._refreshing = False
+
+    def _is_relevant(self, line):
+        match = self._event.match(line)
+        if not match:
+            return False
+        return match.group(2).decode() in (self.channel, "server")
+
+    async def _listen(self):
+        while True:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    self.program, "subscribe", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+                )
+            except Exception as e:
+                _log_pactl.error("failed to subscribe to events: %s", str(e))
+                return
+
+            try:
+                # changes might have been missed while not subscribed
+                asyncio.create_task(self._refresh())
+
+                async for line in proc.stdout:
+                    if self._is_relevant(line):
+                        asyncio.create_task(self._refresh())
+
+                await proc.wait()
+            except asyncio.CancelledError:
+                if proc.returncode is None:
+                    proc.terminate()
+                    await proc.wait()
+                raise
+
+            _log_pactl.warning("'%s subscribe' exited with %s, restarting", self.program, proc.returncode)
+            await asyncio.sleep(self.restart_delay)
+
+    def watch(self, on_change):
+        self._listeners.append(on_change)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        else:
+            # already subscribed, refresh state for this watch as well
+            asyncio.create_task(self._refresh())
+
+        def stop():
+            if on_change not in self._listeners:
+                return
+            self._listeners.remove(on_change)
+            if not self._listeners and self._task:
+                self._task.cancel()
+                self._task = None
+
+        return stop
+
 
 class AudioWidget(ProgressCoreWidget):
     defaults = [
@@ -80,9 +255,17 @@ class AudioWidget(ProgressCoreWidget):
         (
             "controls",
             None,
-            "AudioControls instance to use. Leaving None will fallack to _AmixerControls. \
+            "AudioControls instance to use. Leaving None will fallack to the one defined by backend. \
             Make sure to have it installed in your system, in this case."
         ),
+        (
+            "backend",
+            "amixer",
+            "Default controls, when none are provided. Use 'amixer' or 'pactl'. With 'pactl', changes are "
+            "watched instead of polled, and update_interval defaults to 0, not polling at all."
+        ),
+        ("pactl_program", "pactl", "pactl executable, used by the 'pactl' backend."),
+        ("pactl_channel", "sink", "pactl channel, used by the 'pactl' backend. Either 'sink' or 'source'."),
         ("text_colors", [
             ((-1, -1), "ff0000"),
         ], "Text color, based on progress limits."),
@@ -94,6 +277,9 @@ class AudioWidget(ProgressCoreWidget):
     def __init__(self, **config):
         super().__init__(**config)
         self.add_defaults(AudioWidget.defaults)
+        if self._is_pactl() and "update_interval" not in config:
+            # changes are watched, polling is not required
+            self.update_interval = 0
         self.is_muted = False
         self.add_callbacks({
             "Button1": self.cmd_toggle,
@@ -101,12 +287,24 @@ class AudioWidget(ProgressCoreWidget):
             "Button5": self.cmd_dec,
         })
 
+    def _is_pactl(self):
+        if self.controls is not None:
+            return isinstance(self.controls, PactlControls)
+        return self.backend == "pactl"
+
+    def _create_controls(self):
+        if self.backend == "amixer":
+            return _AmixerControls(self.device, self.step, self.channel)
+        if self.backend == "pactl":
+            return PactlControls(self.device, self.step, self.pactl_channel, self.pactl_program)
+        raise ConfigError("Invalid audio backend: '%s'. Must either be 'amixer' or 'pactl'" % self.backend)
+
     def _configure(self, qtile, bar):
         super()._configure(qtile, bar)
-        self.controls = self.controls or _AmixerControls(self.device, self.step, self.channel)
+        self.controls = self.controls or self._create_controls()
 
     def _get_data(self):
-        return self.cmd_get(), self.cmd_is_muted()
+        return self.controls.get_state()
 
     def get_icon(self, _=None):
         if self.is_muted:
@@ -128,11 +326,27 @@ class AudioWidget(ProgressCoreWidget):
             return super().get_progress_bar_color(-1)
         return super().get_progress_bar_color()
 
-    def update_data(self):
+    def get_source_key(self):
+        if isinstance(self.controls, _AmixerControls):
+            return "amixer:%s:%s" % (self.controls.device, self.controls.channel)
+        if isinstance(self.controls, PactlControls):
+            return "pactl:%s:%s" % (self.controls.channel, self.controls.target)
+        return "controls:%d" % id(self.controls)
+
+    def watch_source(self, push):
+        return self.controls.watch(push)
+
+    def sample_data(self):
+        return self._get_data()
+
+    def on_source_data(self, data):
         progress, is_muted = self.progress, self.is_muted
-        self.progress, self.is_muted = self._get_data()
+        self.progress, self.is_muted = data
         self.pending_update = self.progress != progress or self.is_muted != is_muted
 
+    def update_data(self):
+        self.on_source_data(self.sample_data())
+
     def is_draw_update_required(self):
         return self.pending_update
 
@@ -178,6 +392,7 @@ class Microphone(AudioWidget):
             ((0, 100), "\uf130"),
         ], "Icons to present inside progress bar, based on progress limits."),
         ("channel", "Capture", "Audio channel."),
+        ("pactl_channel", "source", "pactl channel, used by the 'pactl' backend. Either 'sink' or 'source'."),
     ]
 
     def __init__(self, **config):
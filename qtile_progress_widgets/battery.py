@@ -1,3 +1,9 @@
+import asyncio
+from collections import namedtuple
+import os
+import socket
+
+from libqtile.confreader import ConfigError
 from libqtile.widget import battery as bt
 
 from .progress_widget import ProgressInFutureWidget
@@ -6,6 +12,122 @@ from .utils import create_logger
 
 _logger = create_logger("BATTERY_ICON")
 
+_NETLINK_KOBJECT_UEVENT = 15
+_SYSFS_POWER_SUPPLY = "/sys/class/power_supply"
+
+_Status = namedtuple("_Status", "state percent")
+
+
+class _SysfsBattery:
+    """
+    Reads battery status from its power_supply uevent file, in a single read, and listens
+    to kernel uevents to get notified of status changes, e.g. AC being plugged/unplugged.
+    Power supply attributes do not notify changes themselves, so without kernel uevents
+    status can only be polled.
+    """
+
+    _states = {
+        "Charging": bt.BatteryState.CHARGING,
+        "Discharging": bt.BatteryState.DISCHARGING,
+        "Full": bt.BatteryState.FULL,
+        "Not charging": getattr(bt.BatteryState, "NOT_CHARGING", bt.BatteryState.UNKNOWN),
+    }
+
+    def __init__(self, root=_SYSFS_POWER_SUPPLY, name=None):
+        if name is None:
+            names = sorted(n for n in os.listdir(root) if n.startswith("BAT")) if os.path.isdir(root) else []
+            if not names:
+                raise ConfigError("No battery found in '%s'" % root)
+            name = names[0]
+
+        self.root = root
+        self.path = os.path.join(root, name)
+        self._uevent = os.path.join(self.path, "uevent")
+
+    @staticmethod
+    def _parse(data):
+        fields = {}
+        for line in data.splitlines():
+            key, _, value = line.partition("=")
+            fields[key[13:] if key.startswith("POWER_SUPPLY_") else key] = value
+        return fields
+
+    @staticmethod
+    def _get_percent(fields):
+        if "CAPACITY" in fields:
+            return int(fields["CAPACITY"]) / 100
+        for prefix in ("ENERGY", "CHARGE"):
+            now, full = fields.get(prefix + "_NOW"), fields.get(prefix + "_FULL")
+            if now and full and int(full):
+                return int(now) / int(full)
+        return 0
+
+    def update_status(self):
+        with open(self._uevent) as f:
+            fields = self._parse(f.read())
+        state = self._states.get(fields.get("STATUS"), bt.BatteryState.UNKNOWN)
+        return _Status(state, self._get_percent(fields))
+
+    @staticmethod
+    def _drain_uevents(sock):
+        """
+        Reads every pending uevent, as the socket stays readable until drained.
+        :return: Whether or not any of them is a power_supply one.
+        """
+
+        changed = False
+        try:
+            while True:
+                data = sock.recv(8192)
+                changed = changed or b"SUBSYSTEM=power_supply" in data
+        except BlockingIOError:
+            pass
+        return changed
+
+    def _watch_uevents(self, loop, on_change):
+        sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC, _NETLINK_KOBJECT_UEVENT
+        )
+        try:
+            # kernel uevents multicast group
+            sock.bind((0, 1))
+        except OSError:
+            sock.close()
+            raise
+
+        def on_event():
+            if self._drain_uevents(sock):
+                on_change()
+
+        loop.add_reader(sock.fileno(), on_event)
+
+        def stop():
+            loop.remove_reader(sock.fileno())
+            sock.close()
+
+        return stop
+
+    def watch(self, on_change):
+        """
+        :return: Function stopping the watch, or None when kernel uevents are not available.
+        """
+
+        def changed():
+            try:
+                on_change(self.update_status())
+            except Exception as e:
+                _logger.error("failed to read battery status: %s", str(e))
+
+        if os.path.realpath(self.root) != _SYSFS_POWER_SUPPLY:
+            # not a kernel provided tree, there are no uevents for it
+            return None
+
+        try:
+            return self._watch_uevents(asyncio.get_event_loop(), changed)
+        except (OSError, AttributeError) as e:
+            _logger.warning("kernel uevents not available, polling status: %s", str(e))
+        return None
+
 
 class Battery(ProgressInFutureWidget):
     defaults = [
@@ -39,19 +161,42 @@ class Battery(ProgressInFutureWidget):
         ("progress_bar_inner_colors", [
             ((-1, -1), "00ff00"),
         ], "Progress inner colors for each specified limit."),
+        (
+            "backend",
+            "qtile",
+            "Battery status backend. Use 'qtile', for qtile's battery loader, or 'sysfs' to read "
+            "power_supply sysfs directly and get notified of changes right away. With 'sysfs', "
+            "update_interval defaults to 60 seconds, unless kernel uevents are not available."
+        ),
+        ("power_supply_root", _SYSFS_POWER_SUPPLY, "Power supply devices directory, used with 'sysfs' backend."),
+        ("battery_name", None, "Battery device name, used with 'sysfs' backend. First BAT* found if None."),
     ]
 
     def __init__(self, **config):
         super().__init__(**config)
         self.add_defaults(Battery.defaults)
-        self._battery = bt.load_battery(**config)
+        if self.backend == "sysfs":
+            self._battery = _SysfsBattery(self.power_supply_root, self.battery_name)
+            # interval to poll at when changes turn out not to be notified
+            self._polling_interval = None
+            if "update_interval" not in config:
+                # changes are notified, polling only keeps percentage up to date
+                self._polling_interval = self.update_interval
+                self.update_interval = 60
+        elif self.backend == "qtile":
+            self._battery = bt.load_battery(**config)
+        else:
+            raise ConfigError("Invalid battery backend: '%s'. Must either be 'qtile' or 'sysfs'" % self.backend)
         self.state = bt.BatteryState.UNKNOWN
         _logger.debug("initialized")
 
-    def _get_status(self):
-        status = self._battery.update_status()
+    @staticmethod
+    def _from_status(status):
         return status.state, int(status.percent * 100)
 
+    def _get_status(self):
+        return self._from_status(self._battery.update_status())
+
     def get_icon(self, _=None):
         if self.state == bt.BatteryState.CHARGING:
             return super().get_icon(-1)
@@ -67,10 +212,30 @@ class Battery(ProgressInFutureWidget):
             return super().get_progress_bar_inner_color(-1)
         return super().get_progress_bar_inner_color()
 
-    def update_data(self):
+    def get_source_key(self):
+        if isinstance(self._battery, _SysfsBattery):
+            return "battery:%s" % self._battery.path
+        return "battery:%s" % self._user_config.get("battery", "")
+
+    def watch_source(self, push):
+        if not isinstance(self._battery, _SysfsBattery):
+            return None
+
+        stop = self._battery.watch(lambda status: push(self._from_status(status)))
+        if stop is None and self._polling_interval:
+            self.update_interval = self._polling_interval
+        return stop
+
+    def sample_data(self):
+        return self._get_status()
+
+    def on_source_data(self, data):
         state, progress = self.state, self.progress
-        self.state, self.progress = self._get_status()
+        self.state, self.progress = data
         self.pending_update = state != self.state or progress != self.progress
 
+    def update_data(self):
+        self.on_source_data(self.sample_data())
+
     def is_draw_update_required(self):
         return self.pending_update
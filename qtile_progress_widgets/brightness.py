@@ -1,9 +1,12 @@
+import asyncio
+import os
 import subprocess as sp
 
 from libqtile.confreader import ConfigError
 
 from .progress_widget import ProgressCoreWidget
 from .utils import create_logger
+from .watchers import watch_file
 
 
 _logger = create_logger("BRIGHTNESS_ICON")
@@ -55,10 +58,141 @@ class _Commands():
     def dec(self):
         return self._safe_call(lambda: sp.call(self._dec))
 
+    def watch(self, on_change):
+        return None
+
+    def close(self):
+        pass
+
+
+class _Sysfs():
+    """
+    Reads brightness straight from sysfs, keeping attribute files open, and watches
+    actual_brightness for changes made by hotkeys, ACPI or other programs.
+
+    Writing brightness requires root, or a udev rule granting access to it. Without
+    access, brightness is set through logind instead, as allowed for the active session.
+    """
+
+    def __init__(self, root="/sys/class/backlight", device=None, step=5):
+        if step < 1 or step > 100:
+            raise ConfigError("Invalid step provided to BrightnessIcon: '%s'" % step)
+
+        if device is None:
+            devices = sorted(os.listdir(root)) if os.path.isdir(root) else []
+            if not devices:
+                raise ConfigError("No backlight device found in '%s'" % root)
+            device = devices[0]
+
+        self.device = device
+        self.path = os.path.join(root, device)
+        self.step = step
+        self._use_logind = False
+        self._system_bus = None
+
+        actual = os.path.join(self.path, "actual_brightness")
+        if not os.path.exists(actual):
+            actual = os.path.join(self.path, "brightness")
+
+        self._actual_path = actual
+        self._actual = None
+        self._open()
+
+        # max brightness does not change, no need to keep it open
+        with open(os.path.join(self.path, "max_brightness")) as f:
+            self._max = int(f.read())
+
+    def _open(self):
+        # kept open until closed, reopened when read again afterwards
+        if self._actual is None:
+            self._actual = os.open(self._actual_path, os.O_RDONLY | os.O_CLOEXEC)
+        return self._actual
+
+    @staticmethod
+    def _read_int(fd):
+        return int(os.pread(fd, 32, 0))
+
+    def _safe_call(self, func, fallback=None):
+        try:
+            return func()
+        except Exception as e:
+            _logger.error(str(e))
+        return fallback
+
+    def _write(self, percentage):
+        level = round(max(0, min(100, percentage)) / 100 * self._max)
+
+        if not self._use_logind:
+            try:
+                with open(os.path.join(self.path, "brightness"), "w") as f:
+                    f.write(str(level))
+                return
+            except PermissionError:
+                _logger.info("no write access to '%s', setting brightness through logind", self.path)
+                self._use_logind = True
+
+        asyncio.create_task(self._set_through_logind(level))
+
+    async def _set_through_logind(self, level):
+        from dbus_next.aio import MessageBus
+        from dbus_next.constants import BusType, MessageType
+        from dbus_next.message import Message
+
+        try:
+            if self._system_bus is None or not self._system_bus.connected:
+                self._system_bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+            reply = await self._system_bus.call(Message(
+                destination="org.freedesktop.login1",
+                path="/org/freedesktop/login1/session/auto",
+                interface="org.freedesktop.login1.Session",
+                member="SetBrightness",
+                signature="ssu",
+                body=["backlight", self.device, level],
+            ))
+        except Exception as e:
+            return _logger.error("failed to set brightness through logind: %s", str(e))
+
+        if reply.message_type != MessageType.METHOD_RETURN:
+            _logger.error("failed to set brightness through logind: %s", reply.body)
+
+    def get_percentage(self):
+        return self._read_int(self._open()) / self._max * 100 if self._max else 0
+
+    def get(self):
+        level = self._safe_call(self.get_percentage, 0)
+        return "{:.0f}".format(level)
+
+    def set(self, percentage):
+        return self._safe_call(lambda: self._write(percentage))
+
+    def inc(self):
+        return self._safe_call(lambda: self._write(self.get_percentage() + self.step))
+
+    def dec(self):
+        return self._safe_call(lambda: self._write(self.get_percentage() - self.step))
+
+    def watch(self, on_change):
+        return watch_file(self._actual_path, lambda: on_change(float(self.get())))
+
+    def close(self):
+        if self._actual is not None:
+            os.close(self._actual)
+            self._actual = None
+        if self._system_bus is not None:
+            self._system_bus.disconnect()
+            self._system_bus = None
+
 
 class Brightness(ProgressCoreWidget):
     defaults = [
-        ("program", "brightnessctl", "Program to control brightness."),
+        (
+            "program",
+            "brightnessctl",
+            "Program to control brightness. Use 'sysfs' to read and write sysfs directly, "
+            "reacting to external changes right away."
+        ),
+        ("sysfs_root", "/sys/class/backlight", "Backlight devices directory, used with 'sysfs' program."),
+        ("sysfs_device", None, "Backlight device, used with 'sysfs' program. First one found if None."),
         ("step", 5, "Increment/decrement percentage of brightness."),
         ("update_interval", 0, "How often in seconds the widget refreshes."),
         ("icons", [
@@ -71,7 +205,10 @@ class Brightness(ProgressCoreWidget):
     def __init__(self, **config):
         super().__init__(**config)
         self.add_defaults(Brightness.defaults)
-        self._cmds = _Commands(self.program, self.step)
+        if self.program == "sysfs":
+            self._cmds = _Sysfs(self.sysfs_root, self.sysfs_device, self.step)
+        else:
+            self._cmds = _Commands(self.program, self.step)
         self.add_callbacks({
             "Button1": self.cmd_set,
             "Button4": self.cmd_inc,
@@ -79,14 +216,33 @@ class Brightness(ProgressCoreWidget):
         })
         _logger.info("initialized")
 
-    def update_data(self):
+    def get_source_key(self):
+        if isinstance(self._cmds, _Sysfs):
+            return "brightness:%s" % self._cmds.path
+        return "brightness:%s" % self.program
+
+    def sample_data(self):
+        return float(self._cmds.get())
+
+    def watch_source(self, push):
+        return self._cmds.watch(push)
+
+    def on_source_data(self, data):
         progress = self.progress
-        self.progress = float(self._cmds.get())
+        self.progress = data
         self.pending_update = progress != self.progress
 
+    def update_data(self):
+        self.on_source_data(self.sample_data())
+
     def is_draw_update_required(self):
         return self.pending_update
 
+    def finalize(self):
+        # leave the data source first, nothing reads through closed controls afterwards
+        super().finalize()
+        self._cmds.close()
+
     def cmd_inc(self):
         self._cmds.inc()
         self.update()
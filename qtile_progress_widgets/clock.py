@@ -0,0 +1,112 @@
+from collections import deque
+import heapq
+import itertools
+import math
+import time
+
+from .utils import create_logger
+
+
+_logger = create_logger("CLOCK")
+
+# ticks due this close to a wakeup run along with it, instead of waking up again
+_TOLERANCE = 0.005
+
+
+class _Tick:
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TickClock:
+    """
+    Shared clock for periodic updates. Ticks are aligned to wall clock multiples of their
+    interval, so every tick due at the same instant runs in a single wakeup, whichever
+    widget or source scheduled it. Phases are taken from the wall clock on every tick, so
+    time spent updating never adds up as drift, while deadlines are kept on the monotonic
+    clock of the event loop, so ticks keep running when the wall clock is stepped.
+    """
+
+    def __init__(self):
+        self._qtile = None
+        self._ticks = []
+        self._counter = itertools.count()
+        self._handle = None
+        self._armed_at = None
+        self._wakeups = deque()
+        self.ticks = 0
+
+    def schedule(self, qtile, interval, callback):
+        """
+        Calls callback once, at the next wall clock multiple of interval.
+        :return: Tick, to be cancelled when no longer needed.
+        """
+
+        self._qtile = qtile
+        now = time.time()
+        # ticks running slightly early are rescheduled into the next interval
+        delay = (math.floor((now + _TOLERANCE) / interval) + 1) * interval - now
+        tick = _Tick(time.monotonic() + delay, callback)
+        heapq.heappush(self._ticks, (tick.deadline, next(self._counter), tick))
+        self._arm()
+        return tick
+
+    def _arm(self):
+        while self._ticks and self._ticks[0][2].cancelled:
+            heapq.heappop(self._ticks)
+
+        deadline = self._ticks[0][0] if self._ticks else None
+        if deadline == self._armed_at:
+            return
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._armed_at = deadline
+
+        if deadline is not None:
+            self._handle = self._qtile.call_later(max(0, deadline - time.monotonic()), self._wake)
+
+    def _wake(self):
+        self._handle = None
+        self._armed_at = None
+
+        now = time.monotonic()
+        self._wakeups.append(now)
+        while self._wakeups[0] < now - 60:
+            self._wakeups.popleft()
+
+        due = []
+        while self._ticks and self._ticks[0][0] <= now + _TOLERANCE:
+            tick = heapq.heappop(self._ticks)[2]
+            if not tick.cancelled:
+                due.append(tick)
+
+        for tick in due:
+            self.ticks += 1
+            try:
+                tick.callback()
+            except Exception:
+                _logger.exception("exception in tick callback")
+
+        self._arm()
+
+    def info(self):
+        """
+        :return: Wakeups during the last minute, ticks run so far and pending ticks.
+        """
+
+        now = time.monotonic()
+        return dict(
+            wakeups_per_minute=sum(1 for t in self._wakeups if t >= now - 60),
+            ticks=self.ticks,
+            pending=sum(1 for _, _, tick in self._ticks if not tick.cancelled),
+        )
+
+
+tick_clock = TickClock()
@@ -26,5 +26,14 @@ class CPU(ProgressInFutureWidget):
         super().__init__(**config)
         self.add_defaults(CPU.defaults)
 
+    def get_source_key(self):
+        return "cpu"
+
+    def sample_data(self):
+        return psutil.cpu_percent()
+
+    def on_source_data(self, data):
+        self.progress = data
+
     def update_data(self):
-        self.progress = psutil.cpu_percent()
+        self.on_source_data(self.sample_data())
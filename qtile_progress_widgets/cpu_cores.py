@@ -0,0 +1,240 @@
+import math
+
+from libqtile.confreader import ConfigError
+
+from .progress_bar import _parse_color
+from .progress_widget import ProgressInFutureWidget
+from .utils import create_logger
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+
+_logger = create_logger("CPU_CORES")
+
+# user, nice, system, idle, iowait, irq, softirq, steal (guest time is already accounted in user)
+_FIELDS = 8
+_IDLE = 3
+_IOWAIT = 4
+
+
+class _CoresStat:
+    """
+    Reads per core times from /proc/stat into preallocated arrays, computing every core
+    busy percentage in a single vectorized step.
+    """
+
+    def __init__(self, path="/proc/stat"):
+        self.path = path
+        self._allocate(0)
+
+    def _allocate(self, count):
+        self.count = count
+        self._times = np.zeros((count, _FIELDS), np.int64)
+        self._total = np.zeros(count, np.int64)
+        self._busy = np.zeros(count, np.int64)
+        self._prev_total = np.zeros(count, np.int64)
+        self._prev_busy = np.zeros(count, np.int64)
+        self._delta_total = np.zeros(count, np.int64)
+        self._delta_busy = np.zeros(count, np.int64)
+        self.percent = np.zeros(count, np.float64)
+
+    def _read(self):
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+        # first line holds the aggregate, per core lines follow it
+        cores = []
+        for line in lines[1:]:
+            if not line.startswith(b"cpu"):
+                break
+            cores.append(line)
+        return cores
+
+    def sample(self):
+        cores = self._read()
+
+        if len(cores) != self.count:
+            # first sample or cores went on/offline, start over
+            self._allocate(len(cores))
+
+        fields = np.array(b" ".join(cores).split()).reshape(self.count, -1)
+        self._times[:] = fields[:, 1:_FIELDS + 1].astype(np.int64)
+
+        np.sum(self._times, axis=1, out=self._total)
+        np.subtract(self._total, self._times[:, _IDLE], out=self._busy)
+        np.subtract(self._busy, self._times[:, _IOWAIT], out=self._busy)
+
+        np.subtract(self._total, self._prev_total, out=self._delta_total)
+        np.subtract(self._busy, self._prev_busy, out=self._delta_busy)
+        self._prev_total[:] = self._total
+        self._prev_busy[:] = self._busy
+
+        self.percent.fill(0)
+        np.divide(self._delta_busy * 100.0, self._delta_total, out=self.percent, where=self._delta_total > 0)
+        np.clip(self.percent, 0, 100, out=self.percent)
+
+        return self.percent
+
+
+class CPUCores(ProgressInFutureWidget):
+    defaults = [
+        ("icons", [
+            ((0, 100), "\ue266"),
+        ], "Icons to present inside progress bar, based on progress limits."),
+        ("progress_bar_active", False, "Whether to draw round progress bar, with the average usage of all cores."),
+        ("cores_mode", "rings", "How to present cores. Use 'rings' or 'heatmap'."),
+        ("cores_rows", 2, "Number of rows used to lay out cores."),
+        ("cores_cell_width", 4, "Width of each core cell, in heatmap mode. Rings width matches their height."),
+        ("cores_ring_thickness", 1.5, "Stroke thickness of each core ring."),
+        ("cores_colors", [
+            ((50, 75), "ffff00"),
+            ((75, 100), "ff0000"),
+        ], "Color of each core, based on its usage limits."),
+        ("cores_remaining_color", "444444", "Color for the remaining part of core rings."),
+        ("stat_file", "/proc/stat", "File to read cores times from."),
+    ]
+    limits_options = ProgressInFutureWidget.limits_options + ("cores_colors",)
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.add_defaults(CPUCores.defaults)
+
+        if not has_numpy:
+            raise ConfigError("CPUCores widget requires numpy to be installed")
+        if self.cores_mode not in ("rings", "heatmap"):
+            raise ConfigError("Invalid cores mode. Must either be 'rings' or 'heatmap'")
+
+        self._stat = _CoresStat(self.stat_file)
+        self.percent = np.zeros(0)
+        self._color_ids = np.zeros(0, np.intp)
+        self._levels = np.zeros(0, np.intp)
+        self._colors = []
+        self._points = None
+        self._point_ids = None
+        self._segment_ids = None
+
+    def _configure(self, qtile, bar):
+        super()._configure(qtile, bar)
+
+        colors, points, point_ids, between_ids = self._limits["cores_colors"].classes()
+        default = self.foreground or "ffffff"
+        self._colors = [color or default for color in colors]
+        self._points = np.array(points, np.float64)
+        self._point_ids = np.array(point_ids + [0], np.intp)
+        # values below the first point and above the last one belong to no limits, class 0
+        self._segment_ids = np.array([0] + between_ids + [0], np.intp)
+
+    @property
+    def _cell_height(self):
+        return (self.oriented_size - self.padding_y * 2) / max(1, self.cores_rows)
+
+    @property
+    def _cell_width(self):
+        if self.cores_mode == "rings":
+            return self._cell_height
+        return self.cores_cell_width
+
+    @property
+    def _columns(self):
+        return math.ceil(len(self.percent) / max(1, self.cores_rows))
+
+    @property
+    def _levels_count(self):
+        if self.cores_mode == "rings":
+            # distinguishable arc lengths, one per pixel of circumference
+            return max(1, math.ceil(math.pi * self._cell_height))
+        return 16
+
+    def _get_grid_length(self):
+        if not len(self.percent):
+            return 0
+        return self._columns * self._cell_width + self.padding_x * 2
+
+    def get_source_key(self):
+        return "cpu_cores:%s" % self.stat_file
+
+    def sample_data(self):
+        return self._stat.sample().copy()
+
+    def on_source_data(self, data):
+        self.percent = data
+        self.progress = float(data.mean()) if len(data) else 0
+
+        self._color_ids = self._classify(data)
+        self._levels = np.rint(data / 100 * self._levels_count).astype(np.intp)
+
+    def _classify(self, data):
+        """
+        Vectorized lookup of cores colors, matching the one of single values.
+        :return: Color class of every core.
+        """
+
+        i = np.searchsorted(self._points, data)
+        at_point = self._points[np.minimum(i, len(self._points) - 1)] == data if len(self._points) else False
+        return np.where(at_point, self._point_ids[i], self._segment_ids[i])
+
+    def update_data(self):
+        self.on_source_data(self.sample_data())
+
+    def get_render_state(self, elements=None):
+        return (super().get_render_state(elements), self._color_ids.tobytes(), self._levels.tobytes())
+
+    def update_draw_length(self):
+        super().update_draw_length()
+        self._total_length += self._get_grid_length()
+
+    def _draw_rings(self, x, y, size, colors):
+        ctx = self.drawer.ctx
+        thickness = self.cores_ring_thickness
+        radius = size / 2 - thickness / 2
+        levels = self._levels_count
+
+        ctx.set_line_width(thickness)
+
+        for i, (color, level) in enumerate(zip(colors, self._levels.tolist())):
+            cx = x + (i // self.cores_rows) * size + size / 2
+            cy = y + (i % self.cores_rows) * size + size / 2
+            end_angle = level / levels * 2 * math.pi
+
+            self.drawer.set_source_rgb(color)
+            ctx.new_path()
+            ctx.arc(cx, cy, radius, 0, end_angle)
+            ctx.stroke()
+
+            self.drawer.set_source_rgb(self.cores_remaining_color)
+            ctx.new_path()
+            ctx.arc(cx, cy, radius, end_angle, 2 * math.pi)
+            ctx.stroke()
+
+    def _draw_heatmap(self, x, y, width, height, colors):
+        ctx = self.drawer.ctx
+        levels = self._levels_count
+
+        for i, (color, level) in enumerate(zip(colors, self._levels.tolist())):
+            r, g, b, _ = _parse_color(color)
+            # usage is shown as the cell opacity, keeping a minimum to tell cells apart
+            ctx.set_source_rgba(r, g, b, 0.2 + 0.8 * level / levels)
+            ctx.rectangle(
+                x + (i // self.cores_rows) * width, y + (i % self.cores_rows) * height, width - 1, height - 1
+            )
+            ctx.fill()
+
+    def draw_after_elements(self, offset=0):
+        if not len(self.percent):
+            return 0
+
+        colors = [self._colors[i] for i in self._color_ids.tolist()]
+        x = offset + self.padding_x
+        y = self.padding_y
+
+        self.drawer.ctx.save()
+        if self.cores_mode == "rings":
+            self._draw_rings(x, y, self._cell_height, colors)
+        else:
+            self._draw_heatmap(x, y, self._cell_width, self._cell_height, colors)
+        self.drawer.ctx.restore()
+
+        return self._get_grid_length()
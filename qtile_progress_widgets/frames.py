@@ -0,0 +1,130 @@
+import time
+
+from .utils import create_logger
+
+
+_logger = create_logger("FRAMES")
+
+# active schedulers, by bar
+_schedulers = {}
+
+
+class FrameScheduler:
+    """
+    Coalesces draws of every widget of a bar. Draws requested during a loop iteration are
+    collected and flushed at once, soon after. Widgets changing their length require the
+    whole bar to be laid out again, which draws every widget of it as well, so their own
+    draws get skipped. Frames can be capped to the lowest max fps among widgets.
+    """
+
+    def __init__(self, bar):
+        self.bar = bar
+        self.widgets = []
+        self.max_fps = None
+        self.requests = 0
+        self.frames = 0
+        self.saved = 0
+        self._qtile = None
+        self._dirty = {}
+        self._relayout = False
+        self._handle = None
+        self._flushed_at = 0
+
+    def _update_max_fps(self):
+        rates = [w.max_fps for w in self.widgets if w.max_fps]
+        self.max_fps = min(rates) if rates else None
+
+    def _schedule(self):
+        if self._handle is not None:
+            return
+
+        delay = 0
+        if self.max_fps:
+            delay = self._flushed_at + 1 / self.max_fps - time.monotonic()
+
+        if delay > 0:
+            self._handle = self._qtile.call_later(delay, self._flush)
+        else:
+            self._handle = self._qtile.call_soon(self._flush)
+
+    def _flush(self):
+        self._handle = None
+        self._flushed_at = time.monotonic()
+
+        dirty, relayout, requests = self._dirty, self._relayout, self.requests
+        self._dirty, self._relayout, self.requests = {}, False, 0
+
+        if relayout:
+            self.bar.draw()
+            draws = 1
+        else:
+            draws = 0
+            for widget in dirty:
+                if not widget.configured:
+                    continue
+                draws += 1
+                try:
+                    widget.draw()
+                except Exception:
+                    _logger.exception("failed to draw '%s'", widget.name)
+
+        self.frames += 1
+        self.saved += requests - draws
+
+    def request(self, widget, relayout=False):
+        """
+        Requests widget to be drawn, along with the whole bar on relayout.
+        """
+
+        self.requests += 1
+        if relayout:
+            self._relayout = True
+        else:
+            self._dirty[widget] = True
+        self._schedule()
+
+    def subscribe(self, widget):
+        if widget not in self.widgets:
+            self.widgets.append(widget)
+        self._qtile = widget.qtile
+        self._update_max_fps()
+
+    def unsubscribe(self, widget):
+        if widget in self.widgets:
+            self.widgets.remove(widget)
+        self._dirty.pop(widget, None)
+
+        if self.widgets:
+            return self._update_max_fps()
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        if _schedulers.get(self.bar) is self:
+            del _schedulers[self.bar]
+
+    def info(self):
+        return dict(
+            widgets=len(self.widgets), max_fps=self.max_fps, frames=self.frames, saved=self.saved,
+            pending=self.requests,
+        )
+
+
+def subscribe(widget):
+    """
+    Subscribes widget to the scheduler of its bar, creating it when needed.
+    :return: Subscribed scheduler.
+    """
+
+    scheduler = _schedulers.get(widget.bar)
+
+    if scheduler is None:
+        scheduler = _schedulers[widget.bar] = FrameScheduler(widget.bar)
+
+    scheduler.subscribe(widget)
+    return scheduler
+
+
+def get_schedulers_info():
+    return [s.info() for s in _schedulers.values()]
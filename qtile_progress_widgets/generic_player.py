@@ -1,13 +1,16 @@
 import asyncio
 import json
+import time
 
 from dbus_next.constants import MessageType
 from dbus_next.signature import Variant
 from libqtile.confreader import ConfigError
-from libqtile.utils import _send_dbus_message, add_signal_receiver
 
+from .images import image_loader
+from .mpris import mpris_registry
 from .progress_widget import ProgressCoreWidget
-from .utils import create_logger, get_cairo_image
+from .session_bus import session_bus
+from .utils import LazyMessage, create_logger
 
 
 _logger = create_logger("GENERIC_PLAYER_ICON")
@@ -31,17 +34,37 @@ class GenericPlayer(ProgressCoreWidget):
             "Whether or not to show states text inside progress bar. When false, states text is show as a prefix to the text."
         ),
         ("show_album_art", False, "Whether or not to show album art for the current playing track."),
+        ("album_art_disk_cache", True, "Whether or not to cache remote album art on disk."),
         ("mpris_player", None, "MPRIS 2 compatible player identifier."),
+        (
+            "position_drift_check",
+            None,
+            "Playback position is extrapolated locally, synced only when player seeks or changes state. "
+            "Seconds between position checks against player, to correct any drift. None disables it."
+        ),
+        (
+            "signal_debounce",
+            0.05,
+            "When updated on signals only (update_interval 0), seconds to wait for further player signals before "
+            "drawing, so bursts of them, as sent on track changes, get drawn at once. 0 draws on every signal."
+        ),
     ]
 
     def __init__(self, **config):
         super().__init__(**config)
         self.add_defaults(GenericPlayer.defaults)
         self.metadata = {}
+        # metadata values before escaping, to only escape changed ones
+        self._raw_metadata = {}
         self.playback_status = "Stopped"
+        # position, in microseconds, when last synced with player
         self.playback_position = 0
+        self.playback_rate = 1.0
+        self._position_synced_at = time.monotonic()
+        self._resyncing = False
         self._active = False
         self._album_art_image = None
+        self._refresh_timer = None
         self.add_callbacks({
             "Button1": self.cmd_play_pause,
             "Button4": self.cmd_next,
@@ -52,50 +75,65 @@ class GenericPlayer(ProgressCoreWidget):
         if self.mpris_player is None:
             raise ConfigError("a mpris player must be provided in order to use widget")
 
-        # listen to player updates
-        sub = await add_signal_receiver(
-            lambda msg: asyncio.create_task(self._on_properties_changed(*msg.body)),
-            session_bus=True,
-            signal_name="PropertiesChanged",
-            bus_name=self.mpris_player,
-            path="/org/mpris/MediaPlayer2",
-            dbus_interface="org.freedesktop.DBus.Properties",
-        )
-        if not sub:
-            _logger.warning("Failed to add 'PropertiesChanged' signal to %s", self.mpris_player)
-
-        # listen to dbus app state updates, to react when our client state changes
-        sub = await add_signal_receiver(
-            lambda msg: asyncio.create_task(self._on_name_owner_changed(*msg.body)),
-            session_bus=True,
-            signal_name="NameOwnerChanged",
-            dbus_interface="org.freedesktop.DBus",
-        )
-        if not sub:
-            _logger.warning("Failed to add 'NameOwnerChanged' signal to %s", self.mpris_player)
+        # player signals, and its bus name state, are shared by every player widget
+        await mpris_registry.subscribe(self, self.mpris_player)
+        self.on_player_owner_changed(self.mpris_player, mpris_registry.is_running(self.mpris_player))
 
-    def _on_properties_changed(self, _, updated, __):
+    def on_player_properties(self, _, updated):
         if not self.configured:
             return
 
+        # keep position played so far, before playback changes
+        self._sync_position(self.get_playback_position())
+        changed = not self._active
+        resync = False
+
         if "Metadata" in updated:
-            self._update_metadata(updated["Metadata"].value)
+            track = self._get_track_id()
+            changed = self._update_metadata(updated["Metadata"].value) or changed
+            if self._get_track_id() != track:
+                self._sync_position(0)
+                resync = True
 
         if "PlaybackStatus" in updated:
-            self.playback_status = updated["PlaybackStatus"].value
+            status = updated["PlaybackStatus"].value
+            resync = resync or status != self.playback_status
+            changed = changed or status != self.playback_status
+            self.playback_status = status
+
+        if "Rate" in updated:
+            changed = changed or updated["Rate"].value != self.playback_rate
+            self.playback_rate = updated["Rate"].value
+            resync = True
+
+        if "Position" in updated:
+            # only read along every property, never signaled
+            self._sync_position(updated["Position"].value)
+            changed = True
+            resync = False
+
+        if resync and self.progress_bar_active:
+            self._request_position()
 
         self._active = True
 
-        data = json.dumps(self.metadata, indent=2)
+        if not changed:
+            return
+
+        data = LazyMessage(json.dumps, self.metadata, indent=2)
         _logger.debug("%s updated:\nDATA: %s\nSTATUS: %s", self.mpris_player, data, self.playback_status)
 
         self._check_refresh_on_signal()
 
-    def _on_name_owner_changed(self, name, _, new):
-        if name != self.mpris_player:
+    def on_player_seeked(self, _, position):
+        if not self.configured:
             return
 
-        self._active = len(new) > 0
+        self._sync_position(position)
+        self._check_refresh_on_signal()
+
+    def on_player_owner_changed(self, _, running):
+        self._active = running
         self.pending_update = True
 
         _logger.debug("%s changed state: %s", self.mpris_player, self._active)
@@ -103,70 +141,140 @@ class GenericPlayer(ProgressCoreWidget):
         self._check_refresh_on_signal()
 
     async def _send_command(self, interface, cmd, signature="", *args):
-        bus, message = await _send_dbus_message(
-            True,
-            MessageType.METHOD_CALL,
-            self.mpris_player,
-            interface,
-            "/org/mpris/MediaPlayer2",
-            cmd,
-            signature,
-            list(args),
-        )
-        if bus:
-            bus.disconnect()
+        try:
+            message = await session_bus.call(
+                self.mpris_player, "/org/mpris/MediaPlayer2", interface, cmd, signature, list(args)
+            )
+        except Exception as e:
+            _logger.warning("%s: failed to send cmd '%s': %s", self.mpris_player, cmd, str(e))
+            return None
 
-        if message.message_type != MessageType.METHOD_RETURN:
+        if message is None or message.message_type != MessageType.METHOD_RETURN:
             _logger.warning("%s: failed to send cmd '%s' on interface: '%s'.", self.mpris_player, cmd, interface)
             return None
-        if message.body:
-            return message.body[0].value
-        return None
+        if not message.body:
+            return None
+        # Get replies a variant, GetAll a dict of them
+        body = message.body[0]
+        return body.value if isinstance(body, Variant) else body
 
     def _check_refresh_on_signal(self):
         # when timeout is set, no action is required. handled in next loop tick
         if self.update_interval > 0:
             return
-        # else, we check for required draw call
+        # else, we check for required draw call, once signals settle
+        if not self.signal_debounce:
+            return self.update()
+        if self._refresh_timer is None:
+            self._refresh_timer = self.timeout_add(self.signal_debounce, self._refresh_on_signal)
+
+    def _refresh_on_signal(self):
+        self._refresh_timer = None
         self.update()
 
     def _update_metadata(self, metadata):
-        self.metadata = {}
+        """
+        Applies metadata as a diff of the current one, escaping only changed values.
+        :return: Whether or not metadata changed.
+        """
+
+        raw = {}
         for key, variant in metadata.items():
             value = variant.value
-            # replace colons in key, to ease out the process of text formatting
-            prop = key.replace(":", "_")
             if isinstance(value, list):
                 value = "/".join((v for v in value if isinstance(v, str)))
-            self.metadata[prop] = value if not isinstance(value, str) else self.escape_text(value)
-
-        if self.show_album_art and "mpris_artUrl" in self.metadata:
+            # replace colons in key, to ease out the process of text formatting
+            raw[key.replace(":", "_")] = value
+
+        previous = self._raw_metadata
+        if raw == previous:
+            return False
+
+        updated = {}
+        for prop, value in raw.items():
+            if prop in self.metadata and previous.get(prop) == value:
+                updated[prop] = self.metadata[prop]
+            else:
+                updated[prop] = value if not isinstance(value, str) else self.escape_text(value)
+        self.metadata = updated
+        self._raw_metadata = raw
+
+        art_url = raw.get("mpris_artUrl")
+        if art_url != previous.get("mpris_artUrl"):
             self._album_art_image = None
-            asyncio.create_task(self._fetch_album_art(), name="qpw_gpi_fetch_art")
+            if self.show_album_art and art_url:
+                asyncio.create_task(self._fetch_album_art(art_url), name="qpw_gpi_fetch_art")
 
-    async def _fetch_album_art(self):
-        art_url = self.metadata["mpris_artUrl"]
-        if not art_url:
-            return
+        return True
+
+    def _clear_metadata(self):
+        self.metadata = {}
+        self._raw_metadata = {}
+        self._album_art_image = None
+
+    async def _fetch_album_art(self, art_url):
         try:
-            img = get_cairo_image(art_url)
-            img.resize(height=self.oriented_size - self.padding * 2)
-            self._album_art_image = img
+            img = await image_loader.load(
+                art_url, height=self.oriented_size - self.padding * 2, disk_cache=self.album_art_disk_cache
+            )
         except Exception as e:
-            _logger.error(str(e))
+            return _logger.error(str(e))
+        # track might have changed while loading
+        if self._raw_metadata.get("mpris_artUrl") == art_url:
+            self._album_art_image = img
 
     async def _refresh_metadata(self):
+        player = self.mpris_player
+        properties = await self.get_player_properties()
+        if not properties:
+            return
+
         data = {
-            "Metadata": Variant("a{sv}", await self.get_player_property("Metadata")),
-            "PlaybackStatus": Variant("s", await self.get_player_property("PlaybackStatus")),
+            key: properties[key] for key in ("Metadata", "PlaybackStatus", "Rate", "Position") if key in properties
         }
-        self._on_properties_changed(None, data, None)
+        self.on_player_properties(player, data)
+
+    def _get_track_id(self):
+        return self.metadata.get("mpris_trackid") or self.metadata.get("xesam_title")
+
+    def _sync_position(self, position):
+        self.playback_position = position or 0
+        self._position_synced_at = time.monotonic()
 
-    async def _refresh_playback_progress(self):
-        self.playback_position = await self.get_player_property("Position") or 0
+    def _request_position(self):
+        if self._resyncing:
+            return
+        self._resyncing = True
+        asyncio.create_task(self._resync_position(), name="resync_position")
+
+    async def _resync_position(self):
+        try:
+            position = await self.get_player_property("Position")
+        finally:
+            self._resyncing = False
+        if position is not None:
+            self._sync_position(position)
+
+    def get_playback_position(self):
+        """
+        Position extrapolated from the last synced one, at playback rate, while playing.
+        :return: Position in microseconds.
+        """
+
+        position = self.playback_position
+        if self.playback_status == "Playing":
+            position += (time.monotonic() - self._position_synced_at) * 1000000 * self.playback_rate
+
+        length = self.metadata.get("mpris_length")
+        if length:
+            position = min(position, length)
+
+        return max(position, 0)
+
+    def _update_progress(self):
         length = self.metadata["mpris_length"]
         # ensure length is not 0, to avoid division by zero
-        self.progress = length and float(self.playback_position / length * 100) or 0
+        self.progress = length and float(self.get_playback_position() / length * 100) or 0
 
     def _player_cmd(self, cmd, signature="", *args):
         if self.mpris_player is None:
@@ -183,6 +291,15 @@ class GenericPlayer(ProgressCoreWidget):
     async def get_player_property(self, property):
         return await self._send_command("org.freedesktop.DBus.Properties", "Get", "ss", "org.mpris.MediaPlayer2.Player", property)
 
+    async def get_player_properties(self):
+        """
+        Every player property, in a single call.
+        :return: Dict of property name to variant.
+        """
+        return await self._send_command(
+            "org.freedesktop.DBus.Properties", "GetAll", "s", "org.mpris.MediaPlayer2.Player"
+        )
+
     def calculate_length(self):
         return super().calculate_length() + self._get_album_art_length()
 
@@ -205,17 +322,23 @@ class GenericPlayer(ProgressCoreWidget):
         # clear data when player is not active
         if not self._active and (self.progress or self.metadata):
             self.progress = 0
-            self.metadata = {}
+            self._clear_metadata()
             self.playback_status = "Stopped"
         # refresh metadata when active
         if self._active and not self.metadata:
             asyncio.create_task(self._refresh_metadata(), name="refresh_metadata")
         # refresh playback progress when active and option enabled
         if self._active and self.progress_bar_active and "mpris_length" in self.metadata:
-            asyncio.create_task(self._refresh_playback_progress(), name="refresh_playback_progress")
+            self._update_progress()
+            drift_check = self.position_drift_check
+            if drift_check and time.monotonic() - self._position_synced_at >= drift_check:
+                self._request_position()
+
+    def get_render_state(self, elements=None):
+        return (super().get_render_state(elements), self._active, self._album_art_image)
 
     def is_draw_update_required(self):
-        return self.pending_update or self._active
+        return self.pending_update or super().is_draw_update_required()
 
     def draw_between_elements(self, offset=0):
         if not self._active:
@@ -257,3 +380,22 @@ class GenericPlayer(ProgressCoreWidget):
 
     def cmd_open_url(self, url):
         self._player_cmd("OpenUrl", "s", url)
+
+    def cmd_dbus_info(self):
+        """
+        :return: Shared session bus state and latency of calls made through it.
+        """
+        return session_bus.info()
+
+    def cmd_players_info(self):
+        """
+        :return: Every running MPRIS player, as tracked by the shared registry.
+        """
+        return mpris_registry.info()
+
+    def finalize(self):
+        mpris_registry.unsubscribe(self)
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+        super().finalize()
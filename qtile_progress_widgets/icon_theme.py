@@ -0,0 +1,264 @@
+import asyncio
+from configparser import ConfigParser
+import os
+import re
+import time
+
+from .utils import create_logger
+
+
+_logger = create_logger("ICON_THEME")
+
+_EXTENSIONS = (".png", ".svg", ".xpm")
+
+
+def get_icon_dirs():
+    """
+    Icon base directories, by lookup priority, as defined by XDG icon theme spec.
+    """
+
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    data_dirs = (os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share").split(":")
+    dirs = [os.path.expanduser("~/.icons"), os.path.join(data_home, "icons")]
+    dirs += [os.path.join(d, "icons") for d in data_dirs if d]
+    return dirs
+
+
+def get_theme_name():
+    """
+    Active icon theme, as configured for GTK, falling back to hicolor.
+    """
+
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+
+    for version in ("gtk-4.0", "gtk-3.0"):
+        parser = ConfigParser(interpolation=None)
+        try:
+            parser.read(os.path.join(config_home, version, "settings.ini"))
+            name = parser.get("Settings", "gtk-icon-theme-name", fallback=None)
+        except Exception:
+            name = None
+        if name:
+            return name.strip().strip("\"'")
+
+    try:
+        with open(os.path.expanduser("~/.gtkrc-2.0")) as f:
+            match = re.search(r"gtk-icon-theme-name\s*=\s*\"?([^\"\n]+)", f.read())
+            if match:
+                return match.group(1).strip()
+    except OSError:
+        pass
+
+    return "hicolor"
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class _ThemeDir:
+    def __init__(self, path, section):
+        self.path = path
+        self.size = section.getint("Size", 0)
+        self.scale = section.getint("Scale", 1)
+        self.type = section.get("Type", "Threshold")
+        self.min_size = section.getint("MinSize", self.size)
+        self.max_size = section.getint("MaxSize", self.size)
+        self.threshold = section.getint("Threshold", 2)
+
+    def matches(self, size):
+        if self.type == "Fixed":
+            return self.size == size
+        if self.type == "Scalable":
+            return self.min_size <= size <= self.max_size
+        return self.size - self.threshold <= size <= self.size + self.threshold
+
+    def distance(self, size):
+        if self.type == "Fixed":
+            return abs(self.size * self.scale - size)
+        if self.type == "Scalable":
+            if size < self.min_size:
+                return self.min_size - size
+            if size > self.max_size:
+                return size - self.max_size
+            return 0
+        if size < self.size - self.threshold:
+            return self.size - self.threshold - size
+        if size > self.size + self.threshold:
+            return size - self.size - self.threshold
+        return 0
+
+
+class IconTheme:
+    """
+    Resolves icon names to files of the active icon theme, without Gtk. Theme directories,
+    along with the ones of inherited themes, are scanned once in the executor, building a
+    name to files index. Resolved icons are memoized and the index gets rebuilt when any
+    of the scanned directories changes.
+    """
+
+    def __init__(self, name=None, base_dirs=None, check_interval=30):
+        self.name = name
+        self.base_dirs = base_dirs
+        self.check_interval = check_interval
+        self.themes = []
+        self._index = {}
+        self._pixmaps = {}
+        self._mtimes = {}
+        self._resolved = {}
+        self._scan_task = None
+        self._checked_at = 0
+
+    def _read_theme(self, base_dirs, name):
+        for base in base_dirs:
+            index = os.path.join(base, name, "index.theme")
+            if not os.path.isfile(index):
+                continue
+            parser = ConfigParser(interpolation=None, strict=False)
+            try:
+                parser.read(index)
+            except Exception as e:
+                _logger.warning("failed to parse '%s': %s", index, str(e))
+                continue
+            return parser
+        return None
+
+    def _get_chain(self, base_dirs, name):
+        chain = []
+        seen = set()
+        # hicolor is the fallback theme of every theme, looked up last
+        pending = [name]
+
+        while pending:
+            theme = pending.pop(0)
+            if theme in seen:
+                continue
+            seen.add(theme)
+            parser = self._read_theme(base_dirs, theme)
+            if parser is None:
+                continue
+            chain.append((theme, parser))
+            inherits = parser.get("Icon Theme", "Inherits", fallback="")
+            pending += [t.strip() for t in inherits.split(",") if t.strip() and t.strip() != "hicolor"]
+
+        if "hicolor" not in seen:
+            parser = self._read_theme(base_dirs, "hicolor")
+            if parser is not None:
+                chain.append(("hicolor", parser))
+
+        return chain
+
+    def _scan(self):
+        base_dirs = self.base_dirs or get_icon_dirs()
+        name = self.name or get_theme_name()
+        index = {}
+        mtimes = {}
+        themes = []
+        # themes installed later are noticed through their base directory, missing ones included
+        for base in base_dirs:
+            mtimes[base] = _get_mtime(base)
+
+        for theme, parser in self._get_chain(base_dirs, name):
+            themes.append(theme)
+            icons = index[theme] = {}
+            subdirs = parser.get("Icon Theme", "Directories", fallback="")
+            subdirs += "," + parser.get("Icon Theme", "ScaledDirectories", fallback="")
+
+            for subdir in (d.strip() for d in subdirs.split(",")):
+                if not subdir or not parser.has_section(subdir):
+                    continue
+                for base in base_dirs:
+                    path = os.path.join(base, theme, subdir)
+                    try:
+                        mtimes[path] = os.stat(path).st_mtime
+                        files = os.listdir(path)
+                    except OSError:
+                        continue
+                    theme_dir = _ThemeDir(path, parser[subdir])
+                    for file in files:
+                        icon, ext = os.path.splitext(file)
+                        if ext in _EXTENSIONS:
+                            icons.setdefault(icon, []).append((theme_dir, os.path.join(path, file)))
+
+        pixmaps = {}
+        pixmaps_dir = "/usr/share/pixmaps"
+        try:
+            mtimes[pixmaps_dir] = os.stat(pixmaps_dir).st_mtime
+            for file in os.listdir(pixmaps_dir):
+                icon, ext = os.path.splitext(file)
+                if ext in _EXTENSIONS:
+                    pixmaps.setdefault(icon, os.path.join(pixmaps_dir, file))
+        except OSError:
+            pass
+
+        _logger.info("indexed icon themes %s, %d directories", themes, len(mtimes))
+        return themes, index, pixmaps, mtimes
+
+    def _is_outdated(self):
+        # nothing was found to watch last time
+        if not self._mtimes:
+            return True
+        return any(_get_mtime(path) != mtime for path, mtime in self._mtimes.items())
+
+    async def _rescan(self, check=False):
+        loop = asyncio.get_running_loop()
+
+        if check and not await loop.run_in_executor(None, self._is_outdated):
+            return
+
+        themes, index, pixmaps, mtimes = await loop.run_in_executor(None, self._scan)
+
+        from .images import image_loader
+        # decoded images of previously resolved icons might be outdated as well
+        image_loader.invalidate(set(self._resolved.values()))
+
+        self.themes, self._index, self._pixmaps, self._mtimes = themes, index, pixmaps, mtimes
+        self._resolved = {}
+
+    def _ensure_index(self):
+        if self._scan_task is None:
+            self._checked_at = time.monotonic()
+            self._scan_task = asyncio.ensure_future(self._rescan())
+        elif self._scan_task.done() and time.monotonic() - self._checked_at > self.check_interval:
+            self._checked_at = time.monotonic()
+            self._scan_task = asyncio.ensure_future(self._rescan(check=True))
+            # current index keeps serving lookups while checking
+            return None
+        return self._scan_task
+
+    def _lookup(self, name, size):
+        for theme in self.themes:
+            candidates = self._index.get(theme, {}).get(name)
+            if not candidates:
+                continue
+            for theme_dir, path in candidates:
+                if theme_dir.matches(size):
+                    return path
+            return min(candidates, key=lambda candidate: candidate[0].distance(size))[1]
+        return self._pixmaps.get(name)
+
+    async def resolve(self, name, size=48):
+        """
+        :return: Path of the icon closest to size, or None when not found.
+        """
+
+        task = self._ensure_index()
+        if task is not None and not task.done():
+            await asyncio.shield(task)
+
+        key = (name, size)
+        if key not in self._resolved:
+            self._resolved[key] = self._lookup(name, size)
+        return self._resolved[key]
+
+    def prepare(self):
+        """
+        Starts indexing ahead of the first lookup.
+        """
+        self._ensure_index()
+
+
+icon_theme = IconTheme()
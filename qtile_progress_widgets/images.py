@@ -0,0 +1,363 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import os
+import sys
+from urllib.parse import unquote, urlparse
+
+from .utils import create_logger
+
+
+_logger = create_logger("IMAGES")
+
+# cairo ARGB32 pixels are native endian words, the order of RGBA channels in memory
+_ARGB32_ORDER = (2, 1, 0, 3) if sys.byteorder == "little" else (3, 0, 1, 2)
+
+# pixbufs bigger than this, in bytes, are converted in the executor
+PIXBUF_INLINE_SIZE = 256 * 1024
+
+# numpy is imported on first use, None until then
+_np = None
+
+
+def _get_numpy():
+    global _np
+
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+
+    return _np
+
+
+def get_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "qtile-progress-widgets", "images")
+
+
+class SurfaceImage:
+    """
+    Image drawn from a cairo surface built in memory. Exposes the same width, height,
+    pattern and resize as libqtile's Img, so both can be drawn alike.
+    """
+
+    def __init__(self, surface, data=None):
+        self.surface = surface
+        # surfaces created for data do not own their pixels
+        self._data = data
+        self.default_size = (surface.get_width(), surface.get_height())
+        self.width, self.height = self.default_size
+        self._pattern = None
+
+    def resize(self, width=None, height=None):
+        w, h = self.default_size
+
+        if width and height:
+            self.width, self.height = width, height
+        elif width:
+            self.width, self.height = width, h * width / w
+        elif height:
+            self.width, self.height = w * height / h, height
+        else:
+            raise ValueError("You must supply either width or height!")
+
+        self._pattern = None
+
+    @property
+    def pattern(self):
+        if self._pattern is None:
+            import cairocffi
+
+            self._pattern = cairocffi.SurfacePattern(self.surface)
+            w, h = self.default_size
+            if (w, h) != (self.width, self.height):
+                matrix = cairocffi.Matrix()
+                matrix.scale(w / self.width, h / self.height)
+                self._pattern.set_matrix(matrix)
+                self._pattern.set_filter(cairocffi.FILTER_GOOD)
+
+        return self._pattern
+
+
+def _pixbuf_to_argb32_numpy(np, w, h, stride, has_alpha, channels, data, width):
+    # rows are read in place, last row is not required to be padded up to stride
+    if len(data) < (h - 1) * stride + w * channels:
+        raise ValueError("pixbuf data is smaller than its size")
+    pixels = np.lib.stride_tricks.as_strided(
+        np.frombuffer(data, dtype=np.uint8), shape=(h, w, channels), strides=(stride, channels, 1), writeable=False
+    )
+
+    factor = w // width if width else 1
+    if factor > 2:
+        # sample down to twice the width, box filter does the rest
+        step = factor // 2
+        pixels = pixels[::step, ::step]
+        factor = pixels.shape[1] // width
+
+    pixels = pixels.astype(np.uint16)
+    if has_alpha:
+        # cairo expects premultiplied alpha
+        pixels[..., :3] *= pixels[..., 3:4]
+        pixels[..., :3] += 127
+        pixels[..., :3] //= 255
+
+    if factor > 1:
+        h, w = pixels.shape[0] // factor, pixels.shape[1] // factor
+        pixels = pixels[:h * factor, :w * factor].reshape(h, factor, w, factor, channels).mean(axis=(1, 3))
+
+    h, w = pixels.shape[:2]
+    argb = np.empty((h, w, 4), dtype=np.uint8)
+    for index, channel in enumerate(_ARGB32_ORDER):
+        argb[..., index] = pixels[..., channel] if channel < 3 or has_alpha else 255
+
+    return w, h, argb
+
+
+def _pixbuf_to_argb32_pil(w, h, stride, has_alpha, channels, data, width):
+    from PIL import Image
+
+    mode = "RGBA" if has_alpha else "RGB"
+    # last row might not be padded up to stride
+    data = bytes(data).ljust(h * stride, b"\0")
+    im = Image.frombuffer(mode, (w, h), data, "raw", mode, stride, 1)
+
+    if width and w > width:
+        im = im.resize((width, max(1, round(h * width / w))), Image.BILINEAR)
+
+    bands = im.convert("RGBA").convert("RGBa").split()
+    im = Image.merge("RGBA", [bands[channel] for channel in _ARGB32_ORDER])
+
+    return im.width, im.height, bytearray(im.tobytes())
+
+
+def pixbuf_to_image(icon_data, width=None):
+    """
+    Converts notification pixbuf data straight to a cairo surface, shrinking it down to
+    width, when wider, before converting pixels. Uses numpy when available, PIL otherwise.
+    Pixbuf notification data:
+        0 - width
+        1 - height
+        2 - rowstride
+        3 - has_alpha
+        4 - bits_per_sample
+        5 - n_channels
+        6 - data
+    :return: SurfaceImage with provided width, at most.
+    """
+
+    import cairocffi
+
+    w, h, stride, has_alpha, bits_per_sample, channels, data = icon_data[:7]
+
+    if bits_per_sample != 8 or channels != (4 if has_alpha else 3):
+        raise ValueError("unsupported pixbuf format: %d bits, %d channels" % (bits_per_sample, channels))
+
+    np = _get_numpy()
+    if np:
+        w, h, pixels = _pixbuf_to_argb32_numpy(np, w, h, stride, has_alpha, channels, data, width)
+    else:
+        w, h, pixels = _pixbuf_to_argb32_pil(w, h, stride, has_alpha, channels, data, width)
+
+    surface = cairocffi.ImageSurface.create_for_data(pixels, cairocffi.FORMAT_ARGB32, w, h, w * 4)
+    img = SurfaceImage(surface, pixels)
+
+    if width and w > width:
+        img.resize(width=width)
+
+    return img
+
+
+class ImageLoader:
+    """
+    Loads images from paths or urls without blocking the event loop. Fetching, decoding and
+    resizing run in the executor, with bounded concurrency and a timeout for remote images.
+    Concurrent requests for the same image share a single load, and decoded images are kept,
+    already resized, in a memory LRU. Remote images can also be cached on disk.
+
+    Loaded images are shared, so they should not be resized by callers.
+    """
+
+    def __init__(self, max_size=128, concurrency=4, timeout=10, cache_dir=None):
+        self.max_size = max_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._pending = {}
+        self._semaphore = None
+
+    @staticmethod
+    def _get_local_path(source):
+        if source.startswith("file://"):
+            return unquote(urlparse(source).path)
+        return os.path.expanduser(source)
+
+    def _get_disk_path(self, source):
+        return os.path.join(self.cache_dir, hashlib.sha1(source.encode()).hexdigest())
+
+    def _fetch(self, source, disk_cache):
+        if disk_cache:
+            path = self._get_disk_path(source)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    return f.read()
+
+        import requests
+        response = requests.get(source, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.content
+
+        if disk_cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = self._get_disk_path(source) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._get_disk_path(source))
+
+        return data
+
+    def _read(self, source, disk_cache):
+        if isinstance(source, bytes):
+            return source
+
+        path = self._get_local_path(source)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return f.read()
+
+        import validators
+        if validators.url(source):
+            return self._fetch(source, disk_cache)
+
+        raise Exception("'%s' is neither a valid path nor a url." % source)
+
+    @staticmethod
+    def _decode(data, width, height, shrink_only):
+        from libqtile.images import Img
+
+        img = Img(data)
+
+        if shrink_only:
+            w, h = img.default_size
+            width = width if width and w > width else None
+            height = height if height and h > height else None
+            if width and height:
+                # keep aspect ratio, fitting both limits
+                width, height = (width, None) if w / width >= h / height else (None, height)
+
+        if width or height:
+            img.resize(width=width, height=height)
+
+        # decode and scale right away, off the event loop
+        img.pattern
+        return img
+
+    def _load(self, source, width, height, shrink_only, disk_cache):
+        return self._decode(self._read(source, disk_cache), width, height, shrink_only)
+
+    def _store(self, key, img):
+        self._images[key] = img
+        while len(self._images) > self.max_size:
+            self._images.popitem(last=False)
+
+    async def load_pixbuf(self, icon_data, width=None):
+        """
+        Converts pixbuf data, as sent by notifications, shrunk to width. Big images are
+        converted in the executor. Pixbufs are not cached.
+        """
+
+        if len(icon_data[6]) <= PIXBUF_INLINE_SIZE:
+            return pixbuf_to_image(icon_data, width)
+
+        return await asyncio.get_running_loop().run_in_executor(None, pixbuf_to_image, icon_data, width)
+
+    def get_cached(self, source, width=None, height=None, shrink_only=False):
+        key = (source, width, height, shrink_only)
+        img = self._images.get(key)
+        if img is not None:
+            self.hits += 1
+            self._images.move_to_end(key)
+        return img
+
+    async def load(self, source, width=None, height=None, shrink_only=False, disk_cache=False):
+        """
+        Loads image, resized to width and/or height, keeping aspect ratio when only one is provided.
+        With shrink_only, images are only resized when bigger than provided sizes.
+        Bytes sources are decoded, but not cached.
+        """
+
+        if isinstance(source, bytes):
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._decode, source, width, height, shrink_only
+            )
+
+        img = self.get_cached(source, width, height, shrink_only)
+        if img is not None:
+            return img
+
+        key = (source, width, height, shrink_only)
+        pending = self._pending.get(key)
+        if pending is None:
+            self.misses += 1
+            # loaded in a task of its own, so cancelling any caller, even the first one,
+            # leaves the load running for the rest of them
+            pending = self._pending[key] = asyncio.ensure_future(
+                self._load_pending(key, source, width, height, shrink_only, disk_cache)
+            )
+            # errors are re-raised to callers, if any is still waiting
+            pending.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        return await asyncio.shield(pending)
+
+    async def _load_pending(self, key, source, width, height, shrink_only, disk_cache):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        try:
+            async with self._semaphore:
+                img = await asyncio.get_running_loop().run_in_executor(
+                    None, self._load, source, width, height, shrink_only, disk_cache
+                )
+            self._store(key, img)
+            return img
+        finally:
+            del self._pending[key]
+
+    def load_sync(self, source, width=None, height=None, shrink_only=False, disk_cache=False):
+        """
+        Blocking version of load, sharing the same memory cache.
+        """
+
+        if isinstance(source, bytes):
+            return self._decode(source, width, height, shrink_only)
+
+        img = self.get_cached(source, width, height, shrink_only)
+        if img is None:
+            self.misses += 1
+            img = self._load(source, width, height, shrink_only, disk_cache)
+            self._store((source, width, height, shrink_only), img)
+        return img
+
+    def invalidate(self, sources):
+        """
+        Drops cached images, at any size, of provided sources.
+        """
+        for key in [key for key in self._images if key[0] in sources]:
+            del self._images[key]
+
+    def clear(self):
+        self._images.clear()
+
+    def info(self):
+        return dict(
+            size=len(self._images), max_size=self.max_size, hits=self.hits, misses=self.misses,
+            pending=len(self._pending),
+        )
+
+
+image_loader = ImageLoader()
@@ -0,0 +1,122 @@
+from bisect import bisect_left
+
+from libqtile.confreader import ConfigError
+
+from .utils import create_logger
+
+
+_logger = create_logger("LIMITS")
+
+# integer progress values resolved through a direct lookup table,
+# -1 is included since widgets use it as a special state (muted, charging...)
+LUT_MIN = -1
+LUT_MAX = 100
+
+
+def is_in_limits(value, limits):
+    lower, upper = limits
+    return lower <= value <= upper
+
+
+class LimitsIndex:
+    """
+    Compiled version of a list of ((lower, upper), value) entries, as used by widget
+    icons and colors options. Entries keep their original semantics: limits are inclusive
+    and, when overlapping, the first declared entry wins.
+
+    Limits are split into disjoint segments once, so a lookup is either a direct access
+    to the integer lookup table or a bisect over the segment boundaries.
+    Lookups return None when no entry matches the value.
+    """
+
+    def __init__(self, entries, name="limits"):
+        self.name = name
+        self.entries = self._validate(entries or [], name)
+
+        points = sorted({bound for (limits, _) in self.entries for bound in limits})
+        self._points = points
+        # value of each boundary point
+        self._at_point = [self._first_match(p) for p in points]
+        # value of each open segment between two consecutive boundary points
+        self._between = [self._first_match((a + b) / 2) for a, b in zip(points, points[1:])]
+
+        self._lut = [self._search(v) for v in range(LUT_MIN, LUT_MAX + 1)]
+
+    @staticmethod
+    def _validate(entries, name):
+        validated = []
+
+        for entry in entries:
+            try:
+                (lower, upper), value = entry
+            except (TypeError, ValueError):
+                raise ConfigError("Invalid entry in '%s': %r. Expected ((lower, upper), value)" % (name, entry))
+            if lower > upper:
+                raise ConfigError("Invalid limits in '%s': %r. Lower limit is above upper limit" % (name, entry))
+            validated.append(((lower, upper), value))
+
+        ordered = sorted((limits for limits, _ in validated))
+        if not ordered:
+            return validated
+
+        # limits reaching furthest so far, as ranges can be nested inside wider ones
+        widest = ordered[0]
+
+        for lower, upper in ordered[1:]:
+            if lower < widest[1]:
+                # shared boundaries are common and fine, first declared entry wins
+                _logger.warning(
+                    "'%s' limits %s and %s overlap, first declared one wins", name, widest, (lower, upper),
+                )
+            elif lower > widest[1]:
+                _logger.debug("'%s' has no entry between %s and %s", name, widest[1], lower)
+
+            if upper > widest[1]:
+                widest = (lower, upper)
+
+        return validated
+
+    def _first_match(self, value):
+        for limits, entry_value in self.entries:
+            if is_in_limits(value, limits):
+                return entry_value
+        return None
+
+    def _search(self, value):
+        points = self._points
+        i = bisect_left(points, value)
+        if i < len(points) and points[i] == value:
+            return self._at_point[i]
+        if i == 0 or i == len(points):
+            # outside every limit
+            return None
+        return self._between[i - 1]
+
+    def lookup(self, value):
+        i = int(value)
+        if i == value and LUT_MIN <= i <= LUT_MAX:
+            return self._lut[i - LUT_MIN]
+        return self._search(value)
+
+    def classes(self):
+        """
+        Distinct values of the index, along with the class of each boundary point and of each
+        segment between consecutive points, allowing vectorized lookups of any value by
+        searching the points. Values outside every limit belong to the class of None.
+        :return: Tuple of values, points, point classes and segment classes.
+        """
+
+        values = [None]
+
+        def get_class(value):
+            if value not in values:
+                values.append(value)
+            return values.index(value)
+
+        point_ids = [get_class(value) for value in self._at_point]
+        between_ids = [get_class(value) for value in self._between]
+
+        return values, list(self._points), point_ids, between_ids
+
+    def __len__(self):
+        return len(self.entries)
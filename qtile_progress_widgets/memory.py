@@ -33,9 +33,7 @@ class Memory(ProgressInFutureWidget):
         self.calc_swap = self.measures[self.measure_swap]
         self.values = {}
 
-    def _get_values(self):
-        mem = psutil.virtual_memory()
-        swap = psutil.swap_memory()
+    def _get_values(self, mem, swap):
         values = {
             "MemUsed": mem.used / self.calc_mem, "MemTotal": mem.total / self.calc_mem,
             "MemFree": mem.free / self.calc_mem, "MemPercent": mem.percent,
@@ -52,6 +50,15 @@ class Memory(ProgressInFutureWidget):
             return ""
         return self.text_format.format(**self.values)
 
-    def update_data(self):
-        self.values = self._get_values()
+    def get_source_key(self):
+        return "memory"
+
+    def sample_data(self):
+        return psutil.virtual_memory(), psutil.swap_memory()
+
+    def on_source_data(self, data):
+        self.values = self._get_values(*data)
         self.progress = float(self.values["MemPercent"])
+
+    def update_data(self):
+        self.on_source_data(self.sample_data())
@@ -0,0 +1,231 @@
+import asyncio
+import time
+
+from dbus_next.constants import MessageType
+from dbus_next.signature import Variant
+
+from .session_bus import session_bus
+from .utils import create_logger
+
+
+_logger = create_logger("MPRIS")
+
+MPRIS_NAMESPACE = "org.mpris.MediaPlayer2"
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+PLAYER_INTERFACE = "org.mpris.MediaPlayer2.Player"
+
+
+def get_short_name(name):
+    """
+    Player name without the MPRIS namespace, e.g. 'spotify' or 'vlc.instance1234'.
+    """
+    return name[len(MPRIS_NAMESPACE) + 1:] if name.startswith(MPRIS_NAMESPACE + ".") else name
+
+
+class _PlayerState:
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self.status = "Stopped"
+        self.active_at = time.monotonic()
+
+
+class PlayerRegistry:
+    """
+    Tracks every MPRIS player on the session bus, through one set of match rules shared by
+    every player widget. Players are discovered once connected, and followed through
+    NameOwnerChanged signals, filtered by the bus daemon to MPRIS names only. Signals from
+    players are dispatched to listeners of the player sending them.
+
+    Listeners implement on_player_properties(name, updated), on_player_seeked(name,
+    position) and on_player_owner_changed(name, running).
+    """
+
+    def __init__(self):
+        self.players = {}
+        # unique bus name to names of its players, as signals are sent from unique names,
+        # and a single connection might own several names, e.g. vlc and vlc.instance1234
+        self._owners = {}
+        self._listeners = []
+        self._starting = None
+
+    async def _start(self):
+        await session_bus.add_match(
+            self._on_name_owner_changed,
+            sender="org.freedesktop.DBus",
+            interface="org.freedesktop.DBus",
+            member="NameOwnerChanged",
+            arg0namespace=MPRIS_NAMESPACE,
+        )
+        await session_bus.add_match(
+            self._on_properties_changed,
+            interface="org.freedesktop.DBus.Properties",
+            member="PropertiesChanged",
+            path=MPRIS_PATH,
+            arg0=PLAYER_INTERFACE,
+        )
+        await session_bus.add_match(
+            self._on_seeked,
+            interface=PLAYER_INTERFACE,
+            member="Seeked",
+            path=MPRIS_PATH,
+        )
+        # players might have come and gone while disconnected
+        session_bus.add_connect_callback(self._discover)
+        await self._discover()
+
+    @staticmethod
+    async def _call(destination, path, interface, member, signature="", body=None):
+        try:
+            reply = await session_bus.call(destination, path, interface, member, signature, body)
+        except Exception as e:
+            _logger.warning("failed to call '%s' on %s: %s", member, destination, str(e))
+            return None
+
+        if reply is None or reply.message_type != MessageType.METHOD_RETURN or not reply.body:
+            return None
+        body = reply.body[0]
+        return body.value if isinstance(body, Variant) else body
+
+    async def _call_bus(self, member, signature="", body=None):
+        return await self._call(
+            "org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus", member, signature, body
+        )
+
+    async def _discover(self):
+        names = await self._call_bus("ListNames")
+        if names is None:
+            return
+
+        names = [name for name in names if name.startswith(MPRIS_NAMESPACE + ".")]
+        for name in set(self.players) - set(names):
+            self._remove(name)
+
+        owners = await asyncio.gather(*(self._call_bus("GetNameOwner", "s", [name]) for name in names))
+        added = [self._add(name, owner) for name, owner in zip(names, owners) if owner]
+        # ranking of players relies on their status
+        await asyncio.gather(*(self._fetch_status(state) for state in added if state is not None))
+
+        _logger.info("discovered players: %s", names)
+
+    async def _fetch_status(self, state):
+        status = await self._call(
+            state.name, MPRIS_PATH, "org.freedesktop.DBus.Properties", "Get", "ss", [PLAYER_INTERFACE, "PlaybackStatus"]
+        )
+        if status is not None and self.players.get(state.name) is state:
+            state.status = status
+
+    def _add(self, name, owner):
+        """
+        :return: State of player, or None when already known.
+        """
+
+        state = self.players.get(name)
+        if state is not None and state.owner == owner:
+            return None
+        if state is not None:
+            self._discard_owner(state)
+
+        state = self.players[name] = _PlayerState(name, owner)
+        self._owners.setdefault(owner, set()).add(name)
+
+        _logger.debug("player %s started", name)
+        self._dispatch(name, "on_player_owner_changed", True)
+        return state
+
+    def _remove(self, name):
+        state = self.players.pop(name, None)
+        if state is None:
+            return
+        self._discard_owner(state)
+
+        _logger.debug("player %s stopped", name)
+        self._dispatch(name, "on_player_owner_changed", False)
+
+    def _discard_owner(self, state):
+        names = self._owners.get(state.owner)
+        if names is None:
+            return
+        names.discard(state.name)
+        if not names:
+            del self._owners[state.owner]
+
+    def _dispatch(self, name, method, *args):
+        for listener, player in list(self._listeners):
+            if player is not None and player != name:
+                continue
+            try:
+                getattr(listener, method)(name, *args)
+            except Exception as e:
+                _logger.exception("failed to dispatch %s of %s: %s", method, name, str(e))
+
+    def _on_name_owner_changed(self, msg):
+        name, old, new = msg.body
+        if old and not new:
+            self._remove(name)
+        elif new:
+            state = self._add(name, new)
+            if state is not None:
+                asyncio.create_task(self._fetch_status(state))
+
+    def _on_properties_changed(self, msg):
+        updated = msg.body[1]
+
+        for name in sorted(self._owners.get(msg.sender, ())):
+            state = self.players[name]
+            state.active_at = time.monotonic()
+            if "PlaybackStatus" in updated:
+                state.status = updated["PlaybackStatus"].value
+
+            self._dispatch(name, "on_player_properties", updated)
+
+    def _on_seeked(self, msg):
+        for name in sorted(self._owners.get(msg.sender, ())):
+            self.players[name].active_at = time.monotonic()
+            self._dispatch(name, "on_player_seeked", msg.body[0])
+
+    async def subscribe(self, listener, name=None):
+        """
+        Dispatches signals of player name, or of every player when None, to listener.
+        Players get discovered with the first subscription.
+        """
+
+        self._listeners.append((listener, name))
+
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        await asyncio.shield(self._starting)
+
+    def unsubscribe(self, listener):
+        self._listeners = [(lst, name) for lst, name in self._listeners if lst is not listener]
+
+    def is_running(self, name):
+        return name in self.players
+
+    def get_most_active(self, priority=()):
+        """
+        Ranks players by playing ones first, then by priority, a list of short names, and
+        then by most recent activity.
+        :return: Player name, or None when none is running.
+        """
+
+        def rank(state):
+            short_name = get_short_name(state.name)
+            index = next(
+                (i for i, p in enumerate(priority) if short_name == p or short_name.startswith(p + ".")),
+                len(priority)
+            )
+            return state.status == "Playing", -index, state.active_at
+
+        if not self.players:
+            return None
+        return max(self.players.values(), key=rank).name
+
+    def info(self):
+        return dict(
+            players={name: dict(owner=state.owner, status=state.status) for name, state in self.players.items()},
+            listeners=len(self._listeners),
+        )
+
+
+mpris_registry = PlayerRegistry()
@@ -0,0 +1,70 @@
+from .generic_player import GenericPlayer
+from .mpris import mpris_registry
+from .utils import create_logger
+
+
+_logger = create_logger("MPRIS_PLAYER")
+
+
+class MprisPlayer(GenericPlayer):
+    """
+    Follows whichever MPRIS player is the most active one, instead of a single player.
+    """
+
+    defaults = [
+        ("icons", [
+            ((0, 100), "\uf001"),
+        ], "Icons to present inside progress bar, based on progress limits."),
+        ("text_mode", "with_icon", "Show text mode. Use 'with_icon' or 'without_icon'. Empty to not show."),
+        (
+            "player_priority",
+            [],
+            "Players to follow first, by their names without 'org.mpris.MediaPlayer2.' prefix, e.g. 'spotify'. "
+            "Playing players always come first, and players with the same priority are ranked by most recent activity."
+        ),
+    ]
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.add_defaults(MprisPlayer.defaults)
+
+    async def _config_async(self):
+        await mpris_registry.subscribe(self)
+        self._follow()
+
+    def _follow(self):
+        """
+        Switches to the most active player, when it's not the followed one already.
+        :return: Whether or not followed player changed.
+        """
+
+        name = mpris_registry.get_most_active(self.player_priority)
+        if name == self.mpris_player:
+            return False
+
+        _logger.debug("following %s, instead of %s", name, self.mpris_player)
+        self.mpris_player = name
+
+        # state of followed player gets refreshed on next update
+        self._clear_metadata()
+        self.progress = 0
+        self.playback_status = "Stopped"
+        self.playback_rate = 1.0
+        self._sync_position(0)
+        self.on_player_owner_changed(name, name is not None)
+        return True
+
+    def on_player_properties(self, name, updated):
+        if self._follow() or name != self.mpris_player:
+            return
+        super().on_player_properties(name, updated)
+
+    def on_player_seeked(self, name, position):
+        if name != self.mpris_player:
+            return
+        super().on_player_seeked(name, position)
+
+    def on_player_owner_changed(self, name, running):
+        if self._follow() or name != self.mpris_player:
+            return
+        super().on_player_owner_changed(name, running)
@@ -1,32 +1,133 @@
 import time
 
+from libqtile import pangocffi
 from libqtile.pangocffi import markup_escape_text
 from libqtile.popup import Popup
 
 
 class NotificationInfo:
-    def __init__(self, id, created_at, content, icon):
+    """
+    Notification as kept in history. Icon is the source it was loaded from, path or url,
+    so it can be decoded again when needed.
+    """
+
+    def __init__(self, id, created_at, content, icon, app_name="", summary="", body="", urgency=1):
         self.id = id
         self.created_at = created_at
         self.content = content
         self.icon = icon
+        self.app_name = app_name
+        self.summary = summary
+        self.body = body
+        self.urgency = urgency
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _escape_text(text, markup):
+    if markup:
+        return markup_escape_text(text)
+    return text
+
+
+def format_content(summary, body, app_name, config):
+    """
+    Formats notification text, as shown in popups, out of popup config.
+    """
+
+    text = ""
+    markup = config.get("markup", False)
+
+    def mod(t):
+        return t
+
+    app_mod = config.get("app_name_modifier", None) or mod
+    summary_mod = config.get("summary_modifier", None) or mod
+    body_mod = config.get("body_modifier", None) or mod
+
+    if app_name:
+        text += config.get("app_name_fmt", "{}").format(_escape_text(app_mod(app_name), markup))
+    text += config.get("summary_fmt", "{}").format(_escape_text(summary_mod(summary), markup))
+    if body:
+        text += config.get("body_fmt", "{}").format(_escape_text(body_mod(body), markup))
+
+    return text
+
+
+class PopupPool:
+    """
+    Keeps a bounded number of hidden popup windows, to be reused by later notifications
+    instead of creating, and destroying, a window for each one.
+    """
+
+    def __init__(self, qtile, max_size):
+        self.qtile = qtile
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._popups = []
+
+    @staticmethod
+    def _reconfigure(popup, config):
+        # same as configurable, user config overrides defaults
+        for key, value in config.items():
+            setattr(popup, key, value)
+
+        popup.win.opacity = popup.opacity
+        popup.layout.colour = popup.foreground
+        popup.layout.font_family = popup.font
+        popup.layout.font_size = popup.fontsize
+        popup.layout.font_shadow = popup.fontshadow
+        popup.layout.layout.set_alignment(pangocffi.ALIGNMENTS[popup.text_alignment])
+
+        if popup.border_width and popup.border:
+            popup.win.paint_borders(popup.border, popup.border_width)
+
+    def acquire(self, config):
+        if not self._popups:
+            self.misses += 1
+            return Popup(self.qtile, **config)
+
+        self.hits += 1
+        popup = self._popups.pop()
+        self._reconfigure(popup, config)
+        return popup
+
+    def release(self, popup):
+        if len(self._popups) >= self.max_size:
+            popup.kill()
+            return
+
+        popup.hide()
+        # drop reference to the notification using it
+        popup.win.process_button_click = popup.process_button_click
+        self._popups.append(popup)
+
+    def clear(self):
+        for popup in self._popups:
+            popup.kill()
+        self._popups = []
+
+    def info(self):
+        return dict(size=len(self._popups), max_size=self.max_size, hits=self.hits, misses=self.misses)
 
 
 class NotificationPopup:
-    def __init__(self, manager, notification, on_timeout, on_click, icon=None, lifetime=None, **config):
+    def __init__(self, manager, notification, info, on_timeout, on_click, icon=None, lifetime=None, **config):
         self.id = notification.id
         self.manager = manager
+        self.info = info
 
-        self.popup = Popup(manager.qtile, **config)
+        self.popup = manager.popup_pool.acquire(config)
         self.popup.layout.width = self.popup.width - self.popup.horizontal_padding * 2
         self.popup.layout.markup = config.get("markup", False)
 
-        self.popup.text = self.content = self._get_content(
-            notification.summary,
-            notification.body,
-            notification.app_name,
-            config,
-        )
+        self.popup.text = self.content = info.content
 
         if icon:
             img_w = config.get("image_width", 0)
@@ -35,13 +136,8 @@ class NotificationPopup:
             self.popup.layout.width -= icon.width + self.popup.horizontal_padding
 
         self.icon = icon
-
-        self.popup.height = max(
-            self.popup.height,
-            self.popup.layout.height,
-            icon and icon.height or 0
-        )
-        self.popup.height += self.popup.vertical_padding * 2
+        self._min_height = self.popup.height
+        self._fit()
 
         self.popup.win.process_button_click = lambda *_: on_click(self)
         self.on_timeout = lambda: on_timeout(self)
@@ -51,34 +147,45 @@ class NotificationPopup:
         self.alive = False
         self.killed = False
         self.future = None
+        self.closing = False
         self.x = self.y = None
-        self.created_at = time.strftime("%Y-%m-%d %H:%M")
+        # vertical offset from the top of the stack
+        self.stack_offset = 0
+
+        # identical notifications shown by this popup
+        self.key = (notification.app_name, notification.summary, notification.body)
+        self.count = 1
+        self.coalesced_ids = []
+        self.last_seen = time.monotonic()
 
     def __getattr__(self, __name):
         return getattr(self.popup, __name)
 
-    def _escape_text(self, text):
-        if self.popup.layout.markup:
-            return markup_escape_text(text)
-        return text
-
-    def _get_content(self, summary, body, app_name, config):
-        text = ""
+    def _fit(self):
+        self.popup.height = max(
+            self._min_height,
+            self.popup.layout.height,
+            self.icon and self.icon.height or 0
+        )
+        self.popup.height += self.popup.vertical_padding * 2
 
-        def mod(t):
-            return t
+    def coalesce(self, notification, count_fmt):
+        """
+        Shows an identical notification in this popup, updating its count badge.
+        """
 
-        app_mod = config.get("app_name_modifier", None) or mod
-        summary_mod = config.get("summary_modifier", None) or mod
-        body_mod = config.get("body_modifier", None) or mod
+        self.count += 1
+        self.coalesced_ids.append(notification.id)
+        self.last_seen = time.monotonic()
 
-        if app_name:
-            text += config.get("app_name_fmt", "{}").format(self._escape_text(app_mod(app_name)))
-        text += config.get("summary_fmt", "{}").format(self._escape_text(summary_mod(summary)))
-        if body:
-            text += config.get("body_fmt", "{}").format(self._escape_text(body_mod(body)))
+        self.popup.text = self.content + count_fmt.format(self.count)
+        self._fit()
 
-        return text
+        # draw it again, restarting its lifetime
+        self.x = self.y = None
+        if self.future:
+            self.future.cancel()
+            self.future = None
 
     def show(self, x, y):
         if self.killed:
@@ -123,21 +230,25 @@ class NotificationPopup:
             self.future = self.manager.timeout_add(self.lifetime, self.on_timeout)
 
     def is_replaced_by(self, notif):
-        return notif.replaces_id == self.id
+        return notif.replaces_id == self.id or notif.replaces_id in self.coalesced_ids
+
+    def has_id(self, nid):
+        return nid == self.id or nid in self.coalesced_ids
 
     def mark_for_kill(self):
         # when not alive but still not killed, manager will take care of killing
         # self, keeping show/kill logic in the update loop
         self.alive = False
+        self.closing = True
 
     def kill(self):
         if self.killed:
             return
         if self.future:
             self.future.cancel()
-        self.popup.kill()
+        self.manager.popup_pool.release(self.popup)
         self.killed = True
         self.alive = not self.killed
 
     def get_info(self):
-        return NotificationInfo(self.id, self.created_at, self.content, self.icon)
+        return self.info
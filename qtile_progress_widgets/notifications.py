@@ -1,43 +1,49 @@
-import io
+import asyncio
+from collections import deque
 import os
+import time
 
-from PIL import Image
-from dbus_next.constants import MessageType
-from libqtile.notify import ClosedReason, Notification, notifier
-from libqtile.utils import _send_dbus_message
+from libqtile.confreader import ConfigError
+from libqtile.notify import ClosedReason, notifier
 
-from .notification_popup import NotificationPopup
+from .icon_theme import icon_theme
+from .images import image_loader
+from .notification_popup import NotificationInfo, NotificationPopup, PopupPool, format_content
 from .progress_widget import ProgressCoreWidget
-from .utils import create_logger, get_cairo_image, get_gtk_icon
+from .utils import LazyMessage, create_logger, get_data_dir
 
 
 _logger = create_logger("NOTIFICATIONS")
 
 
-def pixbuf_to_image_bytes(icon_data):
+class _Loading:
     """
-    Convert gdkpixbuf data to PIL image.
-    Pixbuf notification data:
-        0 - width
-        1 - height
-        2 - rowstride
-        3 - has_alpha
-        4 - bits_per_sample
-        5 - n_channels
-        6 - data
+    Notification admitted for display while its icon loads, along with identical ones received
+    meanwhile, coalesced into its popup once displayed.
     """
 
-    w = icon_data[0]
-    h = icon_data[1]
-    stride = icon_data[2]
-    mode = "RGB" if not icon_data[3] else "RGBA"
-    data = icon_data[6]
+    def __init__(self, notification):
+        self.notification = notification
+        self.followers = []
+        # closed or replaced while loading
+        self.dropped = False
 
-    im = Image.frombytes(mode, (w, h), data, "raw", mode, stride)
-    img_byte_arr = io.BytesIO()
-    im.save(img_byte_arr, format='PNG')
 
-    return img_byte_arr.getvalue()
+class _Pending:
+    """
+    Notification waiting for room to be displayed, along with identical ones received meanwhile,
+    coalesced into its popup once displayed.
+    """
+
+    def __init__(self, notification, config):
+        self.notification = notification
+        self.config = config
+        self.followers = []
+        self.last_seen = time.monotonic()
+
+    def coalesce(self, notification, count_fmt):
+        self.followers.append(notification)
+        self.last_seen = time.monotonic()
 
 
 class Notifications(ProgressCoreWidget):
@@ -54,6 +60,36 @@ class Notifications(ProgressCoreWidget):
         ], "Icons to present inside progress bar, based on progress limits."),
         ("default_timeout", 10, "Default notification timeout, when notification does not have one."),
         ("max_missed", 50, "Max number of missed notifications saved. These can be revisited or cleared."),
+        (
+            "history_file",
+            None,
+            "File keeping missed notifications across restarts. When None, uses notifications.jsonl in "
+            "widgets' data directory. Empty string keeps them in memory only."
+        ),
+        ("max_visible_notifications", 10, "Max popups displayed at once. Next ones wait in pending queue."),
+        ("max_pending_notifications", 20, "Max notifications waiting to be displayed."),
+        (
+            "pending_policy",
+            "drop_oldest",
+            "What to drop when pending queue is full: 'drop_oldest' or 'drop_newest'. "
+            "Dropped notifications are stored in notifications center, when enabled."
+        ),
+        (
+            "coalesce_window",
+            5,
+            "Identical notifications (app, summary and body) arriving within this many seconds are "
+            "shown by the same popup, along with a count. 0 disables it."
+        ),
+        ("coalesce_fmt", " <b>({})</b>", "Format of the count of coalesced notifications."),
+        (
+            "app_rate_limit",
+            None,
+            "Max notifications displayed per app within app_rate_period seconds. Next ones go straight "
+            "to notifications center, when enabled, without any popup. None disables it."
+        ),
+        ("app_rate_period", 60, "Period, in seconds, of app_rate_limit."),
+        ("max_pooled_popups", 5, "Hidden popup windows kept to be reused by next notifications. 0 disables it."),
+        ("icon_theme", None, "Icon theme used to look up app icons. When None, uses the one configured for GTK."),
         (
             "popup_pos_x",
             lambda qtile, bar, popup: bar.screen.width - popup.width - 5,
@@ -149,6 +185,12 @@ class Notifications(ProgressCoreWidget):
             "Whether or not to enable notifications center. When enabled, bar widget will start "
             "monitoring the unread box left space. When clicked, the widget will toggle notifications center."
         ),
+        (
+            "counter",
+            "stored",
+            "What the bar counts: 'stored' notifications, kept in notifications center, or 'unread' ones, "
+            "stored since the center was last opened."
+        ),
     ]
     server_hints = {
         "urgency": ("urgency",),
@@ -168,29 +210,50 @@ class Notifications(ProgressCoreWidget):
         super().__init__(**config)
         self.add_defaults(Notifications.defaults)
         self._popup_config = None
+        # displayed popups in stack order, newest first
         self.displaying = []
         self.center = None
+        self.popup_pool = None
+        self._closing = []
+        # index of the first popup that needs to be placed again
+        self._stack_dirty = 0
+        self._anchor = None
+        self._anchor_key = None
+        # notifications waiting for room to be displayed
+        self._pending = deque()
+        # notifications loading their icon, by coalescing key
+        self._loading = {}
+        self._app_history = {}
+        self.coalesced = 0
+        self.dropped = 0
+        self.rate_limited = 0
         _logger.info("initialized")
 
-    @staticmethod
-    def _get_notification_icon(notification, hints):
-        app_icon = notification.app_icon
+    async def _get_icon_source(self, notification, hints):
+        """
+        :return: Path or url of notification icon, or None when it has none or it's sent as raw data.
+        """
 
-        if app_icon:
-            icon_path = get_gtk_icon(app_icon)
+        for icon in (notification.app_icon, hints.get("icon_name")):
+            if not icon:
+                continue
+            if icon.startswith("file://") or os.path.isabs(icon):
+                # icon is a path to an os' file
+                return icon
+            icon_path = await icon_theme.resolve(icon, self.popup_image_width)
             if icon_path:
-                # icon was found in current gtk theme
-                return get_cairo_image(icon_path)
-            if os.path.exists(app_icon):
-                # icon is an abs path to an os' file
-                return get_cairo_image(app_icon)
+                # icon was found in current theme
+                return icon_path
 
-        if "icon_name" in hints:
-            return get_cairo_image(hints["icon_name"])
+        return None
+
+    async def _get_notification_icon(self, icon_source, hints):
+        if icon_source:
+            # icons are loaded already fitting the popup
+            return await image_loader.load(icon_source, width=self.popup_image_width, shrink_only=True)
 
         if "icon_data" in hints:
-            img_bytes = pixbuf_to_image_bytes(hints["icon_data"])
-            return get_cairo_image(img_bytes, bytes_img=True)
+            return await image_loader.load_pixbuf(hints["icon_data"], self.popup_image_width)
 
         return None
 
@@ -199,24 +262,51 @@ class Notifications(ProgressCoreWidget):
             _logger.warning("update_interval will be ignored. widget updates itself based on notifications")
             self.update_interval = None
 
+        if self.pending_policy not in ("drop_oldest", "drop_newest"):
+            raise ConfigError("Invalid pending_policy: '%s'. Use 'drop_oldest' or 'drop_newest'" % self.pending_policy)
+
+        if self.counter not in ("stored", "unread"):
+            raise ConfigError("Invalid counter: '%s'. Use 'stored' or 'unread'" % self.counter)
+
         super()._configure(qtile, bar)
         self._prepare_popup_config()
+        if self.popup_pool is not None:
+            # configured again, e.g. on screen changes, hidden popups of the previous pool are killed
+            self.popup_pool.clear()
+        self.popup_pool = PopupPool(qtile, self.max_pooled_popups)
+
+        if self.icon_theme is not None:
+            icon_theme.name = self.icon_theme
+        icon_theme.prepare()
 
         if self.notif_center_enabled:
             # create notifications center
             from .notifications_center import NotificationsCenter
+            history_file = self.history_file
+            if history_file is None:
+                history_file = os.path.join(get_data_dir(), "notifications.jsonl")
             self.center = NotificationsCenter(qtile, 0, 0, 200, bar.screen.height, {
                 "background": "000000"
-            })
+            }, max_size=self.max_missed, history_file=history_file, icon_size=self.popup_image_width)
 
             # enable mouse callbacks
             self.add_callbacks({
-                "Button1": lambda: self.center.toggle()
+                "Button1": self._toggle_center
             })
 
+    def _toggle_center(self):
+        self.center.toggle()
+        # opening the center marks notifications as read
+        self.update()
+
     async def _config_async(self):
         await notifier.register(self._on_notification, ("actions", "body"), self._on_notification_close)
 
+        if self.center is not None:
+            await self.center.load()
+            # stored count includes notifications read from history
+            self.update()
+
     def _prepare_popup_config(self):
         if self._popup_config is not None:
             return
@@ -233,13 +323,10 @@ class Notifications(ProgressCoreWidget):
             value = getattr(self, key, None)
             if value is None:
                 value = getattr(self, k, None)
-            if k == "fontsize":
-                # font size is a special case, since all widgets use
-                # fontsize, and popups use font_size
-                k = "font_size"
             self._popup_config[k] = value
 
-    def _on_notification(self, notification):
+    @staticmethod
+    def _describe_notification(notification):
         log = ""
         for key, value in notification.__dict__.items():
             if key == "hints":
@@ -251,33 +338,236 @@ class Notifications(ProgressCoreWidget):
                 log += "\n"
                 continue
             log += "%s: %s\n" % (key, value)
-        _logger.info(log)
+        return log
+
+    def _on_notification(self, notification):
+        _logger.info("%s", LazyMessage(self._describe_notification, notification))
 
-        self.qtile.call_soon_threadsafe(self._queue_notification, notification)
+        self.qtile.call_soon_threadsafe(lambda: asyncio.create_task(self._queue_notification(notification)))
 
     def _on_notification_close(self, nid):
         for popup in self.displaying:
-            if popup.id == nid:
+            if popup.has_id(nid):
                 self._close_notification(popup, ClosedReason.method, False)
+        self._drop_pending(lambda notification: notification.id == nid)
+        self._drop_loading(nid)
         self.update()
 
-    def _queue_notification(self, notification):
-        hints = self._get_notification_hints(notification)
+    def _drop_pending(self, predicate):
+        for pending in [pending for pending in self._pending if predicate(pending.notification)]:
+            self._pending.remove(pending)
+            # identical ones are admitted again on their own
+            for n in pending.followers:
+                if not predicate(n):
+                    asyncio.create_task(self._queue_notification(n))
 
-        self.displaying.append(NotificationPopup(
-            self,
-            notification,
-            on_timeout=self._expire_notification,
-            on_click=self._dismiss_notification,
-            **self._get_notification_config(notification, hints),
-        ))
+        for pending in self._pending:
+            pending.followers = [n for n in pending.followers if not predicate(n)]
+
+    def _drop_loading(self, nid):
+        for loading in self._loading.values():
+            if loading.notification.id == nid:
+                loading.dropped = True
+            loading.followers = [n for n in loading.followers if n.id != nid]
+
+    def _is_rate_limited(self, notification):
+        if self.app_rate_limit is None:
+            return False
+
+        now = time.monotonic()
+        history = self._app_history.setdefault(notification.app_name, deque())
+        while history and now - history[0] > self.app_rate_period:
+            history.popleft()
+
+        if len(history) >= self.app_rate_limit:
+            return True
+
+        history.append(now)
+        return False
+
+    @staticmethod
+    def _get_key(notification):
+        return notification.app_name, notification.summary, notification.body
+
+    def _find_identical(self, notification):
+        if not self.coalesce_window:
+            return None
+
+        key = self._get_key(notification)
+        now = time.monotonic()
+
+        for popup in self.displaying:
+            if popup.key == key and not popup.closing and now - popup.last_seen <= self.coalesce_window:
+                return popup
+
+        for pending in self._pending:
+            if self._get_key(pending.notification) == key and now - pending.last_seen <= self.coalesce_window:
+                return pending
+
+        return None
+
+    def _get_visible_count(self):
+        return sum(1 for popup in self.displaying if not popup.closing)
+
+    def _store_missed(self, info):
+        if not self.notif_center_enabled:
+            return
+
+        self.center.store_notification(info)
+
+    def _store_without_popup(self, notification, config, reason):
+        """
+        Stores notification in the center, without ever creating a popup for it.
+        """
+
+        self._store_missed(config["info"])
+        notifier._service.NotificationClosed(notification.id, reason)
 
+    @staticmethod
+    def _get_urgency(hints):
+        urgency = hints.get("urgency")
+        if urgency in ["l", "L", 0]:
+            return 0
+        if urgency in ["c", "C", 2]:
+            return 2
+        return 1
+
+    def _coalesce(self, target, notification):
+        """
+        Coalesces notification into a displayed popup, or a pending notification.
+        """
+
+        self.coalesced += 1
+        target.coalesce(notification, self.coalesce_fmt)
+        if isinstance(target, _Pending):
+            return
+        self._stack_dirty = min(self._stack_dirty, self.displaying.index(target))
+
+    async def _queue_notification(self, notification):
+        hints = self._get_notification_hints(notification)
+        config = self._get_notification_config(notification, hints)
+
+        # admission is decided before any await, so notifications of a burst see each other
         for n in self.displaying:
             if n.is_replaced_by(notification):
                 self._close_notification(n, ClosedReason.dismissed, False)
+        self._drop_pending(lambda n: n.id == notification.replaces_id)
+        self._drop_loading(notification.replaces_id)
+
+        identical = self._find_identical(notification)
+        if identical is not None:
+            self._coalesce(identical, notification)
+            self.update()
+            return
+
+        key = self._get_key(notification)
+        loading = self._loading.get(key) if self.coalesce_window else None
+        if loading is not None and not loading.dropped:
+            # identical to one still loading its icon, coalesced into its popup once displayed
+            loading.followers.append(notification)
+            return
+
+        rate_limited = self._is_rate_limited(notification)
+        if not rate_limited:
+            loading = self._loading[key] = _Loading(notification)
+
+        try:
+            await self._load_notification(notification, hints, config, not rate_limited)
+        finally:
+            if loading is not None and self._loading.get(key) is loading:
+                del self._loading[key]
+
+        if rate_limited:
+            self.rate_limited += 1
+            self._store_without_popup(notification, config, ClosedReason.expired)
+            self.update()
+            return
+
+        target = None
+        if not loading.dropped:
+            if self._get_visible_count() >= self.max_visible_notifications or self._pending:
+                target = self._queue_pending(notification, config)
+            else:
+                target = self._display(notification, config)
+
+        for n in loading.followers:
+            if target is not None:
+                self._coalesce(target, n)
+            else:
+                # nothing to coalesce into, as it was dropped
+                asyncio.create_task(self._queue_notification(n))
 
         self.update()
 
+    async def _load_notification(self, notification, hints, config, with_icon):
+        icon_source = None
+        try:
+            icon_source = await self._get_icon_source(notification, hints)
+        except Exception as e:
+            _logger.error("failed to find notification icon: %s", str(e))
+
+        config["info"] = NotificationInfo(
+            notification.id,
+            time.time(),
+            format_content(notification.summary, notification.body, notification.app_name, config),
+            icon_source,
+            notification.app_name,
+            notification.summary,
+            notification.body,
+            self._get_urgency(hints),
+        )
+
+        if not with_icon:
+            return
+
+        try:
+            config["icon"] = await self._get_notification_icon(icon_source, hints)
+        except Exception as e:
+            _logger.error("failed to load notification icon: %s", str(e))
+
+    def _store_pending(self, pending):
+        self._store_without_popup(pending.notification, pending.config, ClosedReason.expired)
+        # stored once, as their popup would have been
+        for n in pending.followers:
+            notifier._service.NotificationClosed(n.id, ClosedReason.expired)
+
+    def _queue_pending(self, notification, config):
+        """
+        :return: Pending notification, or None when it was dropped right away.
+        """
+
+        pending = _Pending(notification, config)
+
+        if len(self._pending) >= self.max_pending_notifications:
+            self.dropped += 1
+            if self.pending_policy == "drop_newest":
+                self._store_pending(pending)
+                return None
+            self._store_pending(self._pending.popleft())
+
+        self._pending.append(pending)
+        return pending
+
+    def _display(self, notification, config):
+        popup = NotificationPopup(
+            self,
+            notification,
+            on_timeout=self._expire_notification,
+            on_click=self._dismiss_notification,
+            **config,
+        )
+        self.displaying.insert(0, popup)
+        self._stack_dirty = 0
+        return popup
+
+    def _display_pending(self):
+        while self._pending and self._get_visible_count() < self.max_visible_notifications:
+            pending = self._pending.popleft()
+            popup = self._display(pending.notification, pending.config)
+            # already counted as coalesced
+            for n in pending.followers:
+                popup.coalesce(n, self.coalesce_fmt)
+
     def _get_notification_hints(self, notification):
         hints = {}
         for internal_id, hint_keys in self.server_hints.items():
@@ -298,39 +588,19 @@ class Notifications(ProgressCoreWidget):
             lifetime = notification.timeout / 1000
         config["lifetime"] = lifetime
 
-        # get icon
-        # this process takes a toll on performace... can we optimize this? @performance
-        config["icon"] = self._get_notification_icon(notification, hints)
-
         # get urgency and update colors, when available
         if "urgency" in hints:
-            urgency = hints["urgency"]
-            affected_props = ["foreground", "background", "border", "border_width"]
+            prefix = ("low", "normal", "critical")[self._get_urgency(hints)]
 
-            def update_urgency_attribute(prefix, attr):
+            for attr in ["foreground", "background", "border", "border_width"]:
                 override = config.get("%s_%s" % (prefix, attr), None)
                 if override is not None:
                     config[attr] = override
 
-            if urgency in ["l", "L", 0]:
-                for attr in affected_props:
-                    update_urgency_attribute("low", attr)
-            elif urgency in ["n", "N", 1]:
-                for attr in affected_props:
-                    update_urgency_attribute("normal", attr)
-            elif urgency in ["c", "C", 2]:
-                for attr in affected_props:
-                    update_urgency_attribute("critical", attr)
-
         return config
 
     def _expire_notification(self, popup):
-        if self.notif_center_enabled:
-            self.center.store_notification(popup.get_info())
-
-            while len(self.center.stored) > self.max_missed:
-                self.center.stored.pop(0)
-
+        self._store_missed(popup.get_info())
         self._close_notification(popup, ClosedReason.expired)
 
     def _dismiss_notification(self, popup):
@@ -338,7 +608,9 @@ class Notifications(ProgressCoreWidget):
 
     def _close_notification(self, popup, reason, update=True):
         popup.mark_for_kill()
-        notifier._service.NotificationClosed(popup.id, reason)
+        self._closing.append(popup)
+        for nid in [popup.id] + popup.coalesced_ids:
+            notifier._service.NotificationClosed(nid, reason)
 
         if update:
             self.update()
@@ -353,26 +625,74 @@ class Notifications(ProgressCoreWidget):
             return self.popup_pos_y(self.qtile, self.bar, popup)
         return self.popup_pos_y
 
+    def _get_count(self):
+        if self.counter == "unread":
+            return self.center.unread
+        return len(self.center.history)
+
     def get_text(self):
         if not self.notif_center_enabled:
             return ""
-        return len(self.center.stored)
+        return self._get_count()
 
-    def update_data(self):
+    def _get_anchor(self, popup):
+        """
+        Position of the newest popup, evaluated again only when screen geometry changes.
+        """
+
+        screen = self.bar.screen
+        key = (screen.x, screen.y, screen.width, screen.height, self.bar.height, popup.width)
+
+        if key != self._anchor_key:
+            self._anchor_key = key
+            self._anchor = (self._get_popup_x(popup), self._get_popup_y(popup))
+            self._stack_dirty = 0
+
+        return self._anchor
+
+    def _remove_closed(self):
+        for popup in self._closing:
+            if popup.killed:
+                continue
+            popup.kill()
+            try:
+                index = self.displaying.index(popup)
+            except ValueError:
+                continue
+            del self.displaying[index]
+            # popups below the removed one move up
+            self._stack_dirty = min(self._stack_dirty, index)
+
+        self._closing = []
+
+    def _layout_stack(self):
+        if not self.displaying:
+            self._stack_dirty = 0
+            return
+
+        x, y = self._get_anchor(self.displaying[0])
+        start = self._stack_dirty
         offset = 0
 
-        for popup in reversed(self.displaying):
-            if not popup.born or popup.alive:
-                popup.show(x=self._get_popup_x(popup), y=self._get_popup_y(popup) + offset)
-                offset += popup.height + self.popup_margin
-            elif not popup.alive and not popup.killed:
-                # kill marked for kill popups
-                popup.kill()
+        if start > 0:
+            previous = self.displaying[start - 1]
+            offset = previous.stack_offset + previous.height + self.popup_margin
+
+        for popup in self.displaying[start:]:
+            popup.stack_offset = offset
+            # popups already in place are not placed again
+            popup.show(x=x, y=y + offset)
+            offset += popup.height + self.popup_margin
 
-        self.displaying = [p for p in self.displaying if p.alive]
+        self._stack_dirty = len(self.displaying)
+
+    def update_data(self):
+        self._remove_closed()
+        self._display_pending()
+        self._layout_stack()
 
         if self.notif_center_enabled:
-            self.progress = len(self.center.stored) / self.max_missed * 100
+            self.progress = min(self._get_count() / self.max_missed * 100, 100)
 
     def finalize(self):
         self.qtile.call_soon_threadsafe(self._finalize)
@@ -383,4 +703,50 @@ class Notifications(ProgressCoreWidget):
         if task:
             await task
 
+        self.popup_pool.clear()
+        if self.center is not None:
+            await self.center.finalize()
         super().finalize()
+
+    def cmd_popup_pool_info(self):
+        """
+        :return: Pooled popup windows and how many notifications reused one (hits) or created one (misses).
+        """
+        return self.popup_pool.info()
+
+    def cmd_search_history(self, query="", app=None, urgency=None, since=None, until=None, limit=20):
+        """
+        Searches notifications center history. Each word of query matches words starting with it,
+        in app name, summary or body. Urgency is 'low', 'normal' or 'critical'. Since and until are
+        timestamps or durations ago, like '30m', '2h' or '1d'.
+        :return: Matching notifications, newest first.
+        """
+
+        if self.center is None:
+            return []
+
+        return [info.to_dict() for info in self.center.history.search(query, app, urgency, since, until, limit)]
+
+    def cmd_filter_center(self, query="", app=None, urgency=None, since=None, until=None):
+        """
+        Opens notifications center listing only notifications matching provided filters, same as in
+        search_history. Without any, lists all of them.
+        """
+
+        if self.center is None:
+            return
+
+        self.center.set_filter(query, app, urgency, since, until)
+        if self.center.active:
+            self.center.draw()
+        else:
+            self._toggle_center()
+
+    def cmd_admission_info(self):
+        """
+        :return: Displayed and pending notifications, along with coalesced, dropped and rate limited counts.
+        """
+        return dict(
+            displaying=self._get_visible_count(), pending=len(self._pending), coalesced=self.coalesced,
+            dropped=self.dropped, rate_limited=self.rate_limited,
+        )
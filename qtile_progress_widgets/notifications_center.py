@@ -1,33 +1,493 @@
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from itertools import islice
+import json
+import os
+import re
+import time
+
 from libqtile.popup import Popup
+
+from .images import image_loader
+from .notification_popup import NotificationInfo
 from .utils import create_logger
 
 _logger = create_logger("center")
 
+_token = re.compile(r"\w+")
+_duration = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+URGENCIES = ("low", "normal", "critical")
+
+
+def tokenize(text):
+    return _token.findall((text or "").lower())
+
+
+def parse_time(value):
+    """
+    Parses either a timestamp or a duration ago, like '30m', '2h' or '1d'.
+    :return: Timestamp, or None when value is None.
+    """
+
+    if value is None or isinstance(value, (int, float)):
+        return value
+
+    match = _duration.match(value.strip())
+    if match:
+        return time.time() - float(match.group(1)) * _units[match.group(2)]
+
+    return float(value)
+
+
+def parse_urgency(value):
+    """
+    Parses urgency, either its name or level.
+    :return: Urgency level, or None when value is None.
+    """
+
+    if not isinstance(value, str):
+        return value
+
+    try:
+        return URGENCIES.index(value.lower())
+    except ValueError:
+        raise ValueError("Invalid urgency: '%s'. Use 'low', 'normal' or 'critical'" % value) from None
+
+
+class _HistoryIndex:
+    """
+    Inverted index over history entries, updated as they get stored. Entries are referred
+    to by a sequence number, growing with each entry, so posting lists stay sorted and
+    evicted entries are skipped by bisecting. Index is rebuilt once stale postings add up.
+    """
+
+    def __init__(self):
+        self.seq = 0
+        self.first_seq = 0
+        self.entries = {}
+        self._tokens = {}
+        self._sorted_tokens = []
+        self._apps = {}
+        self._urgencies = {}
+        self._seqs = []
+        self._times = []
+
+    def add(self, info):
+        seq = self.seq
+        self.seq += 1
+        self.entries[seq] = info
+
+        tokens = set(tokenize(info.app_name)) | set(tokenize(info.summary)) | set(tokenize(info.body))
+        for token in tokens:
+            postings = self._tokens.get(token)
+            if postings is None:
+                postings = self._tokens[token] = []
+                insort(self._sorted_tokens, token)
+            postings.append(seq)
+
+        self._apps.setdefault((info.app_name or "").lower(), []).append(seq)
+        self._urgencies.setdefault(info.urgency, []).append(seq)
+        self._seqs.append(seq)
+        self._times.append(info.created_at)
+
+    def evict(self, count):
+        for seq in range(self.first_seq, self.first_seq + count):
+            self.entries.pop(seq, None)
+        self.first_seq += count
+
+        if self.first_seq - (self._seqs[0] if self._seqs else self.first_seq) > max(len(self.entries), 64):
+            self._rebuild()
+
+    def _rebuild(self):
+        entries = [self.entries[seq] for seq in sorted(self.entries)]
+        self.__init__()
+        for info in entries:
+            self.add(info)
+
+    def _live(self, postings):
+        return postings[bisect_left(postings, self.first_seq):]
+
+    def _match_prefix(self, prefix):
+        seqs = set()
+        start = bisect_left(self._sorted_tokens, prefix)
+        for token in islice(self._sorted_tokens, start, None):
+            if not token.startswith(prefix):
+                break
+            seqs.update(self._live(self._tokens[token]))
+        return seqs
+
+    def _time_range(self, since, until):
+        start = bisect_left(self._times, since) if since is not None else 0
+        end = bisect_right(self._times, until) if until is not None else len(self._times)
+        return set(self._live(self._seqs[start:end]))
+
+    def search(self, query="", app=None, urgency=None, since=None, until=None):
+        """
+        Every query term matches as a prefix of app name, summary or body words.
+        :return: Matching sequence numbers, newest first.
+        """
+
+        candidates = None
+
+        def narrow(seqs):
+            nonlocal candidates
+            candidates = seqs if candidates is None else candidates & seqs
+
+        for term in tokenize(query):
+            narrow(self._match_prefix(term))
+        if app is not None:
+            narrow(set(self._live(self._apps.get(app.lower(), []))))
+        if urgency is not None:
+            narrow(set(self._live(self._urgencies.get(urgency, []))))
+        if since is not None or until is not None:
+            narrow(self._time_range(since, until))
+
+        if candidates is None:
+            candidates = self.entries.keys()
+
+        return sorted((seq for seq in candidates if seq in self.entries), reverse=True)
+
+
+class NotificationsHistory:
+    """
+    Ring buffer of the latest notifications, backed by an append-only log file. Log is read,
+    once, in the executor, and appended entries are written to it in batches, in the executor
+    as well. It gets compacted once it holds twice as many entries as kept.
+    """
+
+    def __init__(self, max_size, path=None):
+        self.max_size = max_size
+        self.path = path
+        # without a log, there's nothing to load
+        self.loaded = not path
+        self._entries = deque(maxlen=max_size)
+        self._index = _HistoryIndex()
+        self._logged = 0
+        # entries appended, waiting to be written
+        self._unwritten = []
+        self._load_task = None
+        self._flush_task = None
+        self._io_lock = None
+
+    async def _run_io(self, func, *args):
+        # file operations run one at a time, in the order they were requested
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+
+        async with self._io_lock:
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return [], 0
+
+        entries = deque(maxlen=self.max_size)
+        logged = 0
+        with open(self.path) as f:
+            for line in f:
+                logged += 1
+                try:
+                    entries.append(NotificationInfo.from_dict(json.loads(line)))
+                except (ValueError, TypeError) as e:
+                    _logger.warning("skipping invalid history entry: %s", str(e))
+
+        return list(entries), logged
+
+    def load(self):
+        """
+        Reads the log, unless read already. Until then, only entries appended meanwhile are listed.
+        :return: Task reading the log.
+        """
+
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._load())
+        return self._load_task
+
+    async def _load(self):
+        if self.loaded:
+            return
+
+        try:
+            entries, logged = await self._run_io(self._read)
+        except OSError as e:
+            _logger.error("failed to read notifications history: %s", str(e))
+            entries, logged = [], 0
+
+        # cleared meanwhile
+        if self.loaded:
+            return
+
+        # entries appended meanwhile are only written once the log is read
+        appended = list(self._entries)
+        self._entries = deque(maxlen=self.max_size)
+        self._index = _HistoryIndex()
+        for info in entries + appended:
+            self._add(info)
+        self._logged = logged
+        self.loaded = True
+        _logger.info("loaded %d notifications from history", len(entries))
+
+    def _write(self, batch, compacted=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        if compacted is None:
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(info.to_dict()) + "\n" for info in batch))
+            return
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("".join(json.dumps(info.to_dict()) + "\n" for info in compacted))
+        os.replace(tmp, self.path)
+
+    async def _flush(self):
+        try:
+            await self.load()
+
+            # entries appended while writing are written in the next batch
+            while self._unwritten:
+                batch, self._unwritten = self._unwritten, []
+                compacted = None
+                self._logged += len(batch)
+                if self._logged > self.max_size * 2:
+                    compacted = list(self._entries)
+                    self._logged = len(compacted)
+
+                try:
+                    await self._run_io(self._write, batch, compacted)
+                except OSError as e:
+                    _logger.error("failed to write notifications to history: %s", str(e))
+        finally:
+            self._flush_task = None
+
+    def _truncate(self):
+        if os.path.isfile(self.path):
+            open(self.path, "w").close()
+
+    def _add(self, info):
+        if len(self._entries) == self.max_size:
+            self._index.evict(1)
+        self._entries.append(info)
+        self._index.add(info)
+
+    def append(self, info):
+        self._add(info)
+
+        if not self.path:
+            return
+
+        self._unwritten.append(info)
+        if self._flush_task is None:
+            # a burst of notifications is written at once
+            self._flush_task = asyncio.ensure_future(self._flush())
+
+    def newest(self, start=0, count=None):
+        """
+        :return: Iterator over entries, newest first.
+        """
+        return islice(reversed(self._entries), start, None if count is None else start + count)
+
+    def search(self, query="", app=None, urgency=None, since=None, until=None, limit=None):
+        """
+        Searches entries through their index. Urgency is either its name or level, and time
+        bounds are either timestamps or durations ago, like '1d'.
+        :return: Matching entries, newest first.
+        """
+
+        seqs = self._index.search(query, app, parse_urgency(urgency), parse_time(since), parse_time(until))
+        return [self._index.entries[seq] for seq in seqs[:limit]]
+
+    def clear(self):
+        self._entries.clear()
+        self._index = _HistoryIndex()
+        self.loaded = True
+        if self.path:
+            self._unwritten = []
+            self._logged = 0
+            asyncio.ensure_future(self._run_io(self._truncate))
+
+    async def close(self):
+        """
+        Waits for appended entries to be written.
+        """
+        if self._flush_task is not None:
+            await self._flush_task
+
+    def __len__(self):
+        return len(self._entries)
+
 
 class NotificationsCenter:
-    def __init__(self, qtile, x, y, width, height, config):
+    """
+    Popup listing notifications history. Only visible rows are laid out and painted, and
+    only their icons get decoded.
+    """
+
+    def __init__(self, qtile, x, y, width, height, config, max_size=50, history_file=None, row_height=60,
+                 icon_size=40, padding=5):
         self.popup = Popup(qtile, x, y, width, height, **config)
+        self.popup.win.process_button_click = self.process_button_click
         self.active = False
         self.max_height = self.popup.height
-        self.stored = []
+        self.history = NotificationsHistory(max_size, history_file)
+        self.row_height = row_height
+        self.icon_size = icon_size
+        self.padding = padding
+        # notifications stored since center was last shown
+        self.unread = 0
+        # index of first visible row
+        self.scroll = 0
+        # entries matching current filter, newest first, or None when not filtering
+        self.filtered = None
+        self._filter = None
+        self._loading = set()
+        self._failed = set()
 
     def store_notification(self, notif_info):
-        self.stored.append(notif_info)
+        self.history.append(notif_info)
+        self.unread += 1
+        if self.active:
+            self._apply_filter()
+            self.draw()
 
-    def show(self):
+    def set_filter(self, query="", app=None, urgency=None, since=None, until=None):
+        """
+        Lists only notifications matching provided filters. Without any, lists all of them.
+        """
+
+        filters = dict(query=query, app=app, urgency=urgency, since=since, until=until)
+        if not any(filters.values()):
+            filters = None
+
+        # invalid filters raise before replacing current ones
+        self.filtered = self.history.search(**filters) if filters else None
+        self._filter = filters
+        self.scroll = 0
+
+    def _apply_filter(self):
+        self.filtered = self.history.search(**self._filter) if self._filter else None
+
+    def _get_rows(self, start, count):
+        if self.filtered is None:
+            return self.history.newest(start, count)
+        return self.filtered[start:start + count]
+
+    def _get_rows_count(self):
+        if self.filtered is None:
+            return len(self.history)
+        return len(self.filtered)
+
+    def get_visible_rows(self):
+        return max(1, self.popup.height // self.row_height)
+
+    def _get_icon(self, source):
+        if not source or source in self._failed:
+            return None
+
+        img = image_loader.get_cached(source, width=self.icon_size, shrink_only=True)
+        if img is None and source not in self._loading:
+            self._loading.add(source)
+            asyncio.create_task(self._load_icon(source))
+
+        return img
+
+    async def _load_icon(self, source):
+        try:
+            await image_loader.load(source, width=self.icon_size, shrink_only=True)
+        except Exception as e:
+            _logger.warning("failed to load icon '%s': %s", source, str(e))
+            self._failed.add(source)
+            return
+        finally:
+            self._loading.discard(source)
+
+        if self.active:
+            self.draw()
+
+    def _draw_row(self, info, y):
+        ctx = self.popup.drawer.ctx
+        x = self.padding
+
+        img = self._get_icon(info.icon)
+        if img is not None:
+            ctx.save()
+            ctx.translate(x, y + (self.row_height - img.height) / 2)
+            ctx.set_source(img.pattern)
+            ctx.paint()
+            ctx.restore()
+        if info.icon:
+            x += self.icon_size + self.padding
+
+        layout = self.popup.layout
+        layout.width = self.popup.width - x - self.padding
+        layout.text = "<small>%s</small>\n%s" % (
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(info.created_at)), info.content
+        )
+
+        # long notifications are cut at row bounds
+        ctx.save()
+        ctx.rectangle(0, y, self.popup.width, self.row_height)
+        ctx.clip()
+        layout.draw(x, y + self.padding)
+        ctx.restore()
+
+    def draw(self):
         self.popup.clear()
-        for notif in self.stored:
-            if notif.content:
-                _logger.warning(notif.content)
+
+        rows = self.get_visible_rows()
+        for row, info in enumerate(self._get_rows(self.scroll, rows)):
+            self._draw_row(info, row * self.row_height)
+
         self.popup.draw()
+
+    def scroll_by(self, rows):
+        last = max(0, self._get_rows_count() - self.get_visible_rows())
+        scroll = min(max(0, self.scroll + rows), last)
+        if scroll != self.scroll:
+            self.scroll = scroll
+            self.draw()
+
+    def process_button_click(self, x, y, button):
+        if button == 4:
+            self.scroll_by(-1)
+        elif button == 5:
+            self.scroll_by(1)
+        elif button == 1:
+            self.hide()
+
+    def show(self):
+        self.unread = 0
+        self.scroll = 0
+        self._apply_filter()
+        self.draw()
         self.popup.unhide()
         self.active = True
 
     def hide(self):
         self.popup.hide()
         self.active = False
+        # filters only last while shown, center lists everything when opened again
+        self._filter = None
+        self.filtered = None
 
     def toggle(self):
         if self.active:
             return self.hide()
         return self.show()
+
+    async def load(self):
+        """
+        Reads history ahead, so it's there when center is first shown.
+        """
+
+        await self.history.load()
+        if self.active:
+            self._apply_filter()
+            self.draw()
+
+    async def finalize(self):
+        await self.history.close()
+        self.popup.kill()
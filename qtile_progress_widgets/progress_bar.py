@@ -1,10 +1,58 @@
+from collections import OrderedDict
+from functools import lru_cache
 import math
 
+import cairocffi
+from libqtile.utils import rgb
 from libqtile.widget.base import PaddingMixin
 
 
+_parse_color = lru_cache(maxsize=256)(rgb)
+
+
+class _RingCache:
+    """
+    LRU of pre-rendered rings, shared by every progress bar. Bars with the same geometry
+    and colors end up reusing the same surfaces.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._surfaces = OrderedDict()
+
+    def get(self, key, render):
+        surface = self._surfaces.get(key)
+
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self._surfaces[key] = render()
+
+        while len(self._surfaces) > self.max_size:
+            _, evicted = self._surfaces.popitem(last=False)
+            evicted.finish()
+
+        return surface
+
+    def clear(self):
+        for surface in self._surfaces.values():
+            surface.finish()
+        self._surfaces.clear()
+
+    def info(self):
+        return dict(size=len(self._surfaces), max_size=self.max_size, hits=self.hits, misses=self.misses)
+
+
+ring_cache = _RingCache()
+
+
 class ProgressBar(PaddingMixin):
-    def __init__(self, drawer, bar, width, height, thickness, **config):
+    def __init__(self, drawer, bar, width, height, thickness, cache=False, **config):
         super().__init__(**config)
         self.add_defaults(PaddingMixin.defaults)
 
@@ -29,13 +77,22 @@ class ProgressBar(PaddingMixin):
 
         size = max(self.width, self.height)
         self.radius = (size - (self.padding * 2)) / 2
+        # number of distinct arc lengths the ring can show, roughly one per pixel of circumference
+        self.steps = max(1, math.ceil(2 * math.pi * self.radius))
 
         self.thickness = thickness
+        # when caching, rings are rendered once per state and blitted afterwards
+        self.cache = cache
+        self._surface_size = (math.ceil(self.total_width), math.ceil(bar_size))
+        self._geometry = (thickness, self.total_width, bar_size, self.scale_x, self.scale_y, self.radius)
         self.percentage = 0
         self.completed = "ffffff"
         self.remaining = "000000"
         self.inner = ""
 
+    def quantize(self, percentage):
+        return round(percentage / 100 * self.steps)
+
     def update(self, percentage, completed, remaining, inner):
         self.percentage = percentage
         self.completed = completed
@@ -45,8 +102,54 @@ class ProgressBar(PaddingMixin):
     def draw_with_current_data(self, offset=0):
         return self.draw(self.percentage, self.completed, self.remaining, self.inner, offset)
 
+    def _is_cacheable(self, *colors):
+        # gradients are not cached, only plain color strings
+        return all(color is None or isinstance(color, str) for color in colors)
+
+    def _render_ring(self, step, completed, remaining, inner):
+        surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, *self._surface_size)
+        ctx = cairocffi.Context(surface)
+        end_angle = step / self.steps * 2 * math.pi
+        radius = self.radius - self.thickness / 2
+
+        ctx.scale(self.scale_x, self.scale_y)
+        ctx.set_line_width(self.thickness)
+
+        if inner:
+            ctx.set_source_rgba(*_parse_color(inner))
+            ctx.arc(self.x, self.y, radius, 0, 2 * math.pi)
+            ctx.fill()
+
+        ctx.set_source_rgba(*_parse_color(completed))
+        ctx.arc(self.x, self.y, radius, 0, end_angle)
+        ctx.stroke()
+
+        ctx.set_source_rgba(*_parse_color(remaining))
+        ctx.arc(self.x, self.y, radius, end_angle, 2 * math.pi)
+        ctx.stroke()
+
+        surface.flush()
+        return surface
+
+    def _draw_cached(self, step, completed, remaining, inner, offset):
+        key = (step, completed, remaining, inner) + self._geometry
+        surface = ring_cache.get(key, lambda: self._render_ring(step, completed, remaining, inner))
+
+        self.drawer.ctx.save()
+        # offset is applied in scaled space when drawing directly, keep it that way
+        self.drawer.ctx.translate(offset * self.scale_x, 0)
+        self.drawer.ctx.set_source_surface(surface, 0, 0)
+        self.drawer.ctx.paint()
+        self.drawer.ctx.restore()
+
     def draw(self, percentage, completed=None, remaining=None, inner=None, offset=0):
-        end_angle = percentage / 100 * 2 * math.pi
+        completed = completed or "ffffff"
+        remaining = remaining or "000000"
+
+        if self.cache and self._is_cacheable(completed, remaining, inner):
+            return self._draw_cached(self.quantize(percentage), completed, remaining, inner or None, offset)
+
+        end_angle = self.quantize(percentage) / self.steps * 2 * math.pi
 
         self.drawer.ctx.save()
 
@@ -62,12 +165,12 @@ class ProgressBar(PaddingMixin):
             self.drawer.ctx.fill()
 
         # draw completed
-        self.drawer.set_source_rgb(completed or "ffffff")
+        self.drawer.set_source_rgb(completed)
         self.drawer.ctx.arc(x, self.y, radius, 0, end_angle)
         self.drawer.ctx.stroke()
 
         # draw remaining
-        self.drawer.set_source_rgb(remaining or "000000")
+        self.drawer.set_source_rgb(remaining)
         self.drawer.ctx.arc(x, self.y, radius, end_angle, 2 * math.pi)
         self.drawer.ctx.stroke()
 
@@ -1,3 +1,4 @@
+from collections import OrderedDict, namedtuple
 import math
 
 from libqtile import bar
@@ -5,12 +6,59 @@ from libqtile.confreader import ConfigError
 from libqtile.pangocffi import markup_escape_text
 from libqtile.widget import base
 
-from .progress_bar import ProgressBar
-from .utils import create_logger
+from . import frames
+from .clock import tick_clock
+from .limits import LimitsIndex
+from .progress_bar import ProgressBar, ring_cache
+from .sources import DataSource, get_sources_info, subscribe
+from .utils import create_logger, set_log_level
 
 
 _logger = create_logger("CORE")
 
+# resolved output of the core draw elements, None for inactive elements
+_Elements = namedtuple("_Elements", "progress_bar icon text")
+
+
+class LayoutExtentsCache:
+    """
+    Measured extents of text layouts, shared by every widget, keyed by text, font, font size,
+    markup, wrapping and layout width. Identical strings, like the ones of the same widget on
+    every screen, get shaped once to be measured.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._extents = OrderedDict()
+
+    def get(self, key, measure):
+        """
+        :return: Cached (width, height) of key, calling measure when missing.
+        """
+
+        extents = self._extents.get(key)
+        if extents is not None:
+            self.hits += 1
+            self._extents.move_to_end(key)
+            return extents
+
+        self.misses += 1
+        extents = self._extents[key] = measure()
+        if len(self._extents) > self.max_size:
+            self._extents.popitem(last=False)
+        return extents
+
+    def clear(self):
+        self._extents.clear()
+
+    def info(self):
+        return dict(size=len(self._extents), max_size=self.max_size, hits=self.hits, misses=self.misses)
+
+
+layout_extents = LayoutExtentsCache()
+
 
 class _LayoutHandler:
     def __init__(self, widget):
@@ -21,13 +69,13 @@ class _LayoutHandler:
     def width(self):
         if not self.configured:
             return 0
-        return self.layout.width
+        return self._get_extents()[0]
 
     @property
     def height(self):
         if not self.configured:
             return 0
-        return self.layout.height
+        return self._get_extents()[1]
 
     @property
     def text(self):
@@ -36,21 +84,44 @@ class _LayoutHandler:
         return self.layout.text
 
     def configure(self, fontsize=None):
+        self.fontsize = fontsize or self.widget.fontsize
+
         # create text layout
         self.layout = self.widget.drawer.textlayout(
-            "", "ffffff", self.widget.font, fontsize or self.widget.fontsize,
+            "", "ffffff", self.widget.font, self.fontsize,
             self.widget.fontshadow, markup=self.widget.markup, wrap=self.widget.wrap
         )
+        # values last set on the layout, width is only set when fixed
+        self._values = dict(text="", colour="ffffff", width=None)
+        self._extents = None
 
         self.configured = True
         return self
 
+    def _measure(self):
+        return self.layout.width, self.layout.height
+
+    def _get_extents(self):
+        if self._extents is None:
+            key = (
+                self._values["text"], self.widget.font, self.fontsize, self.widget.markup, self.widget.wrap,
+                self._values["width"],
+            )
+            self._extents = layout_extents.get(key, self._measure)
+        return self._extents
+
     def update(self, params):
         if not self.configured:
             return
 
         for key, value in params.items():
+            # setting text parses its markup again, and has it shaped once measured or drawn
+            if key in self._values and self._values[key] == value:
+                continue
             setattr(self.layout, key, value)
+            self._values[key] = value
+            if key in ("text", "width"):
+                self._extents = None
 
     def draw(self, x, y):
         if not self.configured:
@@ -66,24 +137,16 @@ class _LayoutHandler:
 
 
 class _TextHandler(_LayoutHandler):
-    def update(self):
-        params = dict(
-            text=self.widget.get_text(),
-            colour=self.widget.get_text_color(),
-        )
-        super().update(params)
+    def update(self, text, colour):
+        super().update(dict(text=text, colour=colour))
 
 
 class _IconHandler(_LayoutHandler):
     def configure(self):
         return super().configure(self.widget.icon_size)
 
-    def update(self):
-        params = dict(
-            text=self.widget.get_icon(),
-            colour=self.widget.get_icon_color(),
-        )
-        super().update(params)
+    def update(self, text, colour):
+        super().update(dict(text=text, colour=colour))
 
 
 class ProgressCoreWidget(base._Widget, base.PaddingMixin):
@@ -95,10 +158,28 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         ("wrap", False, "Whether to wrap text."),
         ("foreground", "ffffff", "Foreground colour"),
         ("update_interval", 1, "How often in seconds the widget refreshes."),
+        (
+            "max_fps",
+            None,
+            "Draws of every widget of a bar are coalesced into frames, drawn once per loop iteration. "
+            "Max frames per second of the bar, the lowest one among its widgets. None to not cap them."
+        ),
+        (
+            "share_source",
+            True,
+            "Whether to share sampled data with widgets sampling the same source, e.g. the same "
+            "widget on other bars or screens. Only applies to widgets providing a data source."
+        ),
         ("progress_bar_active", True, "Whether to draw round progress bar."),
         ("progress_bar_colors", [], "Progress bar colors for each specified limit."),
         ("progress_bar_inner_colors", [], "Progress inner color for each specified limit."),
         ("progress_bar_thickness", 2, "Progress bar stroke thickness."),
+        (
+            "progress_bar_cache",
+            False,
+            "Whether to render progress bar rings once into offscreen surfaces, shared between widgets, "
+            "and blit them afterwards. Recommended for frequently updated widgets."
+        ),
         ("icons", [], "Icons to present inside progress bar, based on progress limits."),
         ("icon_colors", [], "Icon color, based on progress limits."),
         ("icon_size", None, "Icon size. Fontsize used if None."),
@@ -107,6 +188,10 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         ("text_offset", 0, "Text offset. Negative values can be used to bring it closer to icon."),
         ("text_colors", [], "Text color, based on progress limits."),
     ]
+    # options holding ((lower, upper), value) entries, compiled into lookup indexes
+    limits_options = ("icons", "icon_colors", "text_colors", "progress_bar_colors", "progress_bar_inner_colors")
+    # whether data source samples should run in executor
+    source_threaded = False
 
     def __init__(self, **config):
         if not "name" in config:
@@ -125,17 +210,35 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         self._total_length = 0
         self.pending_update = True
         self.progress = 0
-
-    @staticmethod
-    def _is_in_limits(value, limits):
-        lower, upper = limits
-        if lower <= value <= upper:
-            return True
-        return False
+        self._limits = {}
+        self._render_state = None
+        # elements resolved while checking whether a draw is required, reused to draw them
+        self._resolved = None
+        self._source = None
+        self._frames = None
+        self._tick = None
+
+    def _compile_limits(self):
+        self._limits = {}
+        for option in self.limits_options:
+            self._limits[option] = LimitsIndex(getattr(self, option), option)
+
+    def _lookup_limits(self, option, progress=None):
+        index = self._limits.get(option)
+        if index is None:
+            # lookups before widget configuration
+            index = self._limits[option] = LimitsIndex(getattr(self, option), option)
+        return index.lookup(progress or self.progress)
 
     def _configure(self, qtile, bar):
         super()._configure(qtile, bar)
 
+        if self._frames and self._frames.bar is not bar:
+            self._frames.unsubscribe(self)
+        self._frames = frames.subscribe(self)
+
+        self._compile_limits()
+
         if self.text_mode and self.text_mode not in ("with_icon", "without_icon"):
             raise ConfigError("Invalid text mode. Must either be None, '', 'with_icon' or 'without_icon'")
 
@@ -151,7 +254,9 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
             # forward global and user configs to progress bar, to ensure proper padding
             config = self.global_defaults.copy()
             config.update(self._user_config)
-            self._progress_bar = ProgressBar(self.drawer, self.bar, size, size, self.progress_bar_thickness, **config)
+            self._progress_bar = ProgressBar(
+                self.drawer, self.bar, size, size, self.progress_bar_thickness, self.progress_bar_cache, **config
+            )
 
         if self.icon_active:
             self._icon_handler = _IconHandler(self).configure()
@@ -165,7 +270,35 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         # to current widget state, since all content is dynamic
         self.update_draw_elements(reschedule=self.pending_update)
 
+    def _subscribe_source(self):
+        """
+        Subscribes widget to its data source, when available. Unless sharing is disabled,
+        the source is shared with every widget using the same source key.
+        :return: Whether widget is now updated by a data source.
+        """
+
+        if self._source is not None:
+            return True
+
+        key = self.get_source_key()
+        if not key:
+            return False
+
+        def factory():
+            return DataSource(key, self.source_threaded)
+
+        if self.share_source:
+            self._source = subscribe(self, key, factory)
+        else:
+            self._source = factory()
+            self._source.subscribe(self)
+
+        return True
+
     def timer_setup(self):
+        if self._subscribe_source():
+            return
+
         try:
             if self.configured:
                 self.update()
@@ -173,7 +306,11 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
             _logger.exception("exception in timer loop: %s", str(e))
 
         if self.update_interval:
-            self.timeout_add(self.update_interval, self.timer_setup)
+            self._schedule_tick()
+
+    def _schedule_tick(self):
+        # ticks are aligned to the wall clock, along with the ones of every other widget
+        self._tick = tick_clock.schedule(self.qtile, self.update_interval, self.timer_setup)
 
     def calculate_length(self):
         return self._total_length
@@ -212,45 +349,33 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         return markup_escape_text(text)
 
     def get_icon(self, progress=None):
-        for limits, icon in self.icons:
-            if self._is_in_limits(progress or self.progress, limits):
-                return icon or ""
-        return ""
+        return self._lookup_limits("icons", progress) or ""
 
     def get_icon_color(self, progress=None):
-        default = self.foreground or "ffffff"
-        for limits, color in self.icon_colors:
-            if self._is_in_limits(progress or self.progress, limits):
-                return color or default
-        return default
+        return self._lookup_limits("icon_colors", progress) or self.foreground or "ffffff"
 
     def get_text(self):
         return self.text_format.format(self.progress)
 
     def get_text_color(self, progress=None):
-        default = self.foreground or "ffffff"
-        for limits, color in self.text_colors:
-            if self._is_in_limits(progress or self.progress, limits):
-                return color or default
-        return default
+        return self._lookup_limits("text_colors", progress) or self.foreground or "ffffff"
 
     def get_progress_bar_color(self, progress=None):
         completed = self.foreground or "ffffff"
         remaining = self.background or "000000"
-        for limits, colors in self.progress_bar_colors:
-            if self._is_in_limits(progress or self.progress, limits):
-                comp, rem = colors
-                return (comp or completed, rem or remaining)
-        return (completed, remaining)
+        colors = self._lookup_limits("progress_bar_colors", progress)
+        if not colors:
+            return (completed, remaining)
+        comp, rem = colors
+        return (comp or completed, rem or remaining)
 
     def get_progress_bar_inner_color(self, progress=None):
-        default = self.background or "000000"
-        for limits, color in self.progress_bar_inner_colors:
-            if self._is_in_limits(progress or self.progress, limits):
-                return color or default
-        return default
+        return self._lookup_limits("progress_bar_inner_colors", progress) or self.background or "000000"
 
     def update(self):
+        if self._source:
+            # refresh every widget sharing the source
+            return self._source.refresh()
         self.update_data()
         self.update_draw()
 
@@ -261,27 +386,101 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         """
         pass
 
+    def get_source_key(self):
+        """
+        To be overridden by derived widgets able to share sampled data. Widgets returning
+        the same key share a single data source, sampled with sample_data and delivered
+        to each of them through on_source_data. None disables sharing.
+        """
+        return None
+
+    def sample_data(self):
+        """
+        Samples data for a shared source. Should not depend on the widget state, since
+        it ends up being called for every widget subscribed to the source.
+        """
+        return None
+
+    def watch_source(self, push):
+        """
+        Event driven widgets can start watching for changes here, delivering new data
+        with push, instead of relying on periodic sampling.
+        :return: Function stopping the watch, or None when changes are not watched.
+        """
+        return None
+
+    def on_source_data(self, data):
+        """
+        Applies sampled data to the widget.
+        """
+        pass
+
+    def on_source_update(self, data):
+        try:
+            self.on_source_data(data)
+            if self.configured:
+                self.update_draw()
+        except Exception:
+            _logger.exception("failed to apply source data on '%s'", self.name)
+
     def update_draw(self):
+        self._resolved = None
         if not self.is_draw_update_required():
             return _logger.debug("skipping update on '%s'", self.name)
-        self.update_draw_elements()
+        self.update_draw_elements(elements=self._resolved)
         self.draw_call()
 
     def is_draw_update_required(self):
-        return True
+        """
+        By default, a draw is only required when the resolved output differs from
+        the last drawn one.
+        """
+        self._resolved = self.resolve_elements()
+        return self.get_render_state(self._resolved) != self._render_state
 
-    def update_draw_elements(self, reschedule=False):
-        if self.progress_bar_active:
+    def resolve_elements(self):
+        """
+        Resolves text, icon, colors and progress bar state for current widget data.
+        Progress is quantized to what the progress bar is able to show.
+        """
+        progress_bar = icon = text = None
+
+        if self.progress_bar_active and self._progress_bar:
             completed, remaining = self.get_progress_bar_color()
             inner = self.get_progress_bar_inner_color()
-            self._progress_bar.update(self.progress, completed, remaining, inner)
+            progress_bar = (self._progress_bar.quantize(self.progress), completed, remaining, inner)
 
         if self.icon_active:
-            self._icon_handler.update()
+            icon = (self.get_icon(), self.get_icon_color())
 
         if self.text_active:
-            self._text_handler.update()
+            text = (self.get_text(), self.get_text_color())
+
+        return _Elements(progress_bar, icon, text)
+
+    def get_render_state(self, elements=None):
+        """
+        Snapshot of everything visible in the widget, compared between frames to skip
+        redundant draws. Derived widgets drawing extra elements should extend it.
+        """
+        return elements or self.resolve_elements()
 
+    def update_draw_elements(self, reschedule=False, elements=None):
+        if elements is None:
+            elements = self.resolve_elements()
+        self._resolved = None
+
+        if elements.progress_bar:
+            _, completed, remaining, inner = elements.progress_bar
+            self._progress_bar.update(self.progress, completed, remaining, inner)
+
+        if elements.icon:
+            self._icon_handler.update(*elements.icon)
+
+        if elements.text:
+            self._text_handler.update(*elements.text)
+
+        self._render_state = self.get_render_state(elements)
         self.pending_update = reschedule
 
     def update_draw_length(self):
@@ -303,15 +502,16 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
             self._total_length += self._text_handler.width + self.text_offset + self.padding_x * 2
 
     def draw_call(self):
+        # finalized, or not configured yet, there is no bar to draw on
+        if self._frames is None:
+            return
+
         old_length = self._total_length
 
         self.update_draw_length()
 
-        if old_length != self._total_length:
-            # draw entire bar when length changes
-            return self.bar.draw()
-
-        return self.draw()
+        # draw entire bar when length changes, along with other widgets drawn in this loop iteration
+        self._frames.request(self, relayout=old_length != self._total_length)
 
     def draw_before_elements(self):
         return 0
@@ -391,7 +591,52 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
         self.draw_oriented()
         self.drawer.draw(offsetx=self.offsetx, offsety=self.offsety, width=self.width, height=self.height)
 
+    def cmd_sources_info(self):
+        """
+        :return: Subscribed widgets and sampling interval of every shared data source.
+        """
+        return get_sources_info()
+
+    def cmd_ring_cache_info(self):
+        """
+        :return: Size, hits and misses of the pre-rendered rings cache shared by every progress bar.
+        """
+        return ring_cache.info()
+
+    def cmd_layout_cache_info(self):
+        """
+        :return: Size, hits and misses of the text extents cache shared by every widget.
+        """
+        return layout_extents.info()
+
+    def cmd_frames_info(self):
+        """
+        :return: Frames drawn by the scheduler of the widget bar, and draws saved by coalescing them.
+        """
+        return self._frames and self._frames.info()
+
+    def cmd_clock_info(self):
+        """
+        :return: Wakeups per minute of the clock shared by every polling widget and source.
+        """
+        return tick_clock.info()
+
+    def cmd_set_log_level(self, level):
+        """
+        Sets the log level of every widget logger, e.g. 'DEBUG' or 'WARNING'.
+        """
+        return set_log_level(level)
+
     def finalize(self):
+        if self._source:
+            self._source.unsubscribe(self)
+            self._source = None
+        if self._frames:
+            self._frames.unsubscribe(self)
+            self._frames = None
+        if self._tick:
+            self._tick.cancel()
+            self._tick = None
         if self.icon_active:
             self._icon_handler.finalize()
         if self.text_active:
@@ -400,7 +645,12 @@ class ProgressCoreWidget(base._Widget, base.PaddingMixin):
 
 
 class ProgressInFutureWidget(ProgressCoreWidget):
+    source_threaded = True
+
     def timer_setup(self):
+        if self._subscribe_source():
+            return
+
         def on_done(update_data):
             try:
                 update_data.result()
@@ -410,7 +660,9 @@ class ProgressInFutureWidget(ProgressCoreWidget):
             try:
                 self.update_draw()
 
-                if self.update_interval is not None:
+                if self.update_interval:
+                    self._schedule_tick()
+                elif self.update_interval is not None:
                     self.timeout_add(self.update_interval, self.timer_setup)
                 else:
                     self.timer_setup()
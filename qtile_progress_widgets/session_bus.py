@@ -0,0 +1,257 @@
+import asyncio
+import time
+
+from .utils import create_logger
+
+
+_logger = create_logger("SESSION_BUS")
+
+
+class _Latency:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+    def add(self, elapsed, failed):
+        self.calls += 1
+        self.errors += failed
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.last = elapsed
+
+    def info(self):
+        return dict(
+            calls=self.calls, errors=self.errors, avg_ms=self.calls and self.total / self.calls * 1000,
+            max_ms=self.max * 1000, last_ms=self.last * 1000,
+        )
+
+
+class _Match:
+    def __init__(self, callback, sender=None, interface=None, member=None, path=None, arg0=None, arg0namespace=None):
+        self.callback = callback
+        self.fields = dict(sender=sender, interface=interface, member=member, path=path)
+        self.arg0 = arg0
+        self.arg0namespace = arg0namespace
+
+        rule = ["type='signal'"]
+        rule += ["%s='%s'" % (key, value) for key, value in self.fields.items() if value]
+        if arg0 is not None:
+            rule.append("arg0='%s'" % arg0)
+        if arg0namespace is not None:
+            rule.append("arg0namespace='%s'" % arg0namespace)
+        self.rule = ",".join(rule)
+
+        # senders of signals are unique names, only checked by the bus daemon
+        self.fields["sender"] = None
+
+    def matches(self, msg):
+        for key, value in self.fields.items():
+            if value and getattr(msg, key) != value:
+                return False
+
+        if self.arg0 is None and self.arg0namespace is None:
+            return True
+
+        arg0 = msg.body[0] if msg.body else None
+        if self.arg0 is not None and arg0 != self.arg0:
+            return False
+        if self.arg0namespace is not None:
+            namespace = self.arg0namespace
+            return isinstance(arg0, str) and (arg0 == namespace or arg0.startswith(namespace + "."))
+        return True
+
+
+class SessionBus:
+    """
+    Session bus connection shared by widgets, instead of connecting for every call. It
+    connects on first call and again, on next call, once the connection is lost. Latency
+    of calls is tracked per interface and member.
+
+    Signals are received through match rules, installed once per rule on the bus daemon and
+    dispatched locally. While there are any, lost connections are restored right away,
+    installing rules again.
+    """
+
+    def __init__(self, reconnect_delay=5):
+        self.reconnect_delay = reconnect_delay
+        self.bus = None
+        self._connecting = None
+        self._retry_at = 0
+        self._latency = {}
+        self._matches = []
+        self._connect_callbacks = []
+        self._reconnecting = None
+
+    async def _connect(self):
+        from dbus_next.aio import MessageBus
+        from dbus_next.constants import BusType
+
+        try:
+            bus = await MessageBus(bus_type=BusType.SESSION).connect()
+        except Exception as e:
+            _logger.warning("unable to connect to session bus: %s", str(e))
+            self._retry_at = time.monotonic() + self.reconnect_delay
+            self._schedule_reconnect()
+            return None
+
+        _logger.info("connected to session bus as %s", bus.unique_name)
+        bus.add_message_handler(self._on_message)
+        for rule in {match.rule for match in self._matches}:
+            await self._add_match_rule(bus, rule)
+
+        self.bus = bus
+        asyncio.create_task(self._watch_disconnect(bus))
+
+        for callback in self._connect_callbacks:
+            asyncio.create_task(callback())
+
+        return bus
+
+    @staticmethod
+    async def _add_match_rule(bus, rule, member="AddMatch"):
+        from dbus_next.message import Message
+
+        _logger.debug("%s: %s", member, rule)
+        await bus.call(Message(
+            destination="org.freedesktop.DBus",
+            path="/org/freedesktop/DBus",
+            interface="org.freedesktop.DBus",
+            member=member,
+            signature="s",
+            body=[rule],
+        ))
+
+    def _on_message(self, msg):
+        from dbus_next.constants import MessageType
+
+        if msg.message_type != MessageType.SIGNAL:
+            return
+
+        for match in self._matches:
+            if match.matches(msg):
+                try:
+                    match.callback(msg)
+                except Exception as e:
+                    _logger.exception("failed to handle signal %s.%s: %s", msg.interface, msg.member, str(e))
+
+    async def _reconnect(self):
+        while self._matches and self.bus is None:
+            await asyncio.sleep(self.reconnect_delay)
+            await self.get_bus()
+
+    def _schedule_reconnect(self):
+        # signals are only received while connected, a single task retries meanwhile
+        if self._matches and (self._reconnecting is None or self._reconnecting.done()):
+            self._reconnecting = asyncio.ensure_future(self._reconnect())
+
+    async def _watch_disconnect(self, bus):
+        try:
+            await bus.wait_for_disconnect()
+        except Exception as e:
+            _logger.warning("session bus connection lost: %s", str(e))
+        if self.bus is bus:
+            self.bus = None
+        _logger.info("disconnected from session bus")
+
+        self._schedule_reconnect()
+
+    async def get_bus(self):
+        """
+        :return: Connected bus, or None when unable to connect.
+        """
+
+        if self.bus is not None and self.bus.connected:
+            return self.bus
+
+        if self._connecting is None:
+            if time.monotonic() < self._retry_at:
+                return None
+            self._connecting = asyncio.ensure_future(self._connect())
+
+        try:
+            return await asyncio.shield(self._connecting)
+        finally:
+            if self._connecting is not None and self._connecting.done():
+                self._connecting = None
+
+    async def call(self, destination, path, interface, member, signature="", body=None):
+        """
+        :return: Reply message, or None when not connected.
+        """
+
+        from dbus_next.constants import MessageType
+        from dbus_next.message import Message
+
+        bus = await self.get_bus()
+        if bus is None:
+            return None
+
+        latency = self._latency.setdefault("%s.%s" % (interface, member), _Latency())
+        start = time.perf_counter()
+        failed = True
+
+        try:
+            reply = await bus.call(Message(
+                destination=destination,
+                path=path,
+                interface=interface,
+                member=member,
+                signature=signature,
+                body=body or [],
+            ))
+            failed = reply.message_type != MessageType.METHOD_RETURN
+            return reply
+        finally:
+            latency.add(time.perf_counter() - start, failed)
+
+    async def add_match(self, callback, **rule):
+        """
+        Calls callback with every signal matching rule. Rule keys are the ones of dbus match
+        rules: sender, interface, member, path, arg0 and arg0namespace.
+        :return: Match, to be removed later.
+        """
+
+        match = _Match(callback, **rule)
+        installed = any(m.rule == match.rule for m in self._matches)
+        self._matches.append(match)
+
+        bus = await self.get_bus()
+        if bus is None:
+            # rule is installed once connected
+            self._schedule_reconnect()
+            return match
+
+        if not installed:
+            await self._add_match_rule(bus, match.rule)
+
+        return match
+
+    async def remove_match(self, match):
+        if match not in self._matches:
+            return
+
+        self._matches.remove(match)
+        if self.bus is not None and all(m.rule != match.rule for m in self._matches):
+            await self._add_match_rule(self.bus, match.rule, "RemoveMatch")
+
+    def add_connect_callback(self, callback):
+        """
+        Coroutine function called whenever bus gets connected, including reconnections.
+        """
+        self._connect_callbacks.append(callback)
+
+    def info(self):
+        """
+        :return: Connection state and latency of calls, per interface and member.
+        """
+        return dict(
+            connected=self.bus is not None and self.bus.connected,
+            matches=len(self._matches),
+            calls={name: latency.info() for name, latency in self._latency.items()},
+        )
+
+
+session_bus = SessionBus()
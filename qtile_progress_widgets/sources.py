@@ -0,0 +1,187 @@
+from .clock import tick_clock
+from .utils import create_logger
+
+
+_logger = create_logger("SOURCES")
+
+# active sources, by key
+_sources = {}
+
+
+class DataSource:
+    """
+    Samples data once for every subscribed widget (view), fanning out each sample to all of them.
+    Sampling starts with the first subscription and stops with the last one. The sampling interval
+    is the shortest positive update interval among subscribed views, with no periodic sampling when
+    none of them has one.
+
+    Data is sampled through the sample_data of the first subscribed view. Sources can also be
+    event driven, through its watch_source, called on start with a push function, used to deliver
+    data on changes, and returning a function stopping the watch. When the first view leaves,
+    the next one takes over both.
+    """
+
+    def __init__(self, key, threaded=False):
+        self.key = key
+        self.threaded = threaded
+        self._unwatch = None
+        self.views = []
+        self.interval = None
+        self.data = None
+        self.has_data = False
+        self._qtile = None
+        self._timer = None
+        self._sampling = False
+        self._reschedule = False
+
+    def _update_interval(self):
+        intervals = [v.update_interval for v in self.views if v.update_interval]
+        self.interval = min(intervals) if intervals else None
+
+    def _schedule(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self.views and self.interval:
+            self._timer = tick_clock.schedule(self._qtile, self.interval, self._tick)
+
+    def _tick(self):
+        self._timer = None
+        self.refresh(reschedule=True)
+
+    def _on_sampled(self, data):
+        self._sampling = False
+        if data is not None:
+            self.push(data)
+        if self._reschedule:
+            self._reschedule = False
+            self._schedule()
+
+    def refresh(self, reschedule=False):
+        """
+        Samples data right away, delivering it to every view.
+        """
+
+        if not self.views:
+            return
+
+        # a sample in progress takes care of rescheduling when it's done
+        self._reschedule = self._reschedule or reschedule
+
+        if self._sampling:
+            return
+
+        sample = self.views[0].sample_data
+
+        if not self.threaded:
+            try:
+                data = sample()
+            except Exception:
+                _logger.exception("failed to sample '%s'", self.key)
+                data = None
+            return self._on_sampled(data)
+
+        def on_done(future):
+            try:
+                data = future.result()
+            except Exception:
+                _logger.exception("failed to sample '%s'", self.key)
+                data = None
+            self._on_sampled(data)
+
+        self._sampling = True
+        self._qtile.run_in_executor(sample).add_done_callback(on_done)
+
+    def push(self, data):
+        """
+        Delivers data to every view. Can be used by event driven backends, that get notified
+        of changes instead of sampling them.
+        """
+
+        self.data = data
+        self.has_data = True
+
+        for view in list(self.views):
+            view.on_source_update(data)
+
+    def _start_watch(self):
+        try:
+            self._unwatch = self.views[0].watch_source(self.push)
+        except Exception:
+            _logger.exception("failed to watch '%s', relying on sampling only", self.key)
+
+    def _stop_watch(self):
+        if self._unwatch:
+            self._unwatch()
+            self._unwatch = None
+
+    def subscribe(self, view):
+        self.views.append(view)
+
+        if len(self.views) == 1:
+            self._qtile = view.qtile
+            # views might only need to be polled when their watch fails
+            self._start_watch()
+            self._update_interval()
+            _logger.debug("starting '%s', every %ss", self.key, self.interval)
+            return self.refresh(reschedule=True)
+
+        self._update_interval()
+
+        if self.has_data:
+            view.on_source_update(self.data)
+
+        if self._timer:
+            # interval might have been shortened by this view
+            self._schedule()
+
+    def unsubscribe(self, view):
+        if view not in self.views:
+            return
+
+        owner = self.views[0]
+        self.views.remove(view)
+
+        if self.views:
+            if view is owner:
+                # leaving view might be finalized already, watch through the next one
+                self._stop_watch()
+                self._start_watch()
+
+            interval = self.interval
+            self._update_interval()
+            if self._timer and self.interval != interval:
+                # interval might have been set by this view
+                self._schedule()
+            return
+
+        _logger.debug("stopping '%s'", self.key)
+
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        self._stop_watch()
+
+        if _sources.get(self.key) is self:
+            del _sources[self.key]
+
+
+def subscribe(view, key, factory):
+    """
+    Subscribes view to the source identified by key, creating it with factory when
+    there's no active source with that key.
+    :return: Subscribed source.
+    """
+
+    source = _sources.get(key)
+
+    if source is None:
+        source = _sources[key] = factory()
+
+    source.subscribe(view)
+    return source
+
+
+def get_sources_info():
+    return {key: dict(views=len(s.views), interval=s.interval) for key, s in _sources.items()}
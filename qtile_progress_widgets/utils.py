@@ -1,60 +1,126 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
 import site
 
-from libqtile.images import Img
-import requests
-import validators
 
-try:
-    import gi
-    gi.require_version('Gtk', '3.0')
-    from gi.repository import Gtk
-    has_gtk = True
-except:
-    has_gtk = False
+_log_level = logging.INFO
+_loggers = {}
+_queue_handler = None
+_listener = None
 
 
-logging.disable(logging.DEBUG)
+class LazyMessage:
+    """
+    Defers building an expensive log argument until the record is formatted, which never
+    happens for disabled levels.
+    """
 
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
 
-def create_logger(name):
-    formatter = logging.Formatter("[%(asctime)s][%(name)s][%(levelname)s]: %(message)s", "%Y/%m/%d %H:%M:%S")
-    log_dir = os.path.join(site.getuserbase(), "share", "qtile-progress-widgets")
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+
+def get_data_dir():
+    return os.path.join(site.getuserbase(), "share", "qtile-progress-widgets")
+
+
+class _LogFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler creating the log directory, along with the file, on first emit.
+    """
+
+    def _open(self):
+        log_dir = os.path.dirname(self.baseFilename)
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        return super()._open()
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    Queue handler starting the listener thread with the first record.
+    """
+
+    def emit(self, record):
+        _start_listener()
+        super().emit(record)
+
+
+def _start_listener():
+    global _listener
 
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    if _listener is not None:
+        return
 
-    handler = RotatingFileHandler(os.path.join(log_dir, "widgets.log"), maxBytes=1024 * 1024 * 5, backupCount=5)
+    formatter = logging.Formatter("[%(asctime)s][%(name)s][%(levelname)s]: %(message)s", "%Y/%m/%d %H:%M:%S")
+    handler = _LogFileHandler(
+        os.path.join(get_data_dir(), "widgets.log"), maxBytes=1024 * 1024 * 5, backupCount=5, delay=True
+    )
     handler.setFormatter(formatter)
 
+    _listener = QueueListener(_queue_handler.queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def _get_queue_handler():
+    """
+    Every widget logger shares a single queue handler. Records are written to the log file
+    by a listener thread, keeping file I/O out of qtile's event loop. Neither the thread nor
+    the file exist until something gets logged.
+    """
+
+    global _queue_handler
+
+    if _queue_handler is None:
+        _queue_handler = _LazyQueueHandler(queue.SimpleQueue())
+
+    return _queue_handler
+
+
+def create_logger(name):
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(handler)
+    logger.setLevel(_log_level)
 
+    handler = _get_queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+
+    _loggers[name] = logger
     return logger
 
 
-def get_cairo_image(source, bytes_img=False):
-    if bytes_img:
-        return Img(source)
-    if validators.url(source):
-        return Img(requests.get(source).content)
-    source = os.path.expanduser(source)
-    if os.path.isfile(source):
-        return Img.from_path(source)
-    raise Exception("'%s' is neither a valid path nor a url." % source)
+def set_log_level(level):
+    """
+    Updates the level of every widget logger.
+    :return: Level name set.
+    """
+
+    global _log_level
+
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        raise ValueError("Invalid log level: '%s'" % level)
 
+    _log_level = level
+    for logger in _loggers.values():
+        logger.setLevel(level)
 
-def get_gtk_icon(icon_name):
-    if not has_gtk:
-        return None
+    return logging.getLevelName(level)
 
-    icon_theme = Gtk.IconTheme.get_default()
-    icon = icon_theme.lookup_icon(icon_name, 512, 0)
 
-    if icon:
-        return icon.get_filename()
+def get_cairo_image(source):
+    """
+    Blocking image load, through the shared image loader cache. Prefer awaiting image_loader.load.
+    """
+    from .images import image_loader
+    return image_loader.load_sync(source)
 
-    return None
@@ -0,0 +1,104 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+
+from .utils import create_logger
+
+
+_logger = create_logger("WATCHERS")
+
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+def _watch_sysfs(loop, path, callback):
+    """
+    Sysfs attributes notify changes by waking pollers with POLLPRI. The attribute
+    has to be read again to re-arm the notification.
+    """
+
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    ep = select.epoll()
+
+    try:
+        ep.register(fd, select.EPOLLPRI | select.EPOLLERR)
+    except OSError:
+        # regular files do not support polling, not a sysfs attribute
+        ep.close()
+        os.close(fd)
+        raise
+
+    os.pread(fd, 4096, 0)
+
+    def on_event():
+        ep.poll(0)
+        os.pread(fd, 4096, 0)
+        callback()
+
+    loop.add_reader(ep.fileno(), on_event)
+
+    def stop():
+        loop.remove_reader(ep.fileno())
+        ep.close()
+        os.close(fd)
+
+    return stop
+
+
+def _watch_inotify(loop, path, callback):
+    libc = _get_libc()
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    if libc.inotify_add_watch(fd, os.fsencode(path), _IN_MODIFY | _IN_CLOSE_WRITE) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, "inotify_add_watch failed for '%s'" % path)
+
+    def on_event():
+        # drain every pending event, a single callback is enough for all of them
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        callback()
+
+    loop.add_reader(fd, on_event)
+
+    def stop():
+        loop.remove_reader(fd)
+        os.close(fd)
+
+    return stop
+
+
+def watch_file(path, callback):
+    """
+    Watches file for changes, calling callback from the event loop. Sysfs attributes are
+    watched through poll notifications, other files through inotify.
+    :return: Function stopping the watch, or None when file can't be watched.
+    """
+
+    loop = asyncio.get_event_loop()
+
+    for watch in (_watch_sysfs, _watch_inotify):
+        try:
+            return watch(loop, path, callback)
+        except (OSError, AttributeError) as e:
+            _logger.debug("%s unable to watch '%s': %s", watch.__name__, path, str(e))
+
+    _logger.warning("unable to watch '%s' for changes", path)
+    return None
@@ -5,6 +5,7 @@ setup(
     version="0.0.1",
     packages=find_packages(),
     install_requires=["dbus-next", "psutil", "qtile", "requests", "validators"],
+    extras_require={"cores": ["numpy"]},
     description="Custom progress widgets for qtile window manager.",
     author="mrcoalp",
     url="https://github.com/mrcoalp/qtile-progress-widgets",
@@ -0,0 +1,111 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+
+
+class PrivateBus:
+    """
+    Session bus daemon of its own, started and stopped by tests.
+    """
+
+    def __init__(self, directory):
+        self.address = "unix:path=%s" % os.path.join(directory, "bus")
+        self._daemon = None
+
+    def start(self):
+        self._daemon = subprocess.Popen(
+            ["dbus-daemon", "--session", "--nofork", "--print-address", "--address=%s" % self.address],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        # accepting connections once the address is printed
+        self._daemon.stdout.readline()
+
+    def stop(self):
+        if self._daemon is not None:
+            self._daemon.terminate()
+            self._daemon.wait()
+            self._daemon.stdout.close()
+            self._daemon = None
+
+
+@pytest.fixture
+def private_bus(monkeypatch):
+    """
+    Session bus address pointing to a private daemon, not started yet.
+    """
+
+    if shutil.which("dbus-daemon") is None:
+        pytest.skip("dbus-daemon is not available")
+    pytest.importorskip("dbus_next")
+
+    # socket paths are short, tmp_path might be too long for one
+    with tempfile.TemporaryDirectory(prefix="bus") as directory:
+        bus = PrivateBus(directory)
+        monkeypatch.setenv("DBUS_SESSION_BUS_ADDRESS", bus.address)
+        yield bus
+        bus.stop()
+
+
+@pytest.fixture
+def mpris_service(private_bus):
+    """
+    Fake MPRIS players on the private bus.
+    :return: Coroutine function starting a player owning names, returning its connection and player.
+    """
+
+    from dbus_next import PropertyAccess, Variant
+    from dbus_next.aio import MessageBus
+    from dbus_next.service import ServiceInterface, dbus_property, signal
+
+    class FakePlayer(ServiceInterface):
+        def __init__(self):
+            super().__init__("org.mpris.MediaPlayer2.Player")
+            self.status = "Playing"
+            self.rate = 1.0
+            self.position = 5000000
+            self.metadata = {
+                "mpris:trackid": Variant("o", "/track/1"),
+                "mpris:length": Variant("x", 200000000),
+                "xesam:title": Variant("s", "First"),
+                "xesam:artist": Variant("as", ["Artist"]),
+            }
+
+        @dbus_property(access=PropertyAccess.READ)
+        def PlaybackStatus(self) -> "s":
+            return self.status
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Rate(self) -> "d":
+            return self.rate
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Position(self) -> "x":
+            return self.position
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Metadata(self) -> "a{sv}":
+            return self.metadata
+
+        @signal()
+        def Seeked(self, position) -> "x":
+            return position
+
+        def change(self, **properties):
+            names = dict(status="PlaybackStatus", rate="Rate", metadata="Metadata")
+            for key, value in properties.items():
+                setattr(self, key, value)
+            self.emit_properties_changed({names[key]: value for key, value in properties.items()})
+
+    async def start(*names):
+        bus = await MessageBus().connect()
+        player = FakePlayer()
+        bus.export("/org/mpris/MediaPlayer2", player)
+        for name in names:
+            await bus.request_name(name)
+        return bus, player
+
+    return start
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import stat
+import sys
+
+import pytest
+
+from qtile_progress_widgets.audio import PactlControls
+
+
+# stands in for pactl: volume is read from a file, and 'subscribe' streams the lines appended
+# to the events file, exiting when one of them is 'exit'
+FAKE_PACTL = """#!{python}
+import os
+import sys
+import time
+
+root = os.path.dirname(os.path.abspath(__file__))
+command = sys.argv[1]
+
+if command == "subscribe":
+    with open(os.path.join(root, "subscriptions"), "a") as f:
+        f.write("subscribed\\n")
+    events = os.path.join(root, "events")
+    seen = 0
+    while True:
+        lines = open(events).read().splitlines() if os.path.exists(events) else []
+        for line in lines[seen:]:
+            if line == "exit":
+                os.remove(events)
+                sys.exit(1)
+            print(line, flush=True)
+        seen = len(lines)
+        time.sleep(0.01)
+elif command.endswith("-volume"):
+    with open(os.path.join(root, "volume")) as f:
+        print("Volume: front-left: 0 /  %s%% / 0 dB" % f.read().strip())
+elif command.endswith("-mute"):
+    print("Mute: no")
+"""
+
+
+class FakePactl:
+    def __init__(self, root):
+        self.root = root
+        self.program = str(root / "pactl")
+        with open(self.program, "w") as f:
+            f.write(FAKE_PACTL.format(python=sys.executable))
+        os.chmod(self.program, os.stat(self.program).st_mode | stat.S_IEXEC)
+        self.set_volume(50)
+
+    def set_volume(self, volume):
+        (self.root / "volume").write_text(str(volume))
+
+    def send(self, line):
+        with open(self.root / "events", "a") as f:
+            f.write(line + "\n")
+
+    @property
+    def subscriptions(self):
+        path = self.root / "subscriptions"
+        return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+@pytest.fixture
+def pactl(tmp_path):
+    return FakePactl(tmp_path)
+
+
+async def stop_watch(controls, stop):
+    task = controls._task
+    stop()
+    # wait for the stream to be terminated, and for refreshes in flight
+    await asyncio.gather(task, return_exceptions=True)
+    await wait_for(lambda: not controls._refreshing)
+
+
+async def wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+def test_events_refresh_state(pactl):
+    controls = PactlControls(program=pactl.program, restart_delay=0)
+    states = []
+
+    async def main():
+        stop = controls.watch(states.append)
+        await wait_for(lambda: states == [(50.0, False)])
+
+        pactl.set_volume(70)
+        pactl.send("Event 'change' on sink #0")
+        await wait_for(lambda: states[-1] == (70.0, False))
+        await stop_watch(controls, stop)
+
+    asyncio.run(main())
+    assert pactl.subscriptions == 1
+
+
+def test_unrelated_events_are_ignored():
+    controls = PactlControls(channel="sink")
+
+    assert controls._is_relevant(b"Event 'change' on sink #1\n")
+    assert controls._is_relevant(b"Event 'change' on server #-1\n")
+    assert not controls._is_relevant(b"Event 'change' on source #2\n")
+    assert not controls._is_relevant(b"Event 'new' on client #40\n")
+
+
+def test_stream_is_restarted_when_it_exits(pactl):
+    controls = PactlControls(program=pactl.program, restart_delay=0)
+    states = []
+
+    async def main():
+        stop = controls.watch(states.append)
+        await wait_for(lambda: pactl.subscriptions == 1 and states)
+
+        pactl.set_volume(30)
+        pactl.send("exit")
+        # state is refreshed once subscribed again, as changes might have been missed
+        await wait_for(lambda: pactl.subscriptions == 2 and states[-1] == (30.0, False))
+        await stop_watch(controls, stop)
+
+    asyncio.run(main())
+
+
+def test_shared_controls_keep_a_single_stream(pactl):
+    controls = PactlControls(program=pactl.program, restart_delay=0)
+    first, second = [], []
+
+    async def main():
+        stop_first = controls.watch(first.append)
+        stop_second = controls.watch(second.append)
+        await wait_for(lambda: first and second)
+
+        stop_first()
+        assert not controls._task.done()
+
+        pactl.set_volume(80)
+        pactl.send("Event 'change' on sink #0")
+        await wait_for(lambda: second[-1] == (80.0, False))
+
+        await stop_watch(controls, stop_second)
+        assert controls._task is None
+
+    asyncio.run(main())
+    assert pactl.subscriptions == 1
+    assert first[-1] == (50.0, False)
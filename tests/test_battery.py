@@ -0,0 +1,74 @@
+import socket
+
+from libqtile.widget import battery as bt
+import pytest
+
+from qtile_progress_widgets.battery import Battery, _SysfsBattery
+
+
+def write_battery(root, name, **fields):
+    device = root / name
+    device.mkdir()
+    (device / "uevent").write_text("".join("POWER_SUPPLY_%s=%s\n" % field for field in fields.items()))
+    return device
+
+
+@pytest.fixture
+def sockets():
+    reader, writer = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    reader.setblocking(False)
+    yield reader, writer
+    reader.close()
+    writer.close()
+
+
+def test_drain_uevents_reads_every_datagram(sockets):
+    reader, writer = sockets
+    writer.send(b"change@/devices/BAT0\0ACTION=change\0SUBSYSTEM=power_supply\0")
+    writer.send(b"change@/devices/BAT0\0ACTION=change\0SUBSYSTEM=power_supply\0")
+
+    assert _SysfsBattery._drain_uevents(reader)
+    # nothing left to read, so the event loop stops calling the reader
+    with pytest.raises(BlockingIOError):
+        reader.recv(8192)
+
+
+def test_drain_uevents_ignores_other_subsystems(sockets):
+    reader, writer = sockets
+    writer.send(b"add@/devices/usb1\0ACTION=add\0SUBSYSTEM=usb\0")
+    writer.send(b"remove@/devices/usb1\0ACTION=remove\0SUBSYSTEM=usb\0")
+
+    assert not _SysfsBattery._drain_uevents(reader)
+    with pytest.raises(BlockingIOError):
+        reader.recv(8192)
+
+
+def test_reads_status_from_uevent(tmp_path):
+    write_battery(tmp_path, "AC", NAME="AC", ONLINE=1)
+    write_battery(tmp_path, "BAT1", NAME="BAT1", STATUS="Discharging", CAPACITY=80)
+    write_battery(tmp_path, "BAT0", NAME="BAT0", STATUS="Charging", CAPACITY=42)
+
+    battery = _SysfsBattery(str(tmp_path))
+
+    assert battery.path == str(tmp_path / "BAT0")
+    assert battery.update_status() == (bt.BatteryState.CHARGING, 0.42)
+
+
+def test_percent_falls_back_to_energy_and_charge(tmp_path):
+    write_battery(tmp_path, "BAT0", STATUS="Full", ENERGY_NOW=30000, ENERGY_FULL=40000)
+    write_battery(tmp_path, "BAT1", STATUS="Unknown status", CHARGE_NOW=1000, CHARGE_FULL=0)
+
+    assert _SysfsBattery(str(tmp_path), "BAT0").update_status() == (bt.BatteryState.FULL, 0.75)
+    assert _SysfsBattery(str(tmp_path), "BAT1").update_status() == (bt.BatteryState.UNKNOWN, 0)
+
+
+def test_polls_when_changes_are_not_notified(tmp_path):
+    write_battery(tmp_path, "BAT0", STATUS="Discharging", CAPACITY=50)
+
+    widget = Battery(backend="sysfs", power_supply_root=str(tmp_path))
+    assert widget.update_interval == 60
+
+    # a tree other than the kernel one gets no uevents
+    assert widget.watch_source(lambda data: None) is None
+    assert widget.update_interval == 10
+    assert widget.sample_data() == (bt.BatteryState.DISCHARGING, 50)
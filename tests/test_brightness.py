@@ -0,0 +1,111 @@
+import asyncio
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import brightness
+from qtile_progress_widgets.brightness import _Sysfs
+
+
+@pytest.fixture
+def backlight(tmp_path):
+    device = tmp_path / "intel_backlight"
+    device.mkdir()
+    (device / "max_brightness").write_text("1000\n")
+    (device / "brightness").write_text("400\n")
+    (device / "actual_brightness").write_text("400\n")
+    return device
+
+
+def test_reads_actual_brightness(backlight):
+    sysfs = _Sysfs(str(backlight.parent))
+
+    assert sysfs.device == "intel_backlight"
+    assert sysfs.get() == "40"
+
+    (backlight / "actual_brightness").write_text("755\n")
+    # descriptor is kept open, and read again from the start
+    assert sysfs.get() == "76"
+    sysfs.close()
+
+
+def test_writes_brightness(backlight):
+    sysfs = _Sysfs(str(backlight.parent), step=10)
+
+    sysfs.set(25)
+    assert (backlight / "brightness").read_text() == "250"
+
+    sysfs.inc()
+    assert (backlight / "brightness").read_text() == "500"
+
+    # clamped to the valid range
+    sysfs.set(120)
+    assert (backlight / "brightness").read_text() == "1000"
+    sysfs.close()
+
+
+def test_falls_back_to_brightness_without_actual_brightness(backlight):
+    (backlight / "actual_brightness").unlink()
+    sysfs = _Sysfs(str(backlight.parent))
+
+    (backlight / "brightness").write_text("900\n")
+    assert sysfs.get() == "90"
+    sysfs.close()
+
+
+def test_close_releases_descriptor(backlight):
+    sysfs = _Sysfs(str(backlight.parent))
+    fd = sysfs._actual
+
+    sysfs.close()
+
+    assert sysfs._actual is None
+    with pytest.raises(OSError):
+        brightness.os.fstat(fd)
+
+
+def test_watch_notifies_changes(backlight):
+    sysfs = _Sysfs(str(backlight.parent))
+    changes = []
+
+    async def main():
+        # regular files can't be polled like sysfs attributes, changes are watched with inotify
+        stop = sysfs.watch(changes.append)
+        assert stop is not None
+
+        (backlight / "actual_brightness").write_text("100\n")
+        for _ in range(100):
+            if changes:
+                break
+            await asyncio.sleep(0.01)
+        stop()
+
+    asyncio.run(main())
+    sysfs.close()
+
+    assert changes[0] == 10.0
+
+
+def test_missing_device_is_a_config_error(tmp_path):
+    with pytest.raises(brightness.ConfigError):
+        _Sysfs(str(tmp_path))
+
+
+def test_sets_brightness_through_logind_without_write_access(backlight, monkeypatch):
+    sysfs = _Sysfs(str(backlight.parent))
+    set_through_logind = mock.AsyncMock()
+    monkeypatch.setattr(sysfs, "_set_through_logind", set_through_logind)
+
+    def deny_write(path, mode="r"):
+        raise PermissionError(13, "Permission denied", path)
+
+    async def main():
+        monkeypatch.setattr(brightness, "open", deny_write, raising=False)
+        sysfs.set(30)
+        sysfs.set(60)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    sysfs.close()
+
+    assert [c.args for c in set_through_logind.call_args_list] == [(300,), (600,)]
@@ -0,0 +1,84 @@
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import clock
+from qtile_progress_widgets.clock import TickClock
+
+
+class FakeQtile:
+    def __init__(self):
+        self.handles = []
+
+    def call_later(self, delay, callback):
+        handle = mock.Mock(delay=delay, callback=callback)
+        self.handles.append(handle)
+        return handle
+
+    @property
+    def armed(self):
+        return [handle for handle in self.handles if not handle.cancel.called]
+
+    def run(self):
+        handle = self.armed[0]
+        self.handles.remove(handle)
+        handle.callback()
+
+
+class FakeTime:
+    def __init__(self, wall, monotonic):
+        self.wall = wall
+        self.monotonic = monotonic
+
+    def sleep(self, seconds):
+        self.wall += seconds
+        self.monotonic += seconds
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime(1000.25, 50)
+    monkeypatch.setattr(clock.time, "time", lambda: fake.wall)
+    monkeypatch.setattr(clock.time, "monotonic", lambda: fake.monotonic)
+    return fake
+
+
+def test_ticks_are_aligned_to_wall_clock(fake_time):
+    qtile, tick_clock, ran = FakeQtile(), TickClock(), []
+
+    tick_clock.schedule(qtile, 1, lambda: ran.append("fast"))
+    tick_clock.schedule(qtile, 5, lambda: ran.append("slow"))
+    fake_time.sleep(0.5)
+    tick_clock.schedule(qtile, 1, lambda: ran.append("other"))
+
+    # ticks due at the same wall clock instant share a single wakeup, armed once
+    assert len(qtile.handles) == 1
+    assert qtile.armed[0].delay == pytest.approx(0.75)
+
+    fake_time.sleep(0.25)
+    qtile.run()
+    assert ran == ["fast", "other"]
+    assert qtile.armed[0].delay == pytest.approx(4)
+    assert tick_clock.info() == dict(wakeups_per_minute=1, ticks=2, pending=1)
+
+
+def test_ticks_keep_running_when_wall_clock_is_stepped(fake_time):
+    qtile, tick_clock, ran = FakeQtile(), TickClock(), []
+
+    def tick():
+        ran.append(fake_time.wall)
+        tick_clock.schedule(qtile, 1, tick)
+
+    tick_clock.schedule(qtile, 1, tick)
+
+    # wall clock set back an hour, e.g. by ntp or a timezone mistake being fixed
+    fake_time.sleep(0.75)
+    fake_time.wall -= 3600
+    qtile.run()
+    assert ran == [pytest.approx(-2599)]
+
+    # next ticks are aligned to the new wall clock, an interval away at most
+    assert qtile.armed[0].delay == pytest.approx(1)
+    fake_time.sleep(1)
+    qtile.run()
+    assert ran == [pytest.approx(-2599), pytest.approx(-2598)]
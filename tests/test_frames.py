@@ -0,0 +1,103 @@
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import frames
+
+
+class FakeQtile:
+    def __init__(self):
+        self.calls = []
+
+    def call_soon(self, callback):
+        return self.call_later(0, callback)
+
+    def call_later(self, delay, callback):
+        handle = mock.Mock(delay=delay, callback=callback)
+        self.calls.append(handle)
+        return handle
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for handle in calls:
+            handle.callback()
+
+
+class FakeWidget:
+    def __init__(self, bar, qtile, max_fps=None):
+        self.bar = bar
+        self.qtile = qtile
+        self.max_fps = max_fps
+        self.name = "fake"
+        self.configured = True
+        self.draw = mock.Mock()
+
+
+@pytest.fixture
+def qtile():
+    return FakeQtile()
+
+
+@pytest.fixture
+def bar(monkeypatch):
+    monkeypatch.setattr(frames, "_schedulers", {})
+    return mock.Mock()
+
+
+def test_draws_are_coalesced_into_a_frame(qtile, bar):
+    first, second = FakeWidget(bar, qtile), FakeWidget(bar, qtile)
+    scheduler = frames.subscribe(first)
+    assert frames.subscribe(second) is scheduler
+
+    for _ in range(3):
+        scheduler.request(first)
+    scheduler.request(second)
+    assert len(qtile.calls) == 1
+
+    qtile.run()
+    first.draw.assert_called_once()
+    second.draw.assert_called_once()
+    bar.draw.assert_not_called()
+    assert scheduler.info() == dict(widgets=2, max_fps=None, frames=1, saved=2, pending=0)
+
+    # relayout draws every widget through the bar
+    scheduler.request(first)
+    scheduler.request(second, relayout=True)
+    qtile.run()
+    bar.draw.assert_called_once()
+    assert first.draw.call_count == 1
+    assert scheduler.info()["saved"] == 3
+
+
+def test_frames_are_capped_to_lowest_max_fps(qtile, bar, monkeypatch):
+    monkeypatch.setattr(frames.time, "monotonic", lambda: 100)
+    widget = FakeWidget(bar, qtile, max_fps=10)
+    scheduler = frames.subscribe(widget)
+    frames.subscribe(FakeWidget(bar, qtile, max_fps=4))
+    assert scheduler.max_fps == 4
+
+    scheduler.request(widget)
+    qtile.run()
+    # next frame waits for the rest of the frame interval
+    scheduler.request(widget)
+    assert qtile.calls[0].delay == pytest.approx(0.25)
+
+
+def test_unsubscribed_widgets_are_not_drawn(qtile, bar):
+    first, second = FakeWidget(bar, qtile), FakeWidget(bar, qtile)
+    scheduler = frames.subscribe(first)
+    frames.subscribe(second)
+
+    scheduler.request(first)
+    scheduler.request(second)
+    scheduler.unsubscribe(first)
+    qtile.run()
+    first.draw.assert_not_called()
+    second.draw.assert_called_once()
+
+    # last widget gone, pending frame is cancelled along with the scheduler
+    scheduler.request(second)
+    handle = qtile.calls[0]
+    scheduler.unsubscribe(second)
+    handle.cancel.assert_called_once()
+    assert frames.get_schedulers_info() == []
@@ -0,0 +1,155 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from dbus_next import Variant
+import pytest
+
+from qtile_progress_widgets import generic_player, mpris
+from qtile_progress_widgets.generic_player import GenericPlayer
+from qtile_progress_widgets.mpris import PlayerRegistry
+from qtile_progress_widgets.session_bus import SessionBus
+
+
+PLAYER = "org.mpris.MediaPlayer2.fake"
+
+
+@pytest.fixture
+def widget(mpris_service, monkeypatch):
+    bus = SessionBus(reconnect_delay=0.05)
+    monkeypatch.setattr(mpris, "session_bus", bus)
+    monkeypatch.setattr(generic_player, "session_bus", bus)
+    monkeypatch.setattr(generic_player, "mpris_registry", PlayerRegistry())
+
+    # drawn on next tick, not on signals
+    widget = GenericPlayer(mpris_player=PLAYER, update_interval=1, progress_bar_active=True)
+    widget.configured = True
+    # titles have no markup to escape
+    monkeypatch.setattr(widget, "escape_text", lambda text: text)
+    return widget
+
+
+async def wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+def test_player_state_follows_refresh_and_signals(widget, private_bus, mpris_service):
+    private_bus.start()
+
+    async def main():
+        bus, player = await mpris_service(PLAYER)
+        await widget._config_async()
+        assert widget._active
+
+        # every property in a single GetAll call
+        await widget._refresh_metadata()
+        assert widget.metadata["xesam_title"] == "First"
+        assert widget.playback_status == "Playing"
+        assert widget.playback_position == 5000000
+        assert generic_player.session_bus.info()["calls"]["org.freedesktop.DBus.Properties.GetAll"]["calls"] == 1
+
+        # track changes are signaled, position is requested again
+        player.position = 0
+        player.change(metadata=dict(
+            player.metadata, **{"mpris:trackid": Variant("o", "/track/2"), "xesam:title": Variant("s", "Second")}
+        ))
+        await wait_for(lambda: widget.metadata["xesam_title"] == "Second")
+        await wait_for(lambda: not widget._resyncing)
+        assert widget.playback_position == 0
+
+        player.change(status="Paused")
+        await wait_for(lambda: widget.playback_status == "Paused")
+        player.Seeked(30000000)
+        await wait_for(lambda: widget.get_playback_position() == 30000000)
+
+        # player is gone
+        bus.disconnect()
+        await wait_for(lambda: not widget._active)
+        generic_player.session_bus.bus.disconnect()
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def signaled(monkeypatch):
+    widget = GenericPlayer(mpris_player=PLAYER, update_interval=0, signal_debounce=0.05, progress_bar_active=False)
+    widget.configured = True
+    widget._active = True
+    widget.timers = []
+    widget.escaped = []
+
+    def call_later(delay, callback, *args):
+        timer = mock.Mock(delay=delay, fire=lambda: callback(*args))
+        widget.timers.append(timer)
+        return timer
+
+    def escape_text(text):
+        widget.escaped.append(text)
+        return text
+
+    widget.qtile = SimpleNamespace(call_later=call_later)
+    monkeypatch.setattr(widget, "update", mock.Mock())
+    monkeypatch.setattr(widget, "escape_text", escape_text)
+    return widget
+
+
+def metadata(title, art_url="", album="Album"):
+    return {
+        "Metadata": Variant("a{sv}", {
+            "xesam:title": Variant("s", title),
+            "xesam:album": Variant("s", album),
+            "mpris:artUrl": Variant("s", art_url),
+        }),
+    }
+
+
+def test_signal_bursts_are_drawn_once(signaled):
+    signaled.on_player_properties(PLAYER, metadata("First"))
+    signaled.on_player_properties(PLAYER, {"PlaybackStatus": Variant("s", "Playing")})
+    signaled.on_player_seeked(PLAYER, 1000000)
+
+    assert [timer.delay for timer in signaled.timers] == [0.05]
+    signaled.update.assert_not_called()
+
+    signaled.timers[0].fire()
+    signaled.update.assert_called_once()
+
+    # next burst waits for signals to settle again
+    signaled.on_player_seeked(PLAYER, 2000000)
+    assert len(signaled.timers) == 2
+
+
+def test_signals_are_drawn_right_away_without_debounce(signaled):
+    signaled.signal_debounce = 0
+
+    signaled.on_player_properties(PLAYER, metadata("First"))
+    signaled.on_player_seeked(PLAYER, 1000000)
+
+    assert signaled.timers == []
+    assert signaled.update.call_count == 2
+
+
+def test_metadata_is_applied_as_a_diff(signaled, monkeypatch):
+    signaled.show_album_art = True
+    fetch = mock.Mock()
+    monkeypatch.setattr(generic_player.asyncio, "create_task", fetch)
+
+    signaled.on_player_properties(PLAYER, metadata("First", "file:///art.png"))
+    assert sorted(signaled.escaped) == ["Album", "First", "file:///art.png"]
+    assert fetch.call_count == 1
+    fetch.call_args.args[0].close()
+
+    # only changed values are escaped, and art is fetched again only for a new url
+    signaled.on_player_properties(PLAYER, metadata("Second", "file:///art.png"))
+    assert sorted(signaled.escaped[3:]) == ["Second"]
+    assert fetch.call_count == 1
+
+    # same metadata again, nothing changes
+    signaled.timers = []
+    signaled.on_player_properties(PLAYER, metadata("Second", "file:///art.png"))
+    assert len(signaled.escaped) == 4
+    assert signaled.timers == []
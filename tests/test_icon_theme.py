@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+import pytest
+
+from qtile_progress_widgets.icon_theme import IconTheme
+
+
+INDEX = """\
+[Icon Theme]
+Name=Test
+Directories=16x16/apps,48x48/apps
+
+[16x16/apps]
+Size=16
+
+[48x48/apps]
+Size=48
+"""
+
+
+def install_theme(base, name="test"):
+    theme = base / name
+    for subdir in ("16x16/apps", "48x48/apps"):
+        (theme / subdir).mkdir(parents=True)
+    (theme / "index.theme").write_text(INDEX)
+    return theme
+
+
+@pytest.fixture
+def icons(tmp_path):
+    return tmp_path / "icons"
+
+
+async def resolve_checked(theme, name, size=48):
+    # check_interval is 0, so this starts a check while serving the current index
+    await theme.resolve(name, size)
+    await theme._scan_task
+    return await theme.resolve(name, size)
+
+
+def test_resolves_closest_size(icons):
+    theme_dir = install_theme(icons)
+    (theme_dir / "16x16/apps/app.png").touch()
+    (theme_dir / "48x48/apps/app.png").touch()
+    (theme_dir / "16x16/apps/small.png").touch()
+    theme = IconTheme(name="test", base_dirs=[str(icons)])
+
+    async def main():
+        return await theme.resolve("app", 48), await theme.resolve("small", 48), await theme.resolve("none")
+
+    app, small, missing = asyncio.run(main())
+
+    assert app == str(theme_dir / "48x48/apps/app.png")
+    assert small == str(theme_dir / "16x16/apps/small.png")
+    assert missing is None
+    assert theme.themes == ["test"]
+
+
+def test_theme_installed_later_is_indexed(icons):
+    theme = IconTheme(name="test", base_dirs=[str(icons)], check_interval=0)
+
+    async def main():
+        assert await theme.resolve("app") is None
+
+        theme_dir = install_theme(icons)
+        (theme_dir / "48x48/apps/app.png").touch()
+        return await resolve_checked(theme, "app")
+
+    assert asyncio.run(main()) == str(icons / "test/48x48/apps/app.png")
+
+
+def test_index_is_rebuilt_when_a_directory_changes(icons):
+    theme_dir = install_theme(icons)
+    theme = IconTheme(name="test", base_dirs=[str(icons)], check_interval=0)
+
+    async def main():
+        assert await theme.resolve("app") is None
+
+        (theme_dir / "48x48/apps/app.png").touch()
+        # mtime granularity might hide a change made right after the scan
+        os.utime(theme_dir / "48x48/apps", (0, 0))
+        return await resolve_checked(theme, "app")
+
+    assert asyncio.run(main()) == str(theme_dir / "48x48/apps/app.png")
+
+
+def test_empty_index_is_outdated(icons):
+    theme = IconTheme(name="test", base_dirs=[str(icons)])
+
+    assert theme._is_outdated()
@@ -0,0 +1,220 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from qtile_progress_widgets import images
+from qtile_progress_widgets.images import ImageLoader
+
+
+class ImageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ImageHandler)
+        # requests are answered once released
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    def url(self, path):
+        return "http://127.0.0.1:%d/%s" % (self.server_address[1], path)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+
+        try:
+            server.release.wait(5)
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ImageServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def loader(monkeypatch, tmp_path):
+    # decoding needs cairo, images are the fetched bytes instead
+    monkeypatch.setattr(
+        ImageLoader, "_decode", staticmethod(lambda data, width, height, shrink_only: SimpleNamespace(data=data))
+    )
+    return ImageLoader(concurrency=2, timeout=2, cache_dir=str(tmp_path / "cache"))
+
+
+async def wait_for(predicate):
+    for _ in range(200):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_concurrent_loads_share_one_request(server, loader):
+    url = server.url("icon.png")
+
+    async def main():
+        loads = [asyncio.ensure_future(loader.load(url, width=32)) for _ in range(3)]
+        await wait_for(lambda: server.requests)
+        server.release.set()
+        return await asyncio.gather(*loads)
+
+    first, second, third = asyncio.run(main())
+
+    assert first is second is third
+    assert first.data == b"/icon.png"
+    assert server.requests == ["/icon.png"]
+    assert loader.info() == dict(size=1, max_size=128, hits=0, misses=1, pending=0)
+
+    # loaded already, no request is sent
+    assert asyncio.run(loader.load(url, width=32)) is first
+    assert server.requests == ["/icon.png"]
+    assert loader.hits == 1
+
+
+def test_cancelling_first_caller_keeps_the_load(server, loader):
+    url = server.url("icon.png")
+
+    async def main():
+        first = asyncio.ensure_future(loader.load(url))
+        second = asyncio.ensure_future(loader.load(url))
+        await wait_for(lambda: server.requests)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        server.release.set()
+
+        img = await second
+        assert first.cancelled()
+        return img
+
+    img = asyncio.run(main())
+
+    assert img.data == b"/icon.png"
+    assert server.requests == ["/icon.png"]
+    assert loader.get_cached(url) is img
+
+
+def test_concurrency_is_bounded(server, loader):
+    async def main():
+        loads = [asyncio.ensure_future(loader.load(server.url("icon%d.png" % i))) for i in range(5)]
+        await wait_for(lambda: len(server.requests) == 2)
+        # the rest waits for a slot
+        await asyncio.sleep(0.1)
+        assert len(server.requests) == 2
+
+        server.release.set()
+        return await asyncio.gather(*loads)
+
+    loaded = asyncio.run(main())
+
+    assert [img.data for img in loaded] == [b"/icon%d.png" % i for i in range(5)]
+    assert server.max_active == 2
+
+
+def test_remote_load_times_out(server, loader):
+    loader.timeout = 0.2
+
+    async def main():
+        with pytest.raises(requests.exceptions.Timeout):
+            await loader.load(server.url("slow.png"))
+
+    asyncio.run(main())
+
+    assert loader.info()["pending"] == 0
+    assert loader.get_cached(server.url("slow.png")) is None
+
+
+def test_disk_cache_is_reused_by_next_loader(server, loader, tmp_path):
+    url = server.url("icon.png")
+    server.release.set()
+
+    img = asyncio.run(loader.load(url, disk_cache=True))
+    assert img.data == b"/icon.png"
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    # nothing in memory, read back from disk
+    other = ImageLoader(cache_dir=loader.cache_dir)
+    img = asyncio.run(other.load(url, disk_cache=True))
+
+    assert img.data == b"/icon.png"
+    assert server.requests == ["/icon.png"]
+
+
+def make_pixbuf(w, h, pixel, padding=0):
+    channels = len(pixel)
+    stride = w * channels + padding
+    row = bytes(pixel) * w + b"\0" * padding
+    # last row is not padded
+    data = row * (h - 1) + bytes(pixel) * w
+    return w, h, stride, channels == 4, channels, data
+
+
+def argb32(pixel):
+    return [pixel[channel] for channel in images._ARGB32_ORDER]
+
+
+@pytest.fixture(params=["numpy", "pil"])
+def to_argb32(request):
+    if request.param == "numpy":
+        np = pytest.importorskip("numpy")
+        return lambda *args: images._pixbuf_to_argb32_numpy(np, *args)
+    pytest.importorskip("PIL")
+    return images._pixbuf_to_argb32_pil
+
+
+def test_pixbuf_alpha_is_premultiplied(to_argb32):
+    w, h, argb = to_argb32(*make_pixbuf(2, 2, (200, 100, 50, 128), padding=4), None)
+
+    assert (w, h) == (2, 2)
+    assert list(bytes(argb))[:4] == argb32((100, 50, 25, 128))
+    assert len(bytes(argb)) == 2 * 2 * 4
+
+
+def test_pixbuf_without_alpha_is_opaque(to_argb32):
+    w, h, argb = to_argb32(*make_pixbuf(3, 1, (10, 20, 30), padding=3), None)
+
+    assert (w, h) == (3, 1)
+    assert list(bytes(argb)) == argb32((10, 20, 30, 255)) * 3
+
+
+def test_pixbuf_is_shrunk_to_width(to_argb32):
+    w, h, argb = to_argb32(*make_pixbuf(64, 32, (0, 0, 255, 255)), 16)
+
+    assert (w, h) == (16, 8)
+    assert list(bytes(argb))[:4] == argb32((0, 0, 255, 255))
+
+
+def test_truncated_pixbuf_is_rejected():
+    np = pytest.importorskip("numpy")
+    w, h, stride, has_alpha, channels, data = make_pixbuf(2, 2, (0, 0, 0, 0))
+
+    with pytest.raises(ValueError):
+        images._pixbuf_to_argb32_numpy(np, w, h, stride, has_alpha, channels, data[:-1], None)
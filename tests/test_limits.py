@@ -0,0 +1,58 @@
+from bisect import bisect_left
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import limits
+from qtile_progress_widgets.limits import LimitsIndex
+
+
+@pytest.fixture
+def logger(monkeypatch):
+    logger = mock.Mock()
+    monkeypatch.setattr(limits, "_logger", logger)
+    return logger
+
+
+def test_nested_range_overlaps_wider_one(logger):
+    index = LimitsIndex([((0, 100), "wide"), ((10, 20), "nested"), ((30, 40), "also nested")])
+
+    assert logger.warning.call_count == 2
+    assert logger.warning.call_args_list[0].args[2:] == ((0, 100), (10, 20))
+    assert logger.warning.call_args_list[1].args[2:] == ((0, 100), (30, 40))
+    # nothing is missing between nested ranges, as the wider one covers them
+    logger.debug.assert_not_called()
+
+    assert index.lookup(15) == "wide"
+    assert index.lookup(25) == "wide"
+
+
+def test_gap_after_nested_range(logger):
+    LimitsIndex([((0, 50), "low"), ((10, 20), "nested"), ((60, 100), "high")])
+
+    logger.debug.assert_called_once()
+    assert logger.debug.call_args.args[2:] == (50, 60)
+
+
+def test_shared_boundaries(logger):
+    index = LimitsIndex([((0, 50), "low"), ((50, 100), "high")])
+
+    logger.warning.assert_not_called()
+    logger.debug.assert_not_called()
+    assert index.lookup(50) == "low"
+    assert index.lookup(50.5) == "high"
+
+
+def test_classes_match_lookup_of_float_values():
+    index = LimitsIndex([((0, 49.5), "low"), ((49.5, 75), "mid"), ((80, 100), "high")])
+    values, points, point_ids, between_ids = index.classes()
+
+    for value in (-5, 0, 10.2, 49.4, 49.5, 49.6, 75, 77.7, 80, 100, 120):
+        i = bisect_left(points, value)
+        if i < len(points) and points[i] == value:
+            class_id = point_ids[i]
+        elif 0 < i < len(points):
+            class_id = between_ids[i - 1]
+        else:
+            class_id = 0
+        assert values[class_id] == index.lookup(value)
@@ -0,0 +1,178 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from dbus_next import Variant
+import pytest
+
+from qtile_progress_widgets import mpris
+from qtile_progress_widgets.mpris import PlayerRegistry
+from qtile_progress_widgets.session_bus import SessionBus
+
+
+PLAYER = "org.mpris.MediaPlayer2.fake"
+
+
+class Listener:
+    def __init__(self):
+        self.events = []
+
+    def on_player_properties(self, name, updated):
+        self.events.append((name, "properties", {key: value.value for key, value in updated.items()}))
+
+    def on_player_seeked(self, name, position):
+        self.events.append((name, "seeked", position))
+
+    def on_player_owner_changed(self, name, running):
+        self.events.append((name, "running", running))
+
+
+@pytest.fixture
+def registry(mpris_service, monkeypatch):
+    monkeypatch.setattr(mpris, "session_bus", SessionBus(reconnect_delay=0.05))
+    return PlayerRegistry()
+
+
+async def wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+def test_players_are_discovered_and_followed(registry, private_bus, mpris_service):
+    private_bus.start()
+    listener = Listener()
+
+    async def main():
+        bus, _ = await mpris_service(PLAYER)
+        await registry.subscribe(listener)
+        # discovered along with its status
+        assert registry.is_running(PLAYER)
+        assert registry.players[PLAYER].status == "Playing"
+
+        other, player = await mpris_service(PLAYER + ".other")
+        await wait_for(lambda: registry.is_running(PLAYER + ".other"))
+        player.change(status="Paused")
+        await wait_for(lambda: registry.players[PLAYER + ".other"].status == "Paused")
+        assert registry.get_most_active() == PLAYER
+
+        other.disconnect()
+        await wait_for(lambda: not registry.is_running(PLAYER + ".other"))
+        bus.disconnect()
+        await wait_for(lambda: not registry.players)
+        mpris.session_bus.bus.disconnect()
+
+    asyncio.run(main())
+
+    assert [event for event in listener.events if event[1] == "running"] == [
+        (PLAYER, "running", True),
+        (PLAYER + ".other", "running", True),
+        (PLAYER + ".other", "running", False),
+        (PLAYER, "running", False),
+    ]
+    assert (PLAYER + ".other", "properties", {"PlaybackStatus": "Paused"}) in listener.events
+
+
+def test_signals_reach_every_name_of_a_connection(registry, private_bus, mpris_service):
+    private_bus.start()
+    instance = PLAYER + ".instance1234"
+    listener, instance_listener = Listener(), Listener()
+
+    async def main():
+        bus, player = await mpris_service(PLAYER, instance)
+        await registry.subscribe(listener, PLAYER)
+        await registry.subscribe(instance_listener, instance)
+        assert registry._owners == {bus.unique_name: {PLAYER, instance}}
+
+        player.change(status="Paused")
+        player.Seeked(1000000)
+        await wait_for(lambda: len(listener.events) == 3 and len(instance_listener.events) == 2)
+
+        # name released, connection keeps the other one
+        await bus.release_name(PLAYER)
+        await wait_for(lambda: not registry.is_running(PLAYER))
+        player.change(status="Playing")
+        await wait_for(lambda: len(instance_listener.events) == 3)
+
+        bus.disconnect()
+        await wait_for(lambda: not registry.players)
+        assert registry._owners == {}
+        mpris.session_bus.bus.disconnect()
+
+    asyncio.run(main())
+
+    assert listener.events == [
+        (PLAYER, "running", True),
+        (PLAYER, "properties", {"PlaybackStatus": "Paused"}),
+        (PLAYER, "seeked", 1000000),
+        (PLAYER, "running", False),
+    ]
+    assert instance_listener.events == [
+        (instance, "properties", {"PlaybackStatus": "Paused"}),
+        (instance, "seeked", 1000000),
+        (instance, "properties", {"PlaybackStatus": "Playing"}),
+        (instance, "running", False),
+    ]
+
+
+def signal(sender, *body):
+    return SimpleNamespace(sender=sender, body=list(body))
+
+
+def test_signals_are_dispatched_to_listeners_of_their_player(monkeypatch):
+    registry = PlayerRegistry()
+    monkeypatch.setattr(registry, "_fetch_status", mock.AsyncMock())
+    every, spotify, vlc = Listener(), Listener(), Listener()
+    registry._listeners = [(every, None), (spotify, PLAYER + ".spotify"), (vlc, PLAYER + ".vlc")]
+
+    async def main():
+        registry._on_name_owner_changed(signal("org.freedesktop.DBus", PLAYER + ".spotify", "", ":1.1"))
+        registry._on_name_owner_changed(signal("org.freedesktop.DBus", PLAYER + ".vlc", "", ":1.2"))
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert registry._fetch_status.call_count == 2
+
+    registry._on_properties_changed(signal(":1.1", mpris.PLAYER_INTERFACE, {"Rate": Variant("d", 2.0)}, []))
+    registry._on_seeked(signal(":1.2", 1000))
+    # not a player
+    registry._on_seeked(signal(":1.3", 2000))
+    registry._on_name_owner_changed(signal("org.freedesktop.DBus", PLAYER + ".vlc", ":1.2", ""))
+
+    assert spotify.events == [
+        (PLAYER + ".spotify", "running", True),
+        (PLAYER + ".spotify", "properties", {"Rate": 2.0}),
+    ]
+    assert vlc.events == [
+        (PLAYER + ".vlc", "running", True),
+        (PLAYER + ".vlc", "seeked", 1000),
+        (PLAYER + ".vlc", "running", False),
+    ]
+    assert every.events == [
+        spotify.events[0], vlc.events[0], spotify.events[1], vlc.events[1], vlc.events[2],
+    ]
+
+    registry.unsubscribe(every)
+    registry._on_seeked(signal(":1.1", 3000))
+    assert len(every.events) == 5
+    assert spotify.events[-1] == (PLAYER + ".spotify", "seeked", 3000)
+
+
+def test_most_active_player_ranking():
+    registry = PlayerRegistry()
+    assert registry.get_most_active() is None
+
+    for owner, name in enumerate(["spotify", "vlc.instance1234", "mpv"]):
+        registry._add("%s.%s" % (mpris.MPRIS_NAMESPACE, name), ":1.%d" % owner)
+    states = {mpris.get_short_name(name): state for name, state in registry.players.items()}
+
+    # most recent activity, when none is playing
+    states["mpv"].active_at += 10
+    assert registry.get_most_active() == mpris.MPRIS_NAMESPACE + ".mpv"
+    # then priority, matching instances by their prefix
+    assert registry.get_most_active(["vlc", "spotify"]) == mpris.MPRIS_NAMESPACE + ".vlc.instance1234"
+    # playing ones always come first
+    states["spotify"].status = "Playing"
+    assert registry.get_most_active(["vlc"]) == mpris.MPRIS_NAMESPACE + ".spotify"
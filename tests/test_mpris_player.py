@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from dbus_next import Variant
+import pytest
+
+from qtile_progress_widgets import mpris_player
+from qtile_progress_widgets.mpris import MPRIS_NAMESPACE, PLAYER_INTERFACE, PlayerRegistry
+from qtile_progress_widgets.mpris_player import MprisPlayer
+
+
+SPOTIFY = MPRIS_NAMESPACE + ".spotify"
+VLC = MPRIS_NAMESPACE + ".vlc"
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = PlayerRegistry()
+    monkeypatch.setattr(mpris_player, "mpris_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def widget(registry):
+    widget = MprisPlayer(player_priority=["vlc"], update_interval=1)
+    widget.configured = True
+    registry._listeners.append((widget, None))
+    return widget
+
+
+def test_widget_follows_most_active_player(registry, widget):
+    registry._add(SPOTIFY, ":1.1")
+    assert widget.mpris_player == SPOTIFY
+    assert widget._active
+
+    # same status, priority wins
+    registry._add(VLC, ":1.2")
+    assert widget.mpris_player == VLC
+
+    # playing players come first
+    registry._on_properties_changed(SimpleNamespace(
+        sender=":1.1", body=[PLAYER_INTERFACE, {"PlaybackStatus": Variant("s", "Playing")}, []]
+    ))
+    assert widget.mpris_player == SPOTIFY
+    # state of previous player is not kept
+    assert widget.playback_status == "Stopped"
+    assert not widget.metadata
+
+    registry._remove(SPOTIFY)
+    assert widget.mpris_player == VLC
+
+    registry._remove(VLC)
+    assert widget.mpris_player is None
+    assert not widget._active
+
+
+def test_signals_of_other_players_are_ignored(registry, widget):
+    registry._add(VLC, ":1.2")
+    registry._add(SPOTIFY, ":1.1")
+    assert widget.mpris_player == VLC
+
+    registry._on_seeked(SimpleNamespace(sender=":1.1", body=[30000000]))
+    registry._on_properties_changed(SimpleNamespace(
+        sender=":1.1", body=[PLAYER_INTERFACE, {"Rate": Variant("d", 2.0)}, []]
+    ))
+
+    assert widget.mpris_player == VLC
+    assert widget.playback_position == 0
+    assert widget.playback_rate == 1.0
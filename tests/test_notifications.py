@@ -0,0 +1,250 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets.notification_popup import PopupPool
+from qtile_progress_widgets.notifications import Notifications
+
+
+class FakePopup:
+    closing = False
+
+    def __init__(self, notification):
+        self.id = notification.id
+        self.key = (notification.app_name, notification.summary, notification.body)
+        self.count = 1
+        self.coalesced_ids = []
+        self.last_seen = time.monotonic()
+
+    def coalesce(self, notification, count_fmt):
+        self.count += 1
+        self.coalesced_ids.append(notification.id)
+        self.last_seen = time.monotonic()
+
+    def has_id(self, nid):
+        return nid == self.id or nid in self.coalesced_ids
+
+    def is_replaced_by(self, notification):
+        return self.has_id(notification.replaces_id)
+
+
+@pytest.fixture
+def widget(monkeypatch):
+    widget = Notifications(notif_center_enabled=False)
+    widget._popup_config = {}
+
+    async def load_notification(notification, hints, config, with_icon):
+        # icons take a while to load, letting the rest of the burst arrive meanwhile
+        await asyncio.sleep(0.01)
+
+    def display(notification, config):
+        widget.displaying.insert(0, FakePopup(notification))
+        return widget.displaying[0]
+
+    monkeypatch.setattr(widget, "_load_notification", load_notification)
+    monkeypatch.setattr(widget, "_display", display)
+    monkeypatch.setattr(widget, "update", lambda: None)
+    return widget
+
+
+def create_notification(nid, summary="Build finished", app_name="ci"):
+    return SimpleNamespace(
+        id=nid, summary=summary, body="All jobs passed", app_name=app_name, app_icon="", hints={}, timeout=-1,
+        replaces_id=0,
+    )
+
+
+async def queue_burst(widget, notifications):
+    await asyncio.gather(*(widget._queue_notification(n) for n in notifications))
+    # coalesced notifications re-queued on their own, if any
+    await asyncio.sleep(0.05)
+
+
+def test_concurrent_identical_notifications_share_a_popup(widget):
+    asyncio.run(queue_burst(widget, [create_notification(nid) for nid in range(1, 11)]))
+
+    assert len(widget.displaying) == 1
+    assert widget.displaying[0].count == 10
+    assert widget.displaying[0].coalesced_ids == list(range(2, 11))
+    assert widget.coalesced == 9
+    assert not widget._loading
+
+
+def test_concurrent_notifications_are_rate_limited(widget):
+    widget.coalesce_window = 0
+    widget.app_rate_limit = 3
+    notifications = [create_notification(nid, summary="Job %s failed" % nid) for nid in range(1, 11)]
+
+    stored = []
+    widget._store_without_popup = lambda notification, config, reason: stored.append(notification.id)
+    asyncio.run(queue_burst(widget, notifications))
+
+    assert [popup.id for popup in widget.displaying] == [3, 2, 1]
+    assert stored == list(range(4, 11))
+    assert widget.rate_limited == 7
+
+
+def test_notification_replaced_while_loading(widget):
+    first = create_notification(1)
+    replacement = create_notification(1, summary="Build failed")
+    replacement.replaces_id = 1
+
+    asyncio.run(queue_burst(widget, [first, replacement]))
+
+    assert [popup.key[1] for popup in widget.displaying] == ["Build failed"]
+
+
+def test_popup_config_keeps_fontsize():
+    widget = Notifications(notif_center_enabled=False, fontsize=12, popup_fontsize=18)
+    widget._prepare_popup_config()
+    assert widget._popup_config["fontsize"] == 18
+    assert "font_size" not in widget._popup_config
+
+    # falls back to widget's font size
+    widget = Notifications(notif_center_enabled=False, fontsize=12)
+    widget._prepare_popup_config()
+    assert widget._popup_config["fontsize"] == 12
+
+
+def test_pooled_popup_is_reconfigured_with_fontsize():
+    popup = mock.MagicMock(fontsize=14)
+
+    PopupPool._reconfigure(popup, {"fontsize": 20, "opacity": 0.8})
+
+    assert popup.layout.font_size == 20
+    assert popup.win.opacity == 0.8
+
+
+class StackedPopup:
+    def __init__(self, height=50, width=300):
+        self.height = height
+        self.width = width
+        self.stack_offset = 0
+        self.shown = []
+
+    def show(self, x, y):
+        self.shown.append((x, y))
+
+
+@pytest.fixture
+def stacked(widget):
+    evaluated = []
+
+    def pos_x(qtile, bar, popup):
+        evaluated.append(bar.screen.width)
+        return bar.screen.width - popup.width
+
+    widget.qtile = None
+    widget.bar = SimpleNamespace(screen=SimpleNamespace(x=0, y=0, width=1920, height=1080), height=24)
+    widget.popup_pos_x = pos_x
+    widget.popup_pos_y = 30
+    widget.popup_margin = 10
+    widget.evaluated = evaluated
+    return widget
+
+
+def test_anchor_is_evaluated_once_per_geometry(stacked):
+    popup = StackedPopup()
+
+    assert stacked._get_anchor(popup) == (1620, 30)
+    assert stacked._get_anchor(popup) == (1620, 30)
+    assert stacked.evaluated == [1920]
+
+    stacked._stack_dirty = 1
+    stacked.bar.screen.width = 1280
+    assert stacked._get_anchor(popup) == (980, 30)
+    assert stacked.evaluated == [1920, 1280]
+    # every popup is placed again on the new screen
+    assert stacked._stack_dirty == 0
+
+
+def test_only_popups_below_a_change_are_placed_again(stacked):
+    first, second = StackedPopup(), StackedPopup()
+    stacked.displaying = [first, second]
+    stacked._layout_stack()
+    assert first.shown == [(1620, 30)]
+    assert second.shown == [(1620, 90)]
+
+    # newest popup is displayed on top, pushing the rest down
+    newest = StackedPopup(height=20)
+    stacked.displaying.insert(0, newest)
+    stacked._stack_dirty = 0
+    stacked._layout_stack()
+    assert newest.shown == [(1620, 30)]
+    assert first.shown[-1] == (1620, 60)
+
+    # a removed popup only moves the ones below it
+    stacked.displaying.remove(first)
+    stacked._stack_dirty = 1
+    stacked._layout_stack()
+    assert len(newest.shown) == 1
+    assert second.shown[-1] == (1620, 60)
+
+    # nothing changed, nothing placed
+    stacked._layout_stack()
+    assert len(second.shown) == 3
+    assert stacked.evaluated == [1920]
+
+
+def test_identical_notifications_coalesce_while_pending(widget, monkeypatch):
+    widget.max_visible_notifications = 1
+    loads = []
+    load_notification = widget._load_notification
+
+    async def count_loads(notification, hints, config, with_icon):
+        loads.append(notification.id)
+        await load_notification(notification, hints, config, with_icon)
+
+    monkeypatch.setattr(widget, "_load_notification", count_loads)
+
+    async def main():
+        await queue_burst(widget, [create_notification(1, summary="Disk almost full")])
+        # a burst arriving while the only slot is taken
+        await queue_burst(widget, [create_notification(nid) for nid in range(2, 7)])
+        # and one more after the burst was queued
+        await queue_burst(widget, [create_notification(7)])
+
+    asyncio.run(main())
+
+    assert loads == [1, 2]
+    assert len(widget._pending) == 1
+    assert [n.id for n in widget._pending[0].followers] == [3, 4, 5, 6, 7]
+    assert widget.coalesced == 5
+
+    # room is made, pending notification is displayed with its followers
+    widget.displaying = []
+    widget._display_pending()
+
+    assert widget.displaying[0].id == 2
+    assert widget.displaying[0].count == 6
+    assert widget.coalesced == 5
+
+
+def test_closing_pending_notification_admits_its_followers(widget):
+    widget.max_visible_notifications = 1
+
+    async def main():
+        await queue_burst(widget, [create_notification(1, summary="Disk almost full")])
+        await queue_burst(widget, [create_notification(nid) for nid in range(2, 5)])
+
+        widget._on_notification_close(2)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+
+    assert len(widget._pending) == 1
+    assert widget._pending[0].notification.id == 3
+    assert [n.id for n in widget._pending[0].followers] == [4]
+
+
+def test_counter_shows_stored_or_unread_notifications(widget):
+    widget.notif_center_enabled = True
+    widget.center = SimpleNamespace(unread=2, history=[object()] * 5)
+
+    assert widget.get_text() == 5
+
+    widget.counter = "unread"
+    assert widget.get_text() == 2
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import notifications_center
+from qtile_progress_widgets.notification_popup import NotificationInfo
+from qtile_progress_widgets.notifications_center import NotificationsCenter, NotificationsHistory
+
+
+@pytest.fixture
+def center(monkeypatch):
+    monkeypatch.setattr(notifications_center, "Popup", mock.MagicMock())
+    center = NotificationsCenter(mock.Mock(), 0, 0, 200, 600, {})
+    monkeypatch.setattr(center, "draw", lambda: None)
+
+    now = time.time()
+    for nid, app_name in enumerate(["ci", "mail", "ci", "chat"], 1):
+        center.store_notification(NotificationInfo(nid, now, "content", None, app_name, "summary", "body"))
+
+    return center
+
+
+def test_filter_is_reset_when_hidden(center):
+    center.set_filter(app="ci")
+    center.show()
+    assert center._get_rows_count() == 2
+
+    center.hide()
+    center.show()
+
+    assert center.filtered is None
+    assert center._get_rows_count() == 4
+
+
+def create_info(nid, summary="summary", app_name="ci", created_at=None):
+    return NotificationInfo(nid, created_at or time.time(), "content", None, app_name, summary, "body")
+
+
+def test_history_burst_is_written_in_one_batch(tmp_path, monkeypatch):
+    path = str(tmp_path / "history" / "notifications.jsonl")
+    history = NotificationsHistory(10, path)
+    write = mock.Mock(wraps=history._write)
+    monkeypatch.setattr(history, "_write", write)
+
+    async def main():
+        for nid in range(1, 6):
+            history.append(create_info(nid))
+        # nothing is written on the event loop
+        assert write.call_count == 0
+        await history.close()
+
+    asyncio.run(main())
+
+    assert write.call_count == 1
+    assert len(open(path).readlines()) == 5
+
+
+def test_history_keeps_entries_appended_while_loading(tmp_path):
+    path = str(tmp_path / "notifications.jsonl")
+
+    async def main():
+        history = NotificationsHistory(10, path)
+        history.append(create_info(1))
+        history.append(create_info(2))
+        await history.close()
+
+        # restarted, a notification arrives before the log is read
+        history = NotificationsHistory(10, path)
+        history.append(create_info(3))
+        assert [info.id for info in history.newest()] == [3]
+
+        await history.load()
+        assert [info.id for info in history.newest()] == [3, 2, 1]
+        await history.close()
+
+    asyncio.run(main())
+
+    assert len(open(path).readlines()) == 3
+
+
+def test_history_log_is_compacted(tmp_path):
+    path = str(tmp_path / "notifications.jsonl")
+
+    async def main():
+        history = NotificationsHistory(3, path)
+        for nid in range(1, 8):
+            history.append(create_info(nid))
+            # one batch each
+            await history.close()
+        return history
+
+    history = asyncio.run(main())
+
+    assert [json.loads(line)["id"] for line in open(path)] == [5, 6, 7]
+    assert history._logged == 3
+
+
+def test_search_matches_word_prefixes():
+    history = NotificationsHistory(10)
+    history.append(create_info(1, summary="Build finished", app_name="ci"))
+    history.append(create_info(2, summary="Building docs", app_name="ci"))
+    history.append(create_info(3, summary="New message from Ana", app_name="mail"))
+
+    assert [info.id for info in history.search("buil")] == [2, 1]
+    assert [info.id for info in history.search("build fin")] == [1]
+    assert [info.id for info in history.search("mail")] == [3]
+    assert [info.id for info in history.search("bu", app="mail")] == []
+    assert history.search("missing") == []
+
+
+def test_search_skips_evicted_entries_and_index_is_rebuilt():
+    history = NotificationsHistory(10)
+    for nid in range(1, 201):
+        history.append(create_info(nid, summary="job %d" % nid if nid % 2 else "build %d" % nid))
+
+    assert [info.id for info in history.search("job")] == [199, 197, 195, 193, 191]
+    assert [info.id for info in history.search("build", limit=2)] == [200, 198]
+    # stale postings are dropped once they add up
+    index = history._index
+    assert len(index.entries) == 10
+    assert len(index._seqs) <= 10 + max(10, 64)
+    assert "1" not in index._tokens
+
+
+def test_search_within_time_range():
+    history = NotificationsHistory(10)
+    for nid, created_at in enumerate([100, 200, 300, 400], 1):
+        history.append(create_info(nid, created_at=created_at))
+
+    assert [info.id for info in history.search(since=200, until=300)] == [3, 2]
+    assert [info.id for info in history.search(since=250)] == [4, 3]
+    assert [info.id for info in history.search(until=100)] == [1]
+    assert [info.id for info in history.search(since=time.time() - 60)] == []
+    assert [info.id for info in history.search("summary", since="1h")] == []
+
+
+def test_search_by_urgency(center):
+    history = NotificationsHistory(10)
+    info = create_info(1)
+    info.urgency = 2
+    history.append(info)
+    history.append(create_info(2))
+
+    assert [info.id for info in history.search(urgency="Critical")] == [1]
+    assert [info.id for info in history.search(urgency=1)] == [2]
+    with pytest.raises(ValueError, match="Invalid urgency: 'urgent'"):
+        history.search(urgency="urgent")
+
+    # an invalid filter keeps the current one
+    center.set_filter(app="ci")
+    with pytest.raises(ValueError):
+        center.set_filter(urgency="urgent")
+    assert center._filter == dict(query="", app="ci", urgency=None, since=None, until=None)
+    assert len(center.filtered) == 2
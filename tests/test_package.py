@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import pytest
+
+import qtile_progress_widgets
+from qtile_progress_widgets import limits
+
+
+def test_import_loads_no_widget():
+    # fresh interpreter, as other tests import widgets already
+    modules = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys; import qtile_progress_widgets; print(' '.join(sorted(sys.modules)))",
+    ]).decode().split()
+
+    assert not [m for m in modules if m.startswith("qtile_progress_widgets.")]
+    assert "libqtile" not in modules
+
+
+def test_widget_is_imported_on_first_access(monkeypatch):
+    monkeypatch.setitem(qtile_progress_widgets._widgets, "LimitsIndex", ".limits")
+
+    try:
+        assert qtile_progress_widgets.LimitsIndex is limits.LimitsIndex
+        # cached, next accesses skip __getattr__
+        assert vars(qtile_progress_widgets)["LimitsIndex"] is limits.LimitsIndex
+    finally:
+        vars(qtile_progress_widgets).pop("LimitsIndex", None)
+
+
+def test_unknown_attribute():
+    with pytest.raises(AttributeError):
+        qtile_progress_widgets.Unknown
+
+
+def test_dir_lists_widgets():
+    assert {"Battery", "CPUCores", "Notifications", "Volume"} <= set(dir(qtile_progress_widgets))
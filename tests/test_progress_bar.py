@@ -0,0 +1,27 @@
+from unittest import mock
+
+from qtile_progress_widgets.progress_bar import _RingCache
+
+
+def test_ring_cache_renders_each_ring_once():
+    cache = _RingCache()
+    render = mock.Mock()
+
+    first = cache.get((10, "ffffff", "000000", None), render)
+    second = cache.get((10, "ffffff", "000000", None), render)
+
+    assert first is second
+    render.assert_called_once()
+    assert cache.info() == dict(size=1, max_size=256, hits=1, misses=1)
+
+
+def test_ring_cache_finishes_evicted_surfaces():
+    cache = _RingCache(max_size=1)
+    surfaces = [mock.Mock(), mock.Mock()]
+
+    cache.get(1, lambda: surfaces[0])
+    cache.get(2, lambda: surfaces[1])
+
+    surfaces[0].finish.assert_called_once()
+    surfaces[1].finish.assert_not_called()
+    assert cache.info()["size"] == 1
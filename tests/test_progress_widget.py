@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import progress_widget
+from qtile_progress_widgets.progress_widget import (
+    LayoutExtentsCache, ProgressCoreWidget, _LayoutHandler, _TextHandler,
+)
+
+
+@pytest.fixture
+def widget(monkeypatch):
+    widget = ProgressCoreWidget(progress_bar_active=False)
+    widget._frames = mock.Mock()
+
+    resolve = widget.resolve_elements
+    widget.resolves = 0
+
+    def counted_resolve():
+        widget.resolves += 1
+        return resolve()
+
+    monkeypatch.setattr(widget, "resolve_elements", counted_resolve)
+    return widget
+
+
+def test_update_draw_resolves_elements_once(widget):
+    widget.update_draw()
+
+    assert widget.resolves == 1
+    widget._frames.request.assert_called_once()
+
+
+def test_update_draw_skips_unchanged_output(widget):
+    widget.update_draw()
+    widget.update_draw()
+
+    # second update only resolves elements to compare them
+    assert widget.resolves == 2
+    widget._frames.request.assert_called_once()
+
+
+class SampledWidget(ProgressCoreWidget):
+    samples = 0
+
+    def get_source_key(self):
+        return "test:sampled"
+
+    def sample_data(self):
+        self.samples += 1
+        return 50
+
+    def on_source_data(self, data):
+        self.progress = data
+
+
+def test_finalized_widget_no_longer_samples_shared_source():
+    first, second = SampledWidget(update_interval=0), SampledWidget(update_interval=0)
+    for widget in (first, second):
+        widget.qtile = mock.Mock()
+        widget.drawer = mock.Mock()
+        widget.timer_setup()
+
+    assert first._source is second._source
+
+    first.finalize()
+    samples = first.samples
+    second.update()
+
+    assert first.samples == samples
+    assert second.samples == 1
+    assert second.progress == 50
+
+    second.finalize()
+
+
+class FakeLayout:
+    def __init__(self, text, colour, font, fontsize, fontshadow, markup=False, wrap=True):
+        self.text = text
+        self.colour = colour
+        self.wrap = wrap
+        self.fixed_width = None
+        self.measures = 0
+        self.sets = []
+
+    def __setattr__(self, key, value):
+        if key in ("text", "colour"):
+            self.__dict__.setdefault("sets", []).append(key)
+        if key == "width":
+            key = "fixed_width"
+        super().__setattr__(key, value)
+
+    @property
+    def width(self):
+        self.measures += 1
+        if self.fixed_width is not None:
+            return self.fixed_width
+        # wrapped text gets measured as if it was split in two lines
+        return len(self.text) * (5 if self.wrap else 10)
+
+    @property
+    def height(self):
+        return 10 if self.fixed_width is None else 20
+
+
+@pytest.fixture
+def extents(monkeypatch):
+    cache = LayoutExtentsCache()
+    monkeypatch.setattr(progress_widget, "layout_extents", cache)
+    return cache
+
+
+def create_handler(wrap=False):
+    widget = SimpleNamespace(
+        drawer=SimpleNamespace(textlayout=FakeLayout), font="sans", fontsize=12, fontshadow=None, markup=True,
+        wrap=wrap,
+    )
+    return _TextHandler(widget).configure()
+
+
+def test_identical_text_is_measured_once(extents):
+    first, second = create_handler(), create_handler()
+    first.layout.sets.clear()
+
+    first.update("Song title", "ffffff")
+    second.update("Song title", "ffffff")
+
+    assert (first.width, second.width) == (100, 100)
+    assert first.layout.measures + second.layout.measures == 1
+    assert extents.info() == dict(size=1, max_size=512, hits=1, misses=1)
+
+    # extents are kept until text changes, unchanged values are not set again
+    first.update("Song title", "ff0000")
+    assert (first.width, first.height) == (100, 10)
+    assert extents.misses == 1
+    assert first.layout.sets == ["text", "colour"]
+
+    first.update("Other", "ff0000")
+    assert first.width == 50
+    assert extents.misses == 2
+
+
+def test_extents_are_keyed_by_wrap_and_width(extents):
+    plain, wrapped, fixed = create_handler(), create_handler(wrap=True), create_handler()
+    for handler in (plain, wrapped, fixed):
+        handler.update("Song title", "ffffff")
+
+    # fixed width layouts wrap text over several lines
+    _LayoutHandler.update(fixed, dict(width=30))
+
+    assert [(h.width, h.height) for h in (plain, wrapped, fixed)] == [(100, 10), (50, 10), (30, 20)]
+    assert extents.misses == 3
+    assert plain.layout.measures + wrapped.layout.measures + fixed.layout.measures == 3
+
+
+def test_finalized_widget_is_not_drawn(widget):
+    scheduler = widget._frames
+    widget.drawer = mock.Mock()
+    widget.finalize()
+    scheduler.unsubscribe.assert_called_once_with(widget)
+
+    # late callbacks, e.g. signals or executor jobs, might still ask for a draw
+    widget.draw_call()
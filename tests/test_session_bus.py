@@ -0,0 +1,84 @@
+import asyncio
+
+from qtile_progress_widgets.session_bus import SessionBus
+
+
+async def wait_for(predicate, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+async def emit(address, member):
+    from dbus_next.aio import MessageBus
+    from dbus_next.message import Message
+
+    sender = await MessageBus(bus_address=address).connect()
+    await sender.send(Message.new_signal("/org/example/Test", "org.example.Test", member))
+    sender.disconnect()
+
+
+def test_rules_are_installed_once_the_bus_is_up(private_bus):
+    session_bus = SessionBus(reconnect_delay=0.05)
+    received = []
+
+    async def main():
+        await session_bus.add_match(lambda msg: received.append(msg.member), interface="org.example.Test")
+        assert session_bus.bus is None
+
+        # no further call is needed to connect
+        private_bus.start()
+        await wait_for(lambda: session_bus.bus is not None)
+
+        await emit(private_bus.address, "Ping")
+        await wait_for(lambda: received)
+        session_bus.bus.disconnect()
+
+    asyncio.run(main())
+
+    assert received == ["Ping"]
+
+
+def test_lost_connection_is_restored(private_bus):
+    session_bus = SessionBus(reconnect_delay=0.05)
+    received = []
+    private_bus.start()
+
+    async def main():
+        await session_bus.add_match(lambda msg: received.append(msg.member), interface="org.example.Test")
+        await emit(private_bus.address, "Ping")
+        await wait_for(lambda: received)
+        first = session_bus.bus
+
+        private_bus.stop()
+        await wait_for(lambda: session_bus.bus is None)
+        private_bus.start()
+        await wait_for(lambda: session_bus.bus is not None)
+        assert session_bus.bus is not first
+
+        await emit(private_bus.address, "Pong")
+        await wait_for(lambda: len(received) == 2)
+        session_bus.bus.disconnect()
+
+    asyncio.run(main())
+
+    assert received == ["Ping", "Pong"]
+
+
+def test_single_reconnect_task(private_bus):
+    session_bus = SessionBus(reconnect_delay=0.05)
+
+    async def main():
+        for member in ("Ping", "Pong", "Ping"):
+            await session_bus.add_match(lambda msg: None, interface="org.example.Test", member=member)
+        reconnecting = session_bus._reconnecting
+        await asyncio.sleep(0.2)
+
+        # failed retries do not start a task of their own
+        assert session_bus._reconnecting is reconnecting
+        assert not reconnecting.done()
+        reconnecting.cancel()
+
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import sources
+from qtile_progress_widgets.sources import DataSource
+
+
+class FakeView:
+    def __init__(self, name, update_interval=None):
+        self.name = name
+        self.update_interval = update_interval
+        self.qtile = mock.Mock()
+        self.received = []
+        self.unwatch = mock.Mock()
+
+    def sample_data(self):
+        return self.name
+
+    def watch_source(self, push):
+        return self.unwatch
+
+    def on_source_update(self, data):
+        self.received.append(data)
+
+
+@pytest.fixture
+def schedule(monkeypatch):
+    schedule = mock.Mock()
+    monkeypatch.setattr(sources.tick_clock, "schedule", schedule)
+    return schedule
+
+
+def test_source_samples_through_remaining_view(schedule):
+    first, second = FakeView("first"), FakeView("second")
+    source = sources.subscribe(first, "test", lambda: DataSource("test"))
+    sources.subscribe(second, "test", lambda: DataSource("test"))
+
+    source.unsubscribe(first)
+    source.refresh()
+
+    assert second.received == ["first", "second"]
+    # watch of the leaving view is stopped, and started again through the remaining one
+    first.unwatch.assert_called_once()
+    second.unwatch.assert_not_called()
+    assert source._unwatch is second.unwatch
+
+    source.unsubscribe(second)
+    second.unwatch.assert_called_once()
+    assert "test" not in sources.get_sources_info()
+
+
+def test_interval_is_recomputed_on_unsubscribe(schedule):
+    fast, slow = FakeView("fast", 1), FakeView("slow", 5)
+    source = DataSource("test")
+    source.subscribe(slow)
+    source.subscribe(fast)
+
+    assert source.interval == 1
+    assert schedule.call_args.args[1] == 1
+
+    source.unsubscribe(fast)
+
+    assert source.interval == 5
+    schedule.return_value.cancel.assert_called()
+    assert schedule.call_args.args[1] == 5
+
+
+def test_interval_is_computed_once_watching(schedule):
+    view = FakeView("unwatched", 60)
+
+    def watch_source(push):
+        # changes can't be watched, poll more often instead
+        view.update_interval = 10
+        return None
+
+    view.watch_source = watch_source
+    source = DataSource("test")
+    source.subscribe(view)
+
+    assert source.interval == 10
+    assert schedule.call_args.args[1] == 10
@@ -0,0 +1,64 @@
+import logging
+from unittest import mock
+
+import pytest
+
+from qtile_progress_widgets import utils
+from qtile_progress_widgets.utils import LazyMessage, create_logger, set_log_level
+
+
+@pytest.fixture
+def log_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, "_queue_handler", None)
+    monkeypatch.setattr(utils, "_listener", None)
+    monkeypatch.setattr(utils, "get_data_dir", lambda: str(tmp_path / "data"))
+    monkeypatch.setattr(utils.atexit, "register", mock.Mock())
+    yield tmp_path / "data"
+    # unless stopped already by the test
+    if utils._listener is not None and utils._listener._thread is not None:
+        utils._listener.stop()
+
+
+def test_listener_starts_with_first_record(log_dir):
+    logger = create_logger("TEST_FIRST_RECORD")
+
+    assert utils._listener is None
+    assert not log_dir.exists()
+
+    logger.info("first record")
+    assert utils._listener is not None
+    utils.atexit.register.assert_called_once_with(utils._listener.stop)
+
+    # stopping the listener writes every queued record
+    utils._listener.stop()
+    assert "[TEST_FIRST_RECORD][INFO]: first record" in (log_dir / "widgets.log").read_text()
+
+
+def test_loggers_share_queue_handler(log_dir):
+    first, second = create_logger("TEST_SHARED_FIRST"), create_logger("TEST_SHARED_SECOND")
+
+    assert first.handlers == second.handlers == [utils._get_queue_handler()]
+
+
+def test_disabled_levels_do_not_build_messages(log_dir):
+    logger = create_logger("TEST_LAZY_MESSAGE")
+    build = mock.Mock(return_value="built")
+
+    logger.debug("%s", LazyMessage(build))
+
+    build.assert_not_called()
+    assert utils._listener is None
+
+
+def test_set_log_level_updates_every_logger(log_dir):
+    logger = create_logger("TEST_LEVEL")
+
+    try:
+        assert set_log_level("debug") == "DEBUG"
+        assert logger.level == logging.DEBUG
+        assert create_logger("TEST_LEVEL_LATER").level == logging.DEBUG
+
+        with pytest.raises(ValueError):
+            set_log_level("verbose")
+    finally:
+        set_log_level(logging.INFO)